@@ -2,7 +2,7 @@ const Scan = require('../models/scan');
 const Plant = require('../models/plant');
 const mongoose = require('mongoose');
 const { uploadImage, generateThumbnail } = require('../services/imageService');
-const { processScanAsync, processScanAnalysis } = require('../services/scanAnalysisService');
+const { processScanAsync, processScanAnalysis, processScanBatch } = require('../services/scanAnalysisService');
 const mlService = require('../services/mlService');
 const asyncHandler = require('../utils/controllerWrapper');
 
@@ -124,6 +124,75 @@ exports.createScan = asyncHandler(async (req, res) => {
   });
 });
 
+// @desc    Create several scans of one plant from a multi-image upload
+// @route   POST /api/v1/scans/batch
+// @access  Private
+exports.createScanBatch = asyncHandler(async (req, res) => {
+  const { plant_id } = req.body;
+
+  const plant = await resolveUserPlant(plant_id, req.user.id, { fallbackToLatest: true });
+
+  if (!plant) {
+    return res.status(404).json({
+      success: false,
+      error: 'Plant not found. Please create a plant profile first.'
+    });
+  }
+
+  if (!req.files || req.files.length === 0) {
+    return res.status(400).json({
+      success: false,
+      error: 'Please upload at least one image'
+    });
+  }
+
+  // Create scan records (ML analysis is added as each result streams back)
+  const scans = [];
+  for (const file of req.files) {
+    const uploadResult = await uploadImage(file.buffer, 'aloe-vera-scans');
+    const thumbnailUrl = await generateThumbnail(uploadResult.public_id);
+
+    scans.push(await Scan.create({
+      plant_id: plant._id,
+      user_id: req.user.id,
+      image_data: {
+        original_url: uploadResult.secure_url,
+        thumbnail_url: thumbnailUrl,
+        file_size: file.size,
+        dimensions: {
+          width: uploadResult.width,
+          height: uploadResult.height
+        }
+      },
+      scan_metadata: {
+        device_type: req.headers['user-agent'],
+        app_version: req.body.app_version || '1.0.0'
+      }
+    }));
+  }
+
+  // Update plant's last scan date
+  plant.current_status.last_scan_date = new Date();
+  await plant.save();
+
+  // One streamed ML request for the whole batch; each scan is saved as its result arrives
+  processScanBatch(
+    scans.map(scan => scan._id.toString()),
+    req.files.map(file => file.buffer)
+  ).catch(err => {
+    console.error('Error processing batch scan analysis:', err);
+  });
+
+  res.status(201).json({
+    success: true,
+    count: scans.length,
+    data: {
+      scans
+    },
+    message: 'Scans created successfully. Analysis will be processed shortly.'
+  });
+});
+
 // @desc    Check ML service health
 // @route   GET /api/v1/scans/ml-health
 // @access  Private
@@ -1,6 +1,7 @@
 const express = require('express');
 const {
   createScan,
+  createScanBatch,
   getScans,
   getScan,
   updateScan,
@@ -12,6 +13,9 @@ const { protect } = require('../middlewares/auth');
 const upload = require('../middlewares/upload');
 const { scanLimiter } = require('../middlewares/rateLimiter');
 
+// Most images accepted by one batch scan upload
+const MAX_BATCH_SCANS = 10;
+
 const router = express.Router();
 
 // All routes require authentication
@@ -21,6 +25,8 @@ router.route('/')
   .get(getScans)
   .post(scanLimiter, upload.single('image'), createScan);
 
+router.post('/batch', scanLimiter, upload.array('images', MAX_BATCH_SCANS), createScanBatch);
+
 router.get('/ml-health', getMlHealth);
 
 router.route('/plant/:plantId')
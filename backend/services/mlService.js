@@ -26,7 +26,8 @@ class MLService {
         `${this.baseURL}/predict`,
         formData,
         {
-          headers: formData.getHeaders(),
+          // The ML service drops requests it can no longer answer within our timeout
+          headers: { ...formData.getHeaders(), 'X-Request-Timeout-Ms': String(this.timeout) },
           timeout: this.timeout
         }
       );
@@ -71,7 +72,10 @@ class MLService {
         `${this.baseURL}/predict/batch`,
         formData,
         {
-          headers: formData.getHeaders(),
+          headers: {
+            ...formData.getHeaders(),
+            'X-Request-Timeout-Ms': String(this.timeout * imageBuffers.length)
+          },
           timeout: this.timeout * imageBuffers.length
         }
       );
@@ -87,6 +91,89 @@ class MLService {
     }
   }
 
+  /**
+   * Process multiple images in batch, receiving each result as soon as it is ready
+   * @param {Array<Buffer>} imageBuffers - Array of image buffers
+   * @param {Function} onResult - Called with each result ({ index, filename, success, data | error })
+   * @returns {Promise<Object>} Summary line ({ count, succeeded, failed, processing_time_ms })
+   */
+  async analyzeBatchStream(imageBuffers, onResult) {
+    const formData = new FormData();
+
+    imageBuffers.forEach((buffer, index) => {
+      formData.append('images', buffer, {
+        filename: `image_${index}.jpg`,
+        contentType: 'image/jpeg'
+      });
+    });
+
+    try {
+      const response = await axios.post(
+        `${this.baseURL}/predict/batch`,
+        formData,
+        {
+          headers: {
+            ...formData.getHeaders(),
+            Accept: 'application/x-ndjson',
+            'X-Request-Timeout-Ms': String(this.timeout * imageBuffers.length)
+          },
+          responseType: 'stream',
+          timeout: this.timeout * imageBuffers.length
+        }
+      );
+
+      return await new Promise((resolve, reject) => {
+        let buffered = '';
+        let summary = null;
+
+        const handleLine = (line) => {
+          if (!line.trim()) return;
+          const payload = JSON.parse(line);
+          if (payload.summary) {
+            summary = payload;
+          } else {
+            onResult(payload);
+          }
+        };
+
+        // Decode as a text stream so a multibyte character split across chunks stays intact
+        response.data.setEncoding('utf8');
+
+        response.data.on('data', (chunk) => {
+          buffered += chunk;
+          const lines = buffered.split('\n');
+          buffered = lines.pop();
+          try {
+            lines.forEach(handleLine);
+          } catch (error) {
+            response.data.destroy(error);
+          }
+        });
+
+        response.data.on('end', () => {
+          try {
+            handleLine(buffered);
+          } catch (error) {
+            return reject(error);
+          }
+
+          if (!summary) {
+            return reject(new Error('ML service stream ended without a summary'));
+          }
+          if (!summary.success) {
+            return reject(new Error(summary.error || 'ML service error'));
+          }
+          resolve(summary);
+        });
+
+        response.data.on('error', reject);
+      });
+    } catch (error) {
+      console.error('ML Service Batch Stream Error:', error.message);
+      throw error;
+    }
+  }
+
   /**
    * Check if ML service is healthy
    * @returns {Promise<Boolean>}
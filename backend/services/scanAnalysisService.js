@@ -21,22 +21,7 @@ async function processScanAnalysis(scanId, imageBuffer) {
       filename: `scan_${scanId}.jpg`
     });
 
-    // Generate comprehensive analysis result
-    const analysisResult = mlService.generateAnalysisResult(mlResults);
-
-    // Update scan with ML results
-    scan.yolo_predictions = mlResults.yolo_predictions || [];
-    scan.visual_features = mlResults.visual_features || {};
-    scan.analysis_result = analysisResult;
-    scan.recommendations = analysisResult.recommendations || {};
-    scan.scan_metadata.processing_time_ms = mlResults.processing_time_ms || 0;
-    scan.scan_metadata.model_version = process.env.MODEL_VERSION || '1.0.0';
-
-    // Check if low confidence - flag for validation
-    if (mlResults.confidence_score < 0.7) {
-      scan.self_learning_status.requires_validation = true;
-    }
-
+    applyMlResults(scan, mlResults);
     await scan.save();
 
     return scan;
@@ -46,6 +31,90 @@ async function processScanAnalysis(scanId, imageBuffer) {
   }
 }
 
+/**
+ * Copy ML service results and the derived analysis onto a scan (not saved)
+ * @param {Object} scan - Scan document
+ * @param {Object} mlResults - Results from ML service
+ */
+function applyMlResults(scan, mlResults) {
+  // Generate comprehensive analysis result
+  const analysisResult = mlService.generateAnalysisResult(mlResults);
+
+  // Update scan with ML results
+  scan.yolo_predictions = mlResults.yolo_predictions || [];
+  scan.visual_features = mlResults.visual_features || {};
+  scan.analysis_result = analysisResult;
+  scan.recommendations = analysisResult.recommendations || {};
+  scan.scan_metadata.processing_time_ms = mlResults.processing_time_ms || 0;
+  scan.scan_metadata.model_version = process.env.MODEL_VERSION || '1.0.0';
+
+  // Check if low confidence - flag for validation
+  if (mlResults.confidence_score < 0.7) {
+    scan.self_learning_status.requires_validation = true;
+  }
+}
+
+/**
+ * Mark a scan whose analysis failed
+ * @param {String} scanId - Scan ID
+ */
+async function markScanFailed(scanId) {
+  const scan = await Scan.findById(scanId);
+  if (scan) {
+    scan.scan_metadata.processing_time_ms = -1; // Error indicator
+    await scan.save();
+  }
+}
+
+/**
+ * Analyze several scans with one streamed batch request
+ * Each scan is updated as soon as its result arrives, not when the whole batch is done.
+ * @param {Array<String>} scanIds - Scan IDs, in the same order as imageBuffers
+ * @param {Array<Buffer>} imageBuffers - Image buffers
+ * @returns {Promise<Object>} Batch summary ({ count, succeeded, failed, processing_time_ms })
+ */
+async function processScanBatch(scanIds, imageBuffers) {
+  const updates = [];
+  const answered = new Set();
+
+  const updateScan = async ({ index, success, data, error }) => {
+    const scanId = scanIds[index];
+    try {
+      if (!success) {
+        throw new Error(error || 'ML service error');
+      }
+      const scan = await Scan.findById(scanId);
+      if (!scan) {
+        throw new Error('Scan not found');
+      }
+      applyMlResults(scan, data);
+      await scan.save();
+    } catch (err) {
+      console.error(`Error processing scan ${scanId} in batch:`, err.message);
+      await markScanFailed(scanId);
+    }
+  };
+
+  try {
+    return await mlService.analyzeBatchStream(imageBuffers, (result) => {
+      answered.add(result.index);
+      updates.push(updateScan(result));
+    });
+  } catch (error) {
+    // Scans the stream never answered are marked failed as well
+    scanIds.forEach((scanId, index) => {
+      if (!answered.has(index)) {
+        updates.push(markScanFailed(scanId).catch((err) => {
+          console.error(`Error marking scan ${scanId} failed:`, err.message);
+        }));
+      }
+    });
+    throw error;
+  } finally {
+    await Promise.all(updates);
+  }
+}
+
 /**
  * Process scan asynchronously (for background jobs)
  * @param {String} scanId - Scan ID
@@ -69,16 +138,13 @@ async function processScanAsync(scanId) {
   } catch (error) {
     console.error('Error in async scan processing:', error);
     // Update scan with error status
-    const scan = await Scan.findById(scanId);
-    if (scan) {
-      scan.scan_metadata.processing_time_ms = -1; // Error indicator
-      await scan.save();
-    }
+    await markScanFailed(scanId);
   }
 }
 
 module.exports = {
   processScanAnalysis,
-  processScanAsync
+  processScanAsync,
+  processScanBatch
 };
 
@@ -1,34 +1,217 @@
-from flask import Flask, request, jsonify
+import time
+
+# Start of the app import phase reported in the startup timings.
+IMPORT_STARTED = time.perf_counter()
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from dotenv import load_dotenv
+import json
 import os
-import time
 
+from services.model_backends import import_runtime
 from services.yolo_service import YOLOService
 from services.preprocessing import ImagePreprocessor
 from services.age_estimation import AgeEstimator
+from services.batching import MicroBatcher
+from services.prediction_cache import PredictionCache
+from services.admission import AdmissionController, AdmissionRejected
+from services.coalescer import SingleFlight
+from services.model_reloader import ModelReloader
 from utils.image_utils import validate_image
+from utils.multipart_stream import iter_uploads
 from utils.metrics import calculate_confidence_score
+from utils.process_stats import memory_usage
+from utils.profiling import RequestProfiler
+from utils import telemetry
 
 load_dotenv()
 
 app = Flask(__name__)
 
 # Initialize services
-model_service = YOLOService()
+# With MODEL_BACKGROUND_LOAD=true the model loads and warms up in a thread while /health already answers.
+model_reloader = ModelReloader(
+    YOLOService,
+    prepare=import_runtime,
+    startup_timings={'app_import_ms': (time.perf_counter() - IMPORT_STARTED) * 1000}
+)
 preprocessor = ImagePreprocessor()
 age_estimator = AgeEstimator()
+prediction_cache = PredictionCache()
+coalescer = SingleFlight()
+micro_batching = os.getenv('MICROBATCH_ENABLED', 'false').lower() == 'true'
+# The micro-batcher can only fill its batches if that many /predict calls hold a slot at once.
+admission = AdmissionController(
+    default_in_flight=max(4, int(os.getenv('MICROBATCH_MAX_SIZE', '8'))) if micro_batching else 4
+)
+profiler = RequestProfiler()
+
+# Detection and OpenCV feature extraction both release the GIL, so they run side by side.
+pipeline_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PIPELINE_THREADS', '4')),
+    thread_name_prefix='pipeline'
+)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Images per forward pass when streaming, kept small so results are emitted progressively.
+STREAM_BATCH_MAX = max(int(os.getenv('STREAM_BATCH_MAX', '4')), 1)
+
+micro_batcher = None
+if micro_batching:
+    micro_batcher = MicroBatcher(
+        lambda images, batch_size=None: model_reloader.service.predict_batch(images, batch_size=batch_size)
+    )
+    if admission.enabled and admission.max_in_flight < micro_batcher.max_batch_size:
+        print(
+            f"MAX_IN_FLIGHT={admission.max_in_flight} admits fewer /predict calls than "
+            f"MICROBATCH_MAX_SIZE={micro_batcher.max_batch_size}, so micro-batches never fill"
+        )
+
+def timed(func, *args, stage=None):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    if stage is not None:
+        telemetry.observe_stage(stage, elapsed)
+    return result, elapsed * 1000
+
+def submit(func, *args, **kwargs):
+    # Work for the pipeline pool; a profiled request also profiles it on the pool thread.
+    session = g.get('profile')
+    if session is not None:
+        return pipeline_pool.submit(session.run, func, *args, **kwargs)
+    return pipeline_pool.submit(func, *args, **kwargs)
+
+def serialize(payload):
+    with telemetry.stage_timer('serialization'):
+        return jsonify(payload)
+
+def detect(image, model_service):
+    if micro_batcher is not None:
+        return micro_batcher.submit(image)
+    return model_service.predict(image)
+
+def prediction_key(image_bytes, model_service, output_format='records'):
+    # Content hash of the upload and the serving model, shared by the prediction cache and request coalescing.
+    if not prediction_cache.enabled and not coalescer.enabled:
+        return None
+
+    model_identity = model_service.model_identity()
+    prediction_cache.sync_model(model_identity)
+    return prediction_cache.make_key(image_bytes, model_identity + (output_format,))
+
+MODEL_ENDPOINTS = ('predict', 'predict_batch')
+
+@app.before_request
+def start_model_services():
+    g.request_started = time.perf_counter()
+    model_reloader.ensure_started()
+    model_reloader.ensure_watching()
+    if request.endpoint not in MODEL_ENDPOINTS:
+        return None
+    if not model_reloader.ready:
+        return jsonify({'success': False, 'error': 'Model is not ready'}), 503
+
+    try:
+        g.admission_kind = admission_kind()
+        g.admission_started = admission.acquire(request_deadline(), g.admission_kind)
+    except AdmissionRejected as exc:
+        response = jsonify({'success': False, 'error': str(exc), 'reason': exc.reason})
+        if exc.retry_after is not None:
+            response.headers['Retry-After'] = str(exc.retry_after)
+        return response, exc.status
+
+    g.profile = profiler.start(request)
+
+@app.after_request
+def count_request(response):
+    if request.endpoint in MODEL_ENDPOINTS:
+        telemetry.requests_total.labels(request.endpoint, telemetry.request_outcome(response.status_code)).inc()
+    return response
+
+@app.after_request
+def attach_profile(response):
+    session = g.get('profile')
+    if session is None:
+        return response
+
+    # Streamed responses are still running here; their profile is saved at teardown instead.
+    if session.inline and response.is_json and not response.is_streamed:
+        g.pop('profile')
+        payload = response.get_json()
+        payload['profile'] = profiler.summarize(session)
+        response.set_data(json.dumps(payload))
+    response.headers['X-Profile-Id'] = session.request_id
+    return response
+
+@app.teardown_request
+def save_profile(exc):
+    session = g.pop('profile', None)
+    if session is not None:
+        try:
+            app.logger.info('Saved request profile to %s', profiler.finish(session))
+        except Exception as error:
+            app.logger.warning('Could not save request profile: %s', error)
+
+@app.teardown_request
+def release_admission(exc):
+    # Streamed responses keep the request context, so the slot is held until the last line is sent.
+    started = g.pop('admission_started', None)
+    if started is not None:
+        admission.release(started, g.pop('admission_kind'))
+
+    request_started = g.pop('request_started', None)
+    if request_started is not None and request.endpoint in MODEL_ENDPOINTS:
+        telemetry.request_seconds.labels(request.endpoint).observe(time.perf_counter() - request_started)
+
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def admission_kind():
+    # Batches and streams hold a slot far longer than one image, so each gets its own service-time estimate.
+    if request.endpoint == 'predict_batch' and wants_ndjson():
+        return 'predict_batch_stream'
+    return request.endpoint
+
+def request_deadline():
+    # X-Request-Timeout-Ms is the client's remaining time budget for this request.
+    try:
+        timeout_ms = float(request.headers['X-Request-Timeout-Ms'])
+    except (KeyError, ValueError):
+        return None
+    return time.monotonic() + timeout_ms / 1000
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    model_service = model_reloader.service
     return jsonify({
         'status': 'healthy',
         'service': 'Aloe Vera ML Inference Service',
-        'model_path': model_service.model_path,
-        'model_name': model_service.model_name,
-        'class_count': len(model_service.class_names),
+        'model_path': model_service.model_path if model_service else None,
+        'model_name': model_service.model_name if model_service else None,
+        'model_backend': model_service.backend if model_service else None,
+        'class_count': len(model_service.class_names) if model_service else 0,
+        'model': model_reloader.status(),
+        'prediction_cache': prediction_cache.stats(),
+        'coalescing': coalescer.stats(),
+        'admission': admission.stats(),
+        'profiling': profiler.stats(),
+        'worker_memory': memory_usage(),
         'version': os.getenv('SERVICE_VERSION', '1.0.0')
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    payload, content_type = telemetry.render()
+    return Response(payload, content_type=content_type)
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    # Unlike /health, only succeeds once the model is loaded and warmed up.
+    readiness = model_reloader.readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
 @app.route('/predict', methods=['POST'])
 def predict():
     start_time = time.time()
@@ -37,82 +220,203 @@ def predict():
         if 'image' not in request.files:
             return jsonify({'success': False, 'error': 'No image file provided'}), 400
 
+        model_service = model_reloader.service
         image_file = request.files['image']
-        validation = validate_image(image_file)
+        validation, _ = timed(validate_image, image_file, stage='validation')
         if not validation['valid']:
             return jsonify({'success': False, 'error': validation['error']}), 400
 
-        # Read bytes once to avoid re-reading the stream.
-        image_bytes = image_file.read()
-        image = preprocessor.preprocess(image_bytes)
+        # Validation reads the upload once; the parsed image is decoded a single time below.
+        image_bytes = validation['image_bytes']
+        cache_key = prediction_key(image_bytes, model_service)
+        cached = prediction_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return jsonify({
+                'success': True,
+                'data': dict(cached, processing_time_ms=(time.time() - start_time) * 1000)
+            }), 200
 
-        yolo_predictions = model_service.predict(image)
-        visual_features = preprocessor.extract_features(image)
-        age_estimation = age_estimator.estimate(visual_features)
-        confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+        # Identical uploads already in flight (client retries) share that request's pipeline run.
+        (result, stage_timings), _ = coalescer.run(
+            cache_key, lambda: run_pipeline(validation['image'], model_service, cache_key)
+        )
 
         processing_time = (time.time() - start_time) * 1000
 
-        return jsonify({
+        return serialize({
             'success': True,
-            'data': {
+            'data': dict(result, processing_time_ms=processing_time, stage_timings_ms=stage_timings)
+        }), 200
+
+    except TimeoutError as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 503
+    except Exception as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 500
+
+def run_pipeline(pil_image, model_service, cache_key):
+    stage_timings = {}
+    image, stage_timings['preprocess_ms'] = timed(preprocessor.preprocess, pil_image)
+
+    features_future = submit(
+        timed, preprocessor.extract_features, image, stage='feature_extraction'
+    )
+    yolo_predictions, stage_timings['detection_ms'] = timed(detect, image, model_service)
+    visual_features, stage_timings['feature_extraction_ms'] = features_future.result()
+
+    age_estimation, stage_timings['age_estimation_ms'] = timed(
+        age_estimator.estimate, visual_features, stage='age_estimation'
+    )
+    confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+
+    result = {
+        'yolo_predictions': yolo_predictions,
+        'visual_features': visual_features,
+        'age_estimation': age_estimation,
+        'confidence_score': confidence_score
+    }
+    if cache_key:
+        prediction_cache.put(cache_key, result)
+    return result, stage_timings
+
+def prepare_batch_item(index, image_file, model_service, output_format):
+    # Returns (entry, None) when the file is answered without inference, otherwise (None, pending item).
+    try:
+        validation, _ = timed(validate_image, image_file, stage='validation')
+        if not validation['valid']:
+            return {'filename': image_file.filename, 'success': False, 'error': validation['error']}, None
+
+        image_bytes = validation['image_bytes']
+        cache_key = prediction_key(image_bytes, model_service, output_format)
+        cached = prediction_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return {'filename': image_file.filename, 'success': True, 'data': cached}, None
+
+        image = preprocessor.preprocess(validation['image'])
+        return None, (index, image_file.filename, image, cache_key)
+    except Exception as exc:
+        return {'filename': image_file.filename, 'success': False, 'error': str(exc)}, None
+
+def run_batch_chunk(chunk, model_service, output_format):
+    # Yields (index, entry) for each pending item once the chunk's forward pass is done.
+    feature_futures = [
+        submit(timed, preprocessor.extract_features, image, stage='feature_extraction')
+        for _, _, image, _ in chunk
+    ]
+    try:
+        batch_predictions = model_service.predict_batch(
+            [image for _, _, image, _ in chunk],
+            columnar=output_format == 'columnar'
+        )
+    except Exception as exc:
+        for index, filename, _, _ in chunk:
+            yield index, {'filename': filename, 'success': False, 'error': str(exc)}
+        return
+
+    for (index, filename, image, cache_key), yolo_predictions, features_future in zip(
+        chunk, batch_predictions, feature_futures
+    ):
+        try:
+            visual_features, _ = features_future.result()
+            age_estimation, _ = timed(age_estimator.estimate, visual_features, stage='age_estimation')
+            confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+
+            result = {
                 'yolo_predictions': yolo_predictions,
                 'visual_features': visual_features,
                 'age_estimation': age_estimation,
-                'confidence_score': confidence_score,
-                'processing_time_ms': processing_time
+                'confidence_score': confidence_score
             }
-        }), 200
+            if cache_key:
+                prediction_cache.put(cache_key, result)
 
-    except Exception as exc:
-        return jsonify({'success': False, 'error': str(exc)}), 500
+            yield index, {'filename': filename, 'success': True, 'data': result}
+        except Exception as exc:
+            yield index, {'filename': filename, 'success': False, 'error': str(exc)}
+
+def stream_batch(model_service, output_format):
+    # NDJSON: one line per file as soon as it is answered (tagged with its upload index), then a summary line.
+    try:
+        uploads = iter_uploads(request.stream, request.headers.get('Content-Type', ''), 'images')
+    except ValueError as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 400
+    chunk_size = min(STREAM_BATCH_MAX, model_service.batch_max)
+
+    def line(payload):
+        with telemetry.stage_timer('serialization'):
+            return json.dumps(payload) + '\n'
+
+    def generate():
+        start_time = time.time()
+        counts = {'count': 0, 'succeeded': 0}
+        pending = []
+
+        def emit(index, entry):
+            counts['succeeded'] += entry['success']
+            return line(dict(entry, index=index))
+
+        try:
+            for index, upload in enumerate(uploads):
+                counts['count'] += 1
+                entry, item = prepare_batch_item(index, upload, model_service, output_format)
+                if item is None:
+                    yield emit(index, entry)
+                    continue
+
+                pending.append(item)
+                if len(pending) == chunk_size:
+                    for done_index, done_entry in run_batch_chunk(pending, model_service, output_format):
+                        yield emit(done_index, done_entry)
+                    pending = []
+
+            for done_index, done_entry in run_batch_chunk(pending, model_service, output_format):
+                yield emit(done_index, done_entry)
+
+            yield line({
+                'summary': True,
+                'success': True,
+                'count': counts['count'],
+                'succeeded': counts['succeeded'],
+                'failed': counts['count'] - counts['succeeded'],
+                'processing_time_ms': (time.time() - start_time) * 1000
+            })
+        except Exception as exc:
+            yield line({'summary': True, 'success': False, 'count': counts['count'], 'error': str(exc)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE,
+        headers={'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/predict/batch', methods=['POST'])
 def predict_batch():
     try:
+        model_service = model_reloader.service
+        output_format = 'columnar' if request.args.get('format') == 'columnar' else 'records'
+
+        if wants_ndjson():
+            return stream_batch(model_service, output_format)
+
         if 'images' not in request.files:
             return jsonify({'success': False, 'error': 'No image files provided'}), 400
 
         images = request.files.getlist('images')
-        results = []
-
-        for image_file in images:
-            try:
-                validation = validate_image(image_file)
-                if not validation['valid']:
-                    results.append({
-                        'filename': image_file.filename,
-                        'success': False,
-                        'error': validation['error']
-                    })
-                    continue
+        results = [None] * len(images)
+        pending = []
+
+        for index, image_file in enumerate(images):
+            entry, item = prepare_batch_item(index, image_file, model_service, output_format)
+            if item is None:
+                results[index] = entry
+            else:
+                pending.append(item)
 
-                image_bytes = image_file.read()
-                image = preprocessor.preprocess(image_bytes)
-
-                yolo_predictions = model_service.predict(image)
-                visual_features = preprocessor.extract_features(image)
-                age_estimation = age_estimator.estimate(visual_features)
-                confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
-
-                results.append({
-                    'filename': image_file.filename,
-                    'success': True,
-                    'data': {
-                        'yolo_predictions': yolo_predictions,
-                        'visual_features': visual_features,
-                        'age_estimation': age_estimation,
-                        'confidence_score': confidence_score
-                    }
-                })
-            except Exception as exc:
-                results.append({
-                    'filename': image_file.filename,
-                    'success': False,
-                    'error': str(exc)
-                })
-
-        return jsonify({
+        for start in range(0, len(pending), model_service.batch_max):
+            chunk = pending[start:start + model_service.batch_max]
+            for index, entry in run_batch_chunk(chunk, model_service, output_format):
+                results[index] = entry
+
+        return serialize({
             'success': True,
             'count': len(results),
             'data': {'results': results}
@@ -121,6 +425,25 @@ def predict_batch():
     except Exception as exc:
         return jsonify({'success': False, 'error': str(exc)}), 500
 
+@app.route('/admin/reload', methods=['POST'])
+def reload_model():
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if not model_reloader.ready:
+        return jsonify({'success': False, 'error': 'Model is not ready'}), 503
+
+    # Only this worker reloads directly; the others follow through their file watchers.
+    started, notified = model_reloader.request_reload()
+    return jsonify({
+        'success': True,
+        'worker_pid': os.getpid(),
+        'already_in_progress': not started,
+        'scope': 'all_workers' if notified else 'this_worker',
+        'other_workers_within_seconds': model_reloader.watch_interval if notified else None,
+        'model': model_reloader.status()
+    }), 202
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', '5001'))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
@@ -0,0 +1,62 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.yolo_service import YOLOService
+
+
+def synthetic_images(count, size=640, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = rng.integers(0, 60, size=(size, size, 3), dtype=np.uint8)
+        image[:, :, 1] += rng.integers(80, 160, dtype=np.uint8)
+        images.append(image)
+    return images
+
+
+def run(model_service, images, batch_sizes, repeats):
+    model_service.predict_batch(images[:max(batch_sizes)], batch_size=max(batch_sizes))
+
+    report = []
+    for batch_size in batch_sizes:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model_service.predict_batch(images, batch_size=batch_size)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        report.append({
+            'batch_size': batch_size,
+            'images': len(images),
+            'best_seconds': best,
+            'images_per_sec': len(images) / best if best > 0 else 0.0
+        })
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched YOLO throughput')
+    parser.add_argument('--model', type=str, default=None, help='Path to model checkpoint')
+    parser.add_argument('--images', type=int, default=32, help='Images per run')
+    parser.add_argument('--batch-sizes', type=str, default='1,4,8,16')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    batch_sizes = [int(item) for item in args.batch_sizes.split(',') if item.strip()]
+    report = run(YOLOService(args.model), synthetic_images(args.images), batch_sizes, args.repeats)
+
+    for row in report:
+        print(f"batch={row['batch_size']:>3}  {row['images_per_sec']:8.2f} images/sec")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
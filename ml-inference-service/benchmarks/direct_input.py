@@ -0,0 +1,73 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.batch_throughput import synthetic_images
+from services.yolo_service import PREDICTION_COLUMNS, YOLOService
+
+
+def best_latency_ms(predict, images, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for image in images:
+            predict(image)
+        timings.append((time.perf_counter() - start) / len(images))
+    return min(timings) * 1000
+
+
+def max_box_difference(model_service, images):
+    worst = 0.0
+    for image in images:
+        model_service.direct_input = True
+        direct = model_service.predict_batch([image], columnar=True)[0]
+        model_service.direct_input = False
+        reference = model_service.predict_batch([image], columnar=True)[0]
+
+        if direct['class'] != reference['class']:
+            return float('inf')
+        for key in PREDICTION_COLUMNS[1:]:
+            worst = max(worst, float(np.max(np.abs(np.subtract(direct[key], reference[key])))))
+    return worst
+
+
+def run(model_service, images, repeats):
+    model_service.predict(images[0])
+
+    model_service.direct_input = False
+    ultralytics_ms = best_latency_ms(model_service.predict, images, repeats)
+    model_service.direct_input = True
+    direct_ms = best_latency_ms(model_service.predict, images, repeats)
+
+    return {
+        'images': len(images),
+        'ultralytics_input_ms': ultralytics_ms,
+        'direct_input_ms': direct_ms,
+        'speedup': ultralytics_ms / direct_ms if direct_ms > 0 else 0.0,
+        'max_box_difference_px': max_box_difference(model_service, images)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare direct tensor input with Ultralytics input handling')
+    parser.add_argument('--model', type=str, default=None, help='Path to model checkpoint')
+    parser.add_argument('--images', type=int, default=16, help='Images per run')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    report = run(YOLOService(args.model), synthetic_images(args.images), args.repeats)
+
+    print(f"Ultralytics input: {report['ultralytics_input_ms']:.2f} ms/image")
+    print(f"Direct input:      {report['direct_input_ms']:.2f} ms/image ({report['speedup']:.2f}x)")
+    print(f"Max box difference: {report['max_box_difference_px']:.4f} px")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
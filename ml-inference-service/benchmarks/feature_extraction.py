@@ -0,0 +1,87 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.preprocessing import ImagePreprocessor
+
+FIXTURE_SIZES = [(640, 640), (4032, 3024), (3024, 4032), (1280, 720), (720, 1280), (300, 1200)]
+# (label, value range of the coarse colour grid, per-pixel noise amplitude)
+FIXTURE_STYLES = [('flat', 40, 2), ('leafy', 140, 6), ('textured', 255, 20)]
+
+
+def fixture_images(seed=0):
+    rng = np.random.default_rng(seed)
+    preprocessor = ImagePreprocessor()
+    fixtures = []
+    for width, height in FIXTURE_SIZES:
+        for style, spread, noise_level in FIXTURE_STYLES:
+            grid = (max(height // 80, 2), max(width // 80, 2), 3)
+            small = rng.integers(100 - spread // 2, 100 + spread // 2, size=grid).clip(0, 255).astype(np.uint8)
+            small[:, :, 1] = np.maximum(small[:, :, 1], 90)
+            image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+            noise = rng.integers(-noise_level, noise_level + 1, size=image.shape, dtype=np.int16)
+            image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+            fixtures.append((f'{style}-{width}x{height}', preprocessor._resize_with_aspect_ratio(image)))
+    return fixtures
+
+
+def reference_features(preprocessor, image):
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return {
+        'leaf_color_index': float(preprocessor._calculate_color_index(hsv)),
+        'surface_pattern_score': float(preprocessor._calculate_pattern_score(gray)),
+        'structural_features': preprocessor._estimate_structure(image)
+    }
+
+
+def best_ms(func, image, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(image)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def run(repeats):
+    preprocessor = ImagePreprocessor()
+    report = []
+    for name, image in fixture_images():
+        reference = reference_features(preprocessor, image)
+        fused = preprocessor.extract_features(image)
+        report.append({
+            'image': name,
+            'reference_ms': best_ms(lambda img: reference_features(preprocessor, img), image, repeats),
+            'fused_ms': best_ms(preprocessor.extract_features, image, repeats),
+            'color_index_diff': abs(reference['leaf_color_index'] - fused['leaf_color_index']),
+            'pattern_score_diff': abs(reference['surface_pattern_score'] - fused['surface_pattern_score']),
+            'structure_match': reference['structural_features'] == fused['structural_features']
+        })
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare fused and reference feature extraction')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    report = run(args.repeats)
+    for row in report:
+        print(
+            f"{row['image']:>20}  reference {row['reference_ms']:6.2f} ms  fused {row['fused_ms']:6.2f} ms  "
+            f"color diff {row['color_index_diff']:.2e}  pattern diff {row['pattern_score_diff']:.2e}  "
+            f"structure {'match' if row['structure_match'] else 'MISMATCH'}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,78 @@
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.image_utils import MAX_FILE_SIZE
+
+RESOLUTIONS = {
+    '640': (640, 640),
+    '12mp': (4032, 3024),
+    '5000x5000': (5000, 5000),
+}
+FORMATS = {
+    'jpeg': {'format': 'JPEG', 'quality': 90},
+    'png': {'format': 'PNG', 'compress_level': 6},
+    'webp': {'format': 'WEBP', 'quality': 90},
+}
+MIME_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+def aloe_image(width, height, seed=0):
+    # RGB: a rosette of tapered green leaves on textured soil, with a few brownish spots.
+    rng = np.random.default_rng(seed)
+
+    small = rng.integers(0, 40, size=(max(height // 64, 2), max(width // 64, 2), 3), dtype=np.uint8)
+    small += np.array([110, 85, 60], dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    center = np.array([width / 2, height * 0.6])
+    length = 0.45 * min(width, height)
+    for leaf in range(int(rng.integers(9, 15))):
+        angle = np.deg2rad(rng.uniform(200, 340))
+        reach = length * rng.uniform(0.6, 1.0)
+        base_width = reach * rng.uniform(0.10, 0.16)
+        direction = np.array([np.cos(angle), np.sin(angle)])
+        normal = np.array([-direction[1], direction[0]])
+        outline = np.array([
+            center + normal * base_width,
+            center + direction * reach * 0.5 + normal * base_width * 0.6,
+            center + direction * reach,
+            center + direction * reach * 0.5 - normal * base_width * 0.6,
+            center - normal * base_width,
+        ], dtype=np.int32)
+        green = (int(rng.integers(50, 90)), int(rng.integers(130, 180)), int(rng.integers(60, 100)))
+        cv2.fillPoly(image, [outline], green)
+
+        for _ in range(int(rng.integers(0, 3))):
+            spot = center + direction * reach * rng.uniform(0.3, 0.8)
+            radius = max(int(base_width * rng.uniform(0.15, 0.35)), 1)
+            cv2.circle(image, (int(spot[0]), int(spot[1])), radius, (120, 90, 40), -1)
+
+    noise = rng.integers(-8, 9, size=image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def encode(array, image_format):
+    buffer = BytesIO()
+    Image.fromarray(array).save(buffer, **FORMATS[image_format])
+    return buffer.getvalue()
+
+
+def fixtures(resolutions=None, formats=None, seed=0, max_bytes=MAX_FILE_SIZE):
+    # [(name, format, encoded bytes)] for every resolution/format pair, generated deterministically.
+    # Pairs encoding to more than the service's upload limit (12 MP and 5000x5000 PNG) are left out:
+    # the service rejects them with a 400, so they would time the rejection path instead of inference.
+    items = []
+    for resolution in resolutions or RESOLUTIONS:
+        width, height = RESOLUTIONS[resolution]
+        array = aloe_image(width, height, seed)
+        for image_format in formats or FORMATS:
+            name = f'{resolution}_{image_format}'
+            data = encode(array, image_format)
+            if max_bytes is not None and len(data) > max_bytes:
+                print(f"Skipping {name}: {len(data) / 2 ** 20:.1f} MB exceeds the {max_bytes / 2 ** 20:.0f} MB upload limit")
+                continue
+            items.append((name, image_format, data))
+    return items
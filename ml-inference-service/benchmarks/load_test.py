@@ -0,0 +1,203 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.images import MIME_TYPES, RESOLUTIONS, fixtures
+from benchmarks.report import latency_summary, save
+from utils.process_stats import child_pids, memory_usage
+
+
+def multipart_body(field, files, nonce=None):
+    # Returned as a list of parts that is sent without joining, so large fixtures are not copied per request.
+    # With a nonce, each file gets unique trailing bytes after its image data: decoders stop at the image's end
+    # marker and see the same pixels, but the content hash used by request coalescing and the prediction cache
+    # differs, so every request runs its own inference.
+    boundary = uuid.uuid4().hex
+    parts = []
+    for index, (filename, content_type, data) in enumerate(files):
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+        )
+        parts.append(data)
+        parts.append((f'\n{nonce}-{index}' if nonce is not None else '').encode() + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return parts, f'multipart/form-data; boundary={boundary}'
+
+
+def post(url, body, content_type, timeout):
+    headers = {'Content-Type': content_type, 'Content-Length': str(sum(len(part) for part in body))}
+    request = Request(url, data=body, headers=headers, method='POST')
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except HTTPError as exc:
+        return exc.code
+    except (URLError, OSError):
+        return None
+
+
+class ServerMemorySampler:
+    # Polls the RSS of the server process and its workers; the peak is their largest combined RSS.
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            pids = [self.pid] + child_pids(self.pid)
+            self.peak_mb = max(self.peak_mb, sum(memory_usage(pid)['rss_mb'] for pid in pids))
+            self._stop.wait(self.interval)
+
+
+def run_case(name, url, make_body, images_per_request, concurrency, requests, timeout, server_pid):
+    # Closed loop: `concurrency` clients each send their next request as soon as the previous one returns.
+    # make_body(n) returns the (parts, content type) of request n; -1 is the untimed warmup request.
+    post(url, *make_body(-1), timeout)
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(n):
+        body, content_type = make_body(n)
+        start = time.perf_counter()
+        status = post(url, body, content_type, timeout)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    with ServerMemorySampler(server_pid) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, range(requests)))
+        wall = time.perf_counter() - started
+
+    succeeded = statuses.get('200', 0)
+    row = {'name': name, 'concurrency': concurrency, **latency_summary(latencies)}
+    row.update({
+        'statuses': statuses,
+        'error_rate': 1 - succeeded / requests if requests else 0.0,
+        'throughput_rps': succeeded / wall if wall > 0 else 0.0,
+        'images_per_sec': succeeded * images_per_request / wall if wall > 0 else 0.0,
+        'peak_rss_mb': sampler.peak_mb if server_pid else None
+    })
+    return row
+
+
+def dedup_features(base_url, timeout):
+    # Names of the service features that answer repeated identical images without running inference.
+    try:
+        with urlopen(f'{base_url}/health', timeout=timeout) as response:
+            health = json.loads(response.read())
+    except (URLError, OSError, ValueError):
+        return []
+    features = []
+    if health.get('prediction_cache', {}).get('enabled', False):
+        features.append('the prediction cache (PREDICTION_CACHE_MAX_MB=0 disables it)')
+    if health.get('coalescing', {}).get('enabled', False):
+        features.append('request coalescing (COALESCE_REQUESTS=false disables it)')
+    return features
+
+
+def body_factory(field, files, identical):
+    if identical:
+        body = multipart_body(field, files)
+        return lambda n: body
+
+    case_id = uuid.uuid4().hex[:8]
+    return lambda n: multipart_body(field, files, nonce=f'{case_id}-{n}')
+
+
+def run(base_url, resolutions, formats, concurrency_levels, requests, batch_size, timeout=120, server_pid=None,
+        identical=False):
+    # By default every request carries unique bytes; identical=True resends the same bytes, for measuring
+    # how much coalescing and the prediction cache save.
+    base_url = base_url.rstrip('/')
+    if identical:
+        for feature in dedup_features(base_url, timeout):
+            print(f'warning: identical payloads are answered by {feature}, so latency and throughput are inflated')
+
+    report = []
+    for name, image_format, image_bytes in fixtures(resolutions, formats):
+        filename = f'{name}.{image_format}'
+        single = body_factory('image', [(filename, MIME_TYPES[image_format], image_bytes)], identical)
+        batch = body_factory('images', [(filename, MIME_TYPES[image_format], image_bytes)] * batch_size, identical)
+
+        for concurrency in concurrency_levels:
+            report.append(run_case(
+                f'predict/{name}/c{concurrency}', f'{base_url}/predict', single, 1,
+                concurrency, requests, timeout, server_pid
+            ))
+            report.append(run_case(
+                f'predict_batch/{name}x{batch_size}/c{concurrency}', f'{base_url}/predict/batch', batch, batch_size,
+                concurrency, max(requests // batch_size, concurrency), timeout, server_pid
+            ))
+    return report
+
+
+def print_rows(rows):
+    for row in rows:
+        rss = f"{row['peak_rss_mb']:.0f} MB" if row['peak_rss_mb'] is not None else 'n/a'
+        print(
+            f"{row['name']:<40} p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  p99 {row['p99_ms']:8.1f} ms  "
+            f"{row['throughput_rps']:7.2f} req/s  {row['images_per_sec']:7.2f} images/sec  "
+            f"errors {row['error_rate'] * 100:.1f}%  server rss {rss}"
+        )
+
+
+def add_arguments(parser):
+    parser.add_argument('--url', type=str, default='http://localhost:5001', help='Service base URL')
+    parser.add_argument('--concurrency', type=str, default='1,4,8', help='Concurrency levels')
+    parser.add_argument('--requests', type=int, default=40, help='Requests per /predict case')
+    parser.add_argument('--batch-size', type=int, default=8, help='Images per /predict/batch request')
+    parser.add_argument('--server-pid', type=int, default=None, help='Server (gunicorn master) pid for peak RSS')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument(
+        '--identical-payloads', action='store_true',
+        help='Resend the same bytes so request coalescing and the prediction cache can answer repeats'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive /predict and /predict/batch at fixed concurrency levels')
+    add_arguments(parser)
+    parser.add_argument('--resolutions', type=str, default=','.join(RESOLUTIONS))
+    parser.add_argument('--formats', type=str, default='jpeg')
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    report = run(
+        args.url, args.resolutions.split(','), args.formats.split(','),
+        [int(level) for level in args.concurrency.split(',')], args.requests, args.batch_size,
+        args.timeout, args.server_pid, args.identical_payloads
+    )
+    print_rows(report)
+
+    if args.output:
+        save(report, args.output)
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.images import FORMATS, RESOLUTIONS, fixtures
+from benchmarks.report import latency_summary, peak_rss_mb, reset_peak_rss, save
+from services.preprocessing import ImagePreprocessor
+
+
+def measure(name, func, repeats, warmup=1):
+    for _ in range(warmup):
+        func()
+
+    reset_peak_rss()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    row = {'name': name, **latency_summary(timings)}
+    row['images_per_sec'] = 1000 / row['mean_ms'] if row['mean_ms'] > 0 else 0.0
+    row['peak_rss_mb'] = peak_rss_mb()
+    return row
+
+
+def run(resolutions, formats, repeats, model_path=None, skip_model=False):
+    preprocessor = ImagePreprocessor()
+    model_service = None
+    if not skip_model:
+        from services.yolo_service import YOLOService
+
+        model_service = YOLOService(model_path)
+
+    report = []
+    preprocessed = {}
+    for name, _, image_bytes in fixtures(resolutions, formats):
+        resolution = name.rsplit('_', 1)[0]
+        report.append(measure(
+            f'preprocess/{name}',
+            lambda: preprocessor.preprocess(Image.open(BytesIO(image_bytes))),
+            repeats
+        ))
+        # Decoded frames differ only by codec loss, so the later stages run once per resolution.
+        preprocessed.setdefault(resolution, preprocessor.preprocess(Image.open(BytesIO(image_bytes))))
+
+    for resolution, image in preprocessed.items():
+        report.append(measure(f'extract_features/{resolution}', lambda: preprocessor.extract_features(image), repeats))
+        if model_service is not None:
+            report.append(measure(f'predict/{resolution}', lambda: model_service.predict(image), repeats))
+    return report
+
+
+def print_rows(rows):
+    for row in rows:
+        print(
+            f"{row['name']:<32} p50 {row['p50_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  "
+            f"p99 {row['p99_ms']:8.2f} ms  {row['images_per_sec']:8.1f} images/sec  peak rss {row['peak_rss_mb']:.0f} MB"
+        )
+
+
+def add_arguments(parser):
+    parser.add_argument('--resolutions', type=str, default=','.join(RESOLUTIONS))
+    parser.add_argument('--formats', type=str, default=','.join(FORMATS))
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--model', type=str, default=None, help='Path to model checkpoint')
+    parser.add_argument('--skip-model', action='store_true', help='Skip YOLOService.predict (no torch needed)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='In-process micro-benchmarks of the inference pipeline stages')
+    add_arguments(parser)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    report = run(args.resolutions.split(','), args.formats.split(','), args.repeats, args.model, args.skip_model)
+    print_rows(report)
+
+    if args.output:
+        save(report, args.output)
@@ -0,0 +1,171 @@
+import argparse
+import json
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.preprocessing import ImagePreprocessor
+
+PHONE_SIZES = {
+    '12mp_landscape': (4032, 3024),
+    '12mp_portrait': (3024, 4032),
+    '5000x5000': (5000, 5000),
+}
+IMAGE_SUFFIXES = {'.jpg', '.jpeg'}
+
+
+def synthetic_photo(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(height // 32, width // 32, 3), dtype=np.uint8)
+    small[:, :, 1] = np.maximum(small[:, :, 1], 120)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(-12, 12, size=image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def textured_photo(width, height, seed=0):
+    # Fine texture near the pixel pitch: the worst case for the pixel difference, because the full-resolution
+    # path aliases when INTER_LINEAR shrinks it by 5-8x while the DCT-scaled decode averages it first.
+    rng = np.random.default_rng(seed)
+    x = np.arange(width, dtype=np.float32)[None, :]
+    y = np.arange(height, dtype=np.float32)[:, None]
+    texture = 127 + 90 * np.sin(x * 0.9) * np.cos(y * 1.3)
+    image = np.stack([texture * 0.6, texture, texture * 0.5], axis=2)
+    image += rng.normal(0, 20, size=image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(array, quality=90):
+    buffer = BytesIO()
+    Image.fromarray(array).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def time_preprocess(preprocessor, image_bytes, repeats):
+    timings = []
+    output = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = preprocessor.preprocess(Image.open(BytesIO(image_bytes)))
+        timings.append(time.perf_counter() - start)
+    return min(timings), output
+
+
+def pixel_diff(full_output, reduced_output):
+    diff = np.abs(full_output.astype(np.int16) - reduced_output.astype(np.int16))
+    return {
+        'mean_abs_diff': float(diff.mean()),
+        'p99_abs_diff': float(np.percentile(diff, 99)),
+        'max_abs_diff': int(diff.max()),
+        'same_shape': full_output.shape == reduced_output.shape
+    }
+
+
+def decoders():
+    full = ImagePreprocessor()
+    full.reduced_decode = False
+    reduced = ImagePreprocessor()
+    reduced.reduced_decode = True
+    return full, reduced
+
+
+def run(repeats):
+    full, reduced = decoders()
+
+    report = []
+    for content, make in (('smooth', synthetic_photo), ('textured', textured_photo)):
+        for name, (width, height) in PHONE_SIZES.items():
+            image_bytes = encode_jpeg(make(width, height))
+            full_seconds, full_output = time_preprocess(full, image_bytes, repeats)
+            reduced_seconds, reduced_output = time_preprocess(reduced, image_bytes, repeats)
+
+            report.append({
+                'image': f'{content}/{name}',
+                'full_decode_ms': full_seconds * 1000,
+                'reduced_decode_ms': reduced_seconds * 1000,
+                'speedup': full_seconds / reduced_seconds if reduced_seconds > 0 else 0.0,
+                **pixel_diff(full_output, reduced_output)
+            })
+    return report
+
+
+def box_iou(a, b):
+    ax2, ay2 = a['x'] + a['width'], a['y'] + a['height']
+    bx2, by2 = b['x'] + b['width'], b['y'] + b['height']
+    inter_w = max(min(ax2, bx2) - max(a['x'], b['x']), 0)
+    inter_h = max(min(ay2, by2) - max(a['y'], b['y']), 0)
+    inter = inter_w * inter_h
+    union = a['width'] * a['height'] + b['width'] * b['height'] - inter
+    return inter / union if union > 0 else 1.0
+
+
+def detection_parity(image_dir, model_path=None):
+    # Runs real JPEG photos through both decodes and the model and compares the top detection of each.
+    from services.yolo_service import YOLOService
+
+    model_service = YOLOService(model_path)
+    full, reduced = decoders()
+
+    report = []
+    paths = sorted(path for path in Path(image_dir).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+    for path in paths:
+        image_bytes = path.read_bytes()
+        full_output = full.preprocess(Image.open(BytesIO(image_bytes)))
+        reduced_output = reduced.preprocess(Image.open(BytesIO(image_bytes)))
+        full_predictions = model_service.predict(full_output)
+        reduced_predictions = model_service.predict(reduced_output)
+        full_top, reduced_top = full_predictions[0], reduced_predictions[0]
+
+        report.append({
+            'image': path.name,
+            **pixel_diff(full_output, reduced_output),
+            'same_top_class': full_top['class'] == reduced_top['class'],
+            'top_box_iou': box_iou(full_top['bounding_box'], reduced_top['bounding_box']),
+            'top_confidence_delta': abs(full_top['confidence'] - reduced_top['confidence']),
+            'detections': (len(full_predictions), len(reduced_predictions))
+        })
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare full and reduced-resolution JPEG preprocessing')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--images', type=str, default=None, help='Directory of real JPEG photos for detection parity')
+    parser.add_argument('--model', type=str, default=None, help='Path to model checkpoint (defaults to MODEL_PATH)')
+    parser.add_argument('--min-iou', type=float, default=0.9, help='Lowest accepted top-box IoU between the decodes')
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    if args.images:
+        report = detection_parity(args.images, args.model)
+        for row in report:
+            print(
+                f"{row['image']:>30}  mean diff {row['mean_abs_diff']:5.2f}  max diff {row['max_abs_diff']:3d}  "
+                f"same class {row['same_top_class']}  iou {row['top_box_iou']:.3f}  "
+                f"conf delta {row['top_confidence_delta']:.3f}"
+            )
+        failed = [row for row in report if not row['same_top_class'] or row['top_box_iou'] < args.min_iou]
+        print(f"{len(report) - len(failed)}/{len(report)} images with the same top detection")
+    else:
+        report = run(args.repeats)
+        failed = []
+        for row in report:
+            print(
+                f"{row['image']:>24}  full {row['full_decode_ms']:7.1f} ms  "
+                f"reduced {row['reduced_decode_ms']:6.1f} ms  x{row['speedup']:.1f}  "
+                f"mean diff {row['mean_abs_diff']:5.2f}  p99 diff {row['p99_abs_diff']:3.0f}  "
+                f"max diff {row['max_abs_diff']:3d}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(1 if failed else 0)
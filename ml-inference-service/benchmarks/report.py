@@ -0,0 +1,144 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+
+# Relative change that counts as a regression, per metric. Latencies and memory regress upwards,
+# throughput downwards.
+DEFAULT_THRESHOLD = 0.10
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb')
+HIGHER_IS_BETTER = ('throughput_rps', 'images_per_sec')
+
+
+def latency_summary(seconds):
+    if not seconds:
+        return {'count': 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max())
+    }
+
+
+def peak_rss_mb(pid='self'):
+    # VmHWM is the kernel's high-water mark for the process's resident set.
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == 'self':
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS, so each case reports its own peak.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__
+    }
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _flatten(report):
+    # {(section, case name, metric): value} for every comparable metric in a suite report.
+    values = {}
+    for section in ('micro', 'load'):
+        for row in report.get(section, []):
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                if row.get(metric) is not None:
+                    values[(section, row['name'], metric)] = row[metric]
+    return values
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # Returns a row per metric present in both reports; 'regression' is set when it got worse by more than threshold.
+    baseline_values = _flatten(baseline)
+    rows = []
+    for key, value in _flatten(current).items():
+        before = baseline_values.get(key)
+        if not before:
+            continue
+        section, name, metric = key
+        change = (value - before) / before
+        worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+        rows.append({
+            'section': section,
+            'name': name,
+            'metric': metric,
+            'baseline': before,
+            'current': value,
+            'change': change,
+            'regression': worse
+        })
+    return rows
+
+
+def print_comparison(rows):
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(
+            f"{row['section']:>5}  {row['name']:<40} {row['metric']:<15} "
+            f"{row['baseline']:10.2f} -> {row['current']:10.2f}  {row['change'] * 100:+6.1f}%  {flag}"
+        )
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare two benchmark suite reports')
+    parser.add_argument('baseline', type=str)
+    parser.add_argument('current', type=str)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative change flagged as a regression')
+    args = parser.parse_args()
+
+    rows = compare(load(args.baseline), load(args.current), args.threshold)
+    print_comparison(rows)
+    sys.exit(1 if any(row['regression'] for row in rows) else 0)
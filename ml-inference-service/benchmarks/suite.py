@@ -0,0 +1,49 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks import load_test, micro
+from benchmarks.report import DEFAULT_THRESHOLD, compare, environment, load, print_comparison, save
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the micro-benchmarks and, with --load, the HTTP load test; optionally compare with a baseline'
+    )
+    micro.add_arguments(parser)
+    load_test.add_arguments(parser)
+    parser.add_argument('--load', action='store_true', help='Also load-test the service at --url')
+    parser.add_argument('--load-formats', type=str, default='jpeg', help='Image formats sent by the load test')
+    parser.add_argument('--output', type=str, default='benchmark-results.json')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier suite output to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative change flagged as a regression')
+    args = parser.parse_args()
+
+    resolutions = args.resolutions.split(',')
+    report = {
+        'environment': environment(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'micro': micro.run(resolutions, args.formats.split(','), args.repeats, args.model, args.skip_model),
+        'load': []
+    }
+    micro.print_rows(report['micro'])
+
+    if args.load:
+        report['load'] = load_test.run(
+            args.url, resolutions, args.load_formats.split(','),
+            [int(level) for level in args.concurrency.split(',')], args.requests, args.batch_size,
+            args.timeout, args.server_pid, args.identical_payloads
+        )
+        load_test.print_rows(report['load'])
+
+    save(report, args.output)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        rows = compare(load(args.baseline), report, args.threshold)
+        print_comparison(rows)
+        regressions = [row for row in rows if row['regression']]
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%')
+            sys.exit(1)
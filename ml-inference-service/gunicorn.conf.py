@@ -0,0 +1,64 @@
+import gc
+import os
+import shutil
+import tempfile
+
+# Load app.py (and the model) once in the master; workers share its pages copy-on-write.
+preload_app = True
+
+# Workers write metrics here so /metrics on any worker reports the whole server; set before the app imports
+# prometheus_client. A directory created here is emptied on exit so counters start fresh with each server.
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='ml-inference-metrics-')
+    owns_metrics_dir = True
+else:
+    owns_metrics_dir = False
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+cpu_count = os.cpu_count() or 1
+workers = int(os.getenv('WEB_CONCURRENCY', str(max(cpu_count // 2, 1))))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+threads_per_worker = int(os.getenv('TORCH_THREADS_PER_WORKER', str(max(cpu_count // workers, 1))))
+cpu_affinity = os.getenv('WORKER_CPU_AFFINITY', 'false').lower() == 'true'
+
+
+def pre_fork(server, worker):
+    # Keep preloaded objects out of the collector so refcount/GC writes don't unshare their pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    cv2.setNumThreads(threads_per_worker)
+
+    if cpu_affinity and hasattr(os, 'sched_setaffinity'):
+        slot = (worker.age - 1) % workers
+        first = (slot * threads_per_worker) % cpu_count
+        cores = {(first + offset) % cpu_count for offset in range(threads_per_worker)}
+        os.sched_setaffinity(0, cores)
+
+
+def post_worker_init(worker):
+    from utils.process_stats import memory_usage
+
+    usage = memory_usage()
+    worker.log.info(
+        "Worker %s ready: rss=%.1fMB pss=%.1fMB shared=%.1fMB private=%.1fMB",
+        usage['pid'], usage['rss_mb'], usage['pss_mb'], usage['shared_mb'], usage['private_mb']
+    )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if owns_metrics_dir:
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+import time
+
+
+class _PendingPrediction:
+    __slots__ = ('image', 'event', 'result', 'error', 'cancelled')
+
+    def __init__(self, image):
+        self.image = image
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size=None, max_wait_ms=None, timeout_ms=None):
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv('MICROBATCH_MAX_SIZE', '8'))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv('MICROBATCH_WAIT_MS', '5'))
+        if timeout_ms is None:
+            timeout_ms = float(os.getenv('MICROBATCH_TIMEOUT_MS', '30000'))
+
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000.0
+        self.timeout = timeout_ms / 1000.0 if timeout_ms > 0 else None
+
+        self._queue = None
+        self._owner_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each preforked worker starts its own scheduler.
+        if self._owner_pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            worker = threading.Thread(target=self._run, args=(self._queue,), name='micro-batcher', daemon=True)
+            worker.start()
+            self._owner_pid = os.getpid()
+
+    def submit(self, image, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        self._ensure_worker()
+        pending = _PendingPrediction(image)
+        self._queue.put(pending)
+
+        if not pending.event.wait(timeout):
+            pending.cancelled = True
+            raise TimeoutError('Timed out waiting for batched inference')
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self, pending_queue):
+        batch = [pending_queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(pending_queue.get(timeout=remaining))
+                else:
+                    batch.append(pending_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return [pending for pending in batch if not pending.cancelled]
+
+    def _run(self, pending_queue):
+        while True:
+            batch = self._collect(pending_queue)
+            if not batch:
+                continue
+
+            try:
+                outputs = self.predict_batch([pending.image for pending in batch], batch_size=len(batch))
+                for pending, result in zip(batch, outputs):
+                    pending.result = result
+            except Exception as exc:
+                for pending in batch:
+                    pending.error = exc
+
+            for pending in batch:
+                pending.event.set()
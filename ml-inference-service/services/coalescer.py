@@ -0,0 +1,66 @@
+import os
+import threading
+
+from utils import telemetry
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution: the first runs it, the rest wait for its outcome.
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'
+
+        self.enabled = enabled
+        self.executions = 0
+        self.coalesced = 0
+
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func):
+        # Returns (result, shared); an exception raised by the shared execution is raised in every caller.
+        if key is None or not self.enabled:
+            return func(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            telemetry.coalesced_total.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_progress': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+SUPPORTED_BACKENDS = ('torch', 'onnx', 'openvino')
+EXPORT_DIR_NAME = '.exported'
+
+
+def import_runtime():
+    # torch and Ultralytics are imported on first use so the app module loads quickly;
+    # calling this up front lets startup time the import on its own.
+    import torch  # noqa: F401
+    import ultralytics  # noqa: F401
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    # Modification time and size, or None if the file is missing.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def export_cache_dir(model_path, model_hash):
+    checkpoint = Path(model_path)
+    return checkpoint.parent / EXPORT_DIR_NAME / f'{checkpoint.stem}-{model_hash[:16]}'
+
+
+def _artifact_name(model_path, backend):
+    stem = Path(model_path).stem
+    # Ultralytics picks the runtime from these suffixes when loading.
+    if backend == 'onnx':
+        return f'{stem}.onnx'
+    return f'{stem}_openvino_model'
+
+
+def _load_fused(model_path, model_hash):
+    from ultralytics import YOLO
+
+    if os.getenv('FUSED_MODEL_CACHE', 'true').lower() != 'true':
+        return YOLO(model_path)
+
+    artifact = export_cache_dir(model_path, model_hash) / f'{Path(model_path).stem}_fused.pt'
+    if artifact.exists():
+        try:
+            return YOLO(str(artifact))
+        except Exception as exc:
+            print(f"Could not load fused model {artifact}, using {model_path}: {exc}")
+            return YOLO(model_path)
+
+    import torch
+
+    model = YOLO(model_path)
+    model.fuse()
+
+    # Same checkpoint layout Ultralytics reads; an already-fused model skips fusion on load.
+    temp_path = artifact.with_name(f'.{artifact.name}.tmp-{os.getpid()}')
+    try:
+        artifact.parent.mkdir(parents=True, exist_ok=True)
+        torch.save({'model': model.model, 'train_args': dict(model.model.args)}, temp_path)
+        os.replace(temp_path, artifact)
+    except Exception as exc:
+        temp_path.unlink(missing_ok=True)
+        print(f"Could not cache fused model at {artifact}: {exc}")
+    return model
+
+
+def load_model(model_path, backend, model_hash, imgsz=640):
+    from ultralytics import YOLO
+
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"Unsupported MODEL_BACKEND '{backend}' (expected one of: {', '.join(SUPPORTED_BACKENDS)})"
+        )
+
+    if Path(model_path).suffix == '.onnx':
+        # Already-exported graphs (e.g. INT8 models from ml-training/quantize.py) carry their own names.
+        model = YOLO(model_path, task='detect')
+        return model, model.names
+
+    if backend == 'torch':
+        model = _load_fused(model_path, model_hash)
+        return model, model.names
+
+    export_dir = export_cache_dir(model_path, model_hash) / backend
+    if not export_dir.exists():
+        _export(model_path, backend, export_dir, imgsz)
+
+    names = json.loads((export_dir / 'names.json').read_text())
+    if isinstance(names, dict):
+        names = {int(key): value for key, value in names.items()}
+
+    return YOLO(str(export_dir / _artifact_name(model_path, backend)), task='detect'), names
+
+
+def _export(model_path, backend, export_dir, imgsz):
+    from ultralytics import YOLO
+
+    # Built in a private directory and renamed into place in one step, so export_dir only ever holds a complete
+    # artifact with its names.json. Ultralytics writes the export next to the checkpoint, hence the private copy.
+    temp_dir = export_dir.with_name(f'.{export_dir.name}.tmp-{os.getpid()}')
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    try:
+        checkpoint_copy = temp_dir / Path(model_path).name
+        shutil.copyfile(model_path, checkpoint_copy)
+        checkpoint = YOLO(str(checkpoint_copy))
+        exported = Path(checkpoint.export(format=backend, imgsz=imgsz, dynamic=True, half=False))
+
+        artifact = temp_dir / _artifact_name(model_path, backend)
+        if exported != artifact:
+            shutil.move(str(exported), str(artifact))
+        (temp_dir / 'names.json').write_text(json.dumps(checkpoint.names))
+        checkpoint_copy.unlink()
+
+        try:
+            os.replace(temp_dir, export_dir)
+        except OSError:
+            # Another worker finished the same export first; its copy is equivalent.
+            if not export_dir.exists():
+                raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
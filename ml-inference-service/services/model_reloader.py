@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from services.model_backends import file_signature
+from utils import telemetry
+
+
+class ModelReloader:
+    def __init__(self, factory, watch_interval=None, warmup_runs=None, background=None, prepare=None,
+                 startup_timings=None):
+        if watch_interval is None:
+            watch_interval = float(os.getenv('MODEL_WATCH_INTERVAL', '10'))
+        if warmup_runs is None:
+            warmup_runs = int(os.getenv('WARMUP_RUNS', '3'))
+        if background is None:
+            background = os.getenv('MODEL_BACKGROUND_LOAD', 'false').lower() == 'true'
+
+        self.factory = factory
+        self.watch_interval = watch_interval
+        self.warmup_runs = max(warmup_runs, 1)
+        self.prepare = prepare
+        self.service = None
+        self.loaded_at = None
+        self.reload_count = 0
+        self.last_error = None
+        self.startup_timings = dict(startup_timings or {})
+        self.startup_error = None
+
+        self._file_signature = None
+        self._reload_lock = threading.Lock()
+        # Guards starting the loader, watcher and reload threads.
+        self._lock = threading.Lock()
+        self._startup_pid = None
+        self._watch_pid = None
+        self._reload_pending = False
+
+        if background:
+            self.ensure_started()
+        else:
+            self._start()
+
+    @property
+    def ready(self):
+        return self.service is not None
+
+    @property
+    def reloading(self):
+        return self._reload_pending or self._reload_lock.locked()
+
+    def _warm_up(self, service):
+        # Kept out of the metrics, which should only count real traffic.
+        frame = np.zeros((640, 640, 3), dtype=np.uint8)
+        with telemetry.suppressed():
+            for _ in range(self.warmup_runs):
+                service.predict(frame)
+
+    def _start(self):
+        timings = self.startup_timings
+        started = time.perf_counter()
+        try:
+            if self.prepare is not None:
+                phase_start = time.perf_counter()
+                self.prepare()
+                timings['runtime_import_ms'] = (time.perf_counter() - phase_start) * 1000
+
+            phase_start = time.perf_counter()
+            service = self.factory()
+            timings['model_load_ms'] = (time.perf_counter() - phase_start) * 1000
+
+            phase_start = time.perf_counter()
+            self._warm_up(service)
+            timings['warmup_ms'] = (time.perf_counter() - phase_start) * 1000
+        except Exception as exc:
+            self.startup_error = str(exc)
+            raise
+
+        timings['startup_ms'] = (time.perf_counter() - started) * 1000
+        # Taken by the service before it read the weights, so a deploy that landed during startup is picked up.
+        self._file_signature = service.model_signature
+        self.loaded_at = time.time()
+        # Assigned last: this is what flips /ready.
+        self.service = service
+
+        phases = ' '.join(f"{name}={value:.0f}" for name, value in timings.items())
+        print(f"Model ready in pid {os.getpid()} ({self.warmup_runs} warmup runs): {phases}")
+
+    def ensure_started(self):
+        # Loader threads do not survive fork, so a worker forked mid-load starts its own.
+        with self._lock:
+            if self.service is not None or self._startup_pid == os.getpid():
+                return
+            self._startup_pid = os.getpid()
+
+        def run():
+            try:
+                self._start()
+            except Exception as exc:
+                print(f"Model startup failed: {exc}")
+
+        threading.Thread(target=run, name='model-startup', daemon=True).start()
+
+    def reload(self):
+        with self._reload_lock:
+            signature = file_signature(self.service.model_path)
+            try:
+                candidate = self.factory()
+                self._warm_up(candidate)
+            except Exception as exc:
+                self.last_error = str(exc)
+                # Remember the broken file so the watcher waits for the next deploy instead of retrying it.
+                self._file_signature = signature
+                raise
+
+            # In-flight requests keep their reference to the old service until they finish.
+            self.service = candidate
+            self.loaded_at = time.time()
+            self.reload_count += 1
+            self.last_error = None
+            # The file as the new service found it before reading the weights: a deploy that landed
+            # mid-load differs and is picked up next.
+            self._file_signature = candidate.model_signature
+            return candidate
+
+    def reload_async(self):
+        with self._lock:
+            if not self.ready or self.reloading:
+                return False
+            # Set until the thread finishes, so a second caller cannot start another reload before it takes the lock.
+            self._reload_pending = True
+
+        def run():
+            try:
+                self.reload()
+            except Exception as exc:
+                print(f"Model reload failed: {exc}")
+            finally:
+                self._reload_pending = False
+
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+        return True
+
+    def request_reload(self):
+        # Reloads this worker, and touches the model file so every other worker's watcher reloads it too.
+        # Returns (started here, other workers notified).
+        notified = False
+        if self.watch_interval > 0:
+            try:
+                os.utime(self.service.model_path)
+                notified = True
+            except OSError as exc:
+                print(f"Could not touch {self.service.model_path} to notify other workers: {exc}")
+        return self.reload_async(), notified
+
+    def ensure_watching(self):
+        # Watcher threads do not survive fork, so each preforked worker starts its own.
+        with self._lock:
+            if self.watch_interval <= 0 or self._watch_pid == os.getpid():
+                return
+            self._watch_pid = os.getpid()
+
+        threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            if not self.ready:
+                continue
+
+            signature = file_signature(self.service.model_path)
+            if signature is None or signature == self._file_signature or self.reloading:
+                continue
+
+            try:
+                self.reload()
+                print(f"Reloaded model {self.service.model_name} ({self.service.model_hash[:12]})")
+            except Exception as exc:
+                print(f"Model reload failed: {exc}")
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'model_hash': self.service.model_hash if self.ready else None,
+            'loaded_at': datetime.fromtimestamp(self.loaded_at, tz=timezone.utc).isoformat() if self.ready else None,
+            'reload_count': self.reload_count,
+            'reloading': self.reloading,
+            'last_reload_error': self.last_error
+        }
+
+    def readiness(self):
+        return {
+            'ready': self.ready,
+            'model_hash': self.service.model_hash if self.ready else None,
+            'warmup_runs': self.warmup_runs,
+            'startup_timings_ms': self.startup_timings,
+            'startup_error': self.startup_error
+        }
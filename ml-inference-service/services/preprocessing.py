@@ -2,29 +2,66 @@ from PIL import Image
 import cv2
 import numpy as np
 from io import BytesIO
+import os
+
+from utils import telemetry
+
+GREEN_LOWER = np.array([40, 50, 50])
+GREEN_UPPER = np.array([80, 255, 255])
+INPUT_SCALE = np.float32(1 / 255)
+
+
+def write_model_input(images, out):
+    # Letterboxed uint8 HWC frames -> float32 NCHW in [0, 1], in one pass per frame straight into `out`.
+    # Ultralytics treats numpy frames as BGR and reverses the channels; the same reversal is applied
+    # here so the model receives exactly the tensor it did when frames went through Ultralytics.
+    for image, target in zip(images, out):
+        np.multiply(image[:, :, ::-1].transpose(2, 0, 1), INPUT_SCALE, out=target, dtype=np.float32)
+    return out
 
 
 class ImagePreprocessor:
     def __init__(self):
         self.target_size = (640, 640)
+        self.reduced_decode = os.getenv('REDUCED_JPEG_DECODE', 'true').lower() == 'true'
 
-    def preprocess(self, image_bytes):
+    def preprocess(self, image):
         try:
-            image = Image.open(BytesIO(image_bytes))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            if isinstance(image, (bytes, bytearray)):
+                image = Image.open(BytesIO(image))
 
-            image_array = np.array(image)
-            image_array = self._resize_with_aspect_ratio(image_array)
-            return image_array
+            with telemetry.stage_timer('decode'):
+                source_size = image.size
+                if self.reduced_decode and image.format == 'JPEG':
+                    # Let libjpeg decode at the smallest 1/2, 1/4 or 1/8 scale that still covers the target.
+                    image.draft('RGB', self._scaled_size(source_size))
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+
+                image_array = np.asarray(image)
+
+            with telemetry.stage_timer('letterbox'):
+                return self._resize_with_aspect_ratio(image_array, source_size=source_size)
         except Exception as exc:
             raise ValueError(f"Error preprocessing image: {exc}")
 
-    def _resize_with_aspect_ratio(self, image, target_size=None):
+    def _scaled_size(self, source_size, target_size=None):
         if target_size is None:
             target_size = self.target_size
 
-        h, w = image.shape[:2]
+        w, h = source_size
+        target_w, target_h = target_size
+        scale = min(target_w / w, target_h / h)
+        return (int(w * scale), int(h * scale))
+
+    def _resize_with_aspect_ratio(self, image, target_size=None, source_size=None):
+        if target_size is None:
+            target_size = self.target_size
+
+        if source_size is None:
+            h, w = image.shape[:2]
+        else:
+            w, h = source_size
         target_w, target_h = target_size
         scale = min(target_w / w, target_h / h)
         new_w = int(w * scale)
@@ -48,16 +85,12 @@ class ImagePreprocessor:
 
     def extract_features(self, image):
         try:
-            if len(image.shape) == 3:
-                hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-                gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            if len(image.shape) == 3 and image.shape[2] == 3:
+                leaf_color_index, surface_pattern_score, structural_features = self._extract_fused(image)
             else:
-                hsv = image
-                gray = image
-
-            leaf_color_index = self._calculate_color_index(hsv)
-            surface_pattern_score = self._calculate_pattern_score(gray)
-            structural_features = self._estimate_structure(image)
+                leaf_color_index = self._calculate_color_index(image)
+                surface_pattern_score = self._calculate_pattern_score(image)
+                structural_features = self._estimate_structure(image)
 
             return {
                 'leaf_color_index': float(leaf_color_index),
@@ -74,10 +107,52 @@ class ImagePreprocessor:
                 }
             }
 
+    def _content_box(self, image, margin=2):
+        h, w = image.shape[:2]
+        rows = np.flatnonzero(image.reshape(h, -1).any(axis=1))
+        if rows.size == 0:
+            return None
+
+        band = image[rows[0]:rows[-1] + 1].reshape(-1, w * image.shape[2])
+        cols = np.flatnonzero(band.any(axis=0).reshape(w, -1).any(axis=1))
+        # Keep a thin black margin so Canny sees the same content/padding border as on the full frame.
+        return (
+            max(rows[0] - margin, 0),
+            min(rows[-1] + 1 + margin, h),
+            max(cols[0] - margin, 0),
+            min(cols[-1] + 1 + margin, w)
+        )
+
+    def _extract_fused(self, image):
+        frame_pixels = image.shape[0] * image.shape[1]
+        box = self._content_box(image)
+        if box is None:
+            return 0.0, 0.0, self._structure_summary(0.0, 0)
+
+        top, bottom, left, right = box
+        roi = image[top:bottom, left:right]
+        gray = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+        hsv = cv2.cvtColor(roi, cv2.COLOR_RGB2HSV)
+
+        green_pixels = cv2.countNonZero(cv2.inRange(hsv, GREEN_LOWER, GREEN_UPPER))
+        color_index = min(max(green_pixels / frame_pixels, 0), 1)
+
+        # Padding is all zeros, so full-frame moments follow directly from the ROI moments.
+        mean, stddev = cv2.meanStdDev(gray)
+        roi_mean = float(mean[0, 0])
+        roi_share = gray.size / frame_pixels
+        frame_mean = roi_mean * roi_share
+        variance = (float(stddev[0, 0]) ** 2 + roi_mean ** 2) * roi_share - frame_mean ** 2
+        pattern_score = min(max(variance, 0.0) / 1000, 1.0)
+
+        edges = cv2.Canny(gray, 50, 150)
+        edge_density = cv2.countNonZero(edges) / frame_pixels
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        return color_index, pattern_score, self._structure_summary(edge_density, len(contours))
+
     def _calculate_color_index(self, hsv_image):
-        lower_green = np.array([40, 50, 50])
-        upper_green = np.array([80, 255, 255])
-        mask = cv2.inRange(hsv_image, lower_green, upper_green)
+        mask = cv2.inRange(hsv_image, GREEN_LOWER, GREEN_UPPER)
         green_pixels = np.sum(mask > 0)
         total_pixels = hsv_image.shape[0] * hsv_image.shape[1]
         color_index = green_pixels / total_pixels if total_pixels > 0 else 0.5
@@ -97,23 +172,24 @@ class ImagePreprocessor:
 
             edges = cv2.Canny(gray, 50, 150)
             edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
-
-            if edge_density < 0.1:
-                thickness = 'thin'
-            elif edge_density < 0.3:
-                thickness = 'medium'
-            else:
-                thickness = 'thick'
-
             contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            leaf_count = min(len(contours), 20)
 
-            return {
-                'thickness_estimate': thickness,
-                'leaf_count_visible': int(leaf_count)
-            }
+            return self._structure_summary(edge_density, len(contours))
         except Exception:
             return {
                 'thickness_estimate': 'medium',
                 'leaf_count_visible': 0
             }
+
+    def _structure_summary(self, edge_density, contour_count):
+        if edge_density < 0.1:
+            thickness = 'thin'
+        elif edge_density < 0.3:
+            thickness = 'medium'
+        else:
+            thickness = 'thick'
+
+        return {
+            'thickness_estimate': thickness,
+            'leaf_count_visible': int(min(contour_count, 20))
+        }
@@ -1,8 +1,14 @@
 import os
+import threading
 from pathlib import Path
 
-import torch
-from ultralytics import YOLO
+import numpy as np
+
+from services.model_backends import file_sha256, file_signature, load_model
+from services.preprocessing import write_model_input
+from utils import telemetry
+
+PREDICTION_COLUMNS = ('class', 'confidence', 'x', 'y', 'width', 'height')
 
 
 class YOLOService:
@@ -13,9 +19,22 @@ class YOLOService:
         if not Path(self.model_path).exists():
             raise FileNotFoundError(f"YOLO model not found at: {self.model_path}")
 
-        self.model = YOLO(self.model_path)
+        if Path(self.model_path).suffix == '.onnx':
+            self.backend = 'onnx'
+        else:
+            self.backend = os.getenv('MODEL_BACKEND', 'torch').lower()
+        # Taken before the weights are read, so the reloader notices a file replaced during the load.
+        self.model_signature = file_signature(self.model_path)
+        self.model_hash = file_sha256(self.model_path)
+        self.model, checkpoint_names = load_model(self.model_path, self.backend, self.model_hash)
         self.model_name = Path(self.model_path).name
-        self.class_names = self._infer_class_names()
+        self.class_names = self._infer_class_names(checkpoint_names)
+        self._class_lookup = np.array(self.class_names + ['unknown'], dtype=object)
+        self.batch_max = max(int(os.getenv('BATCH_MAX', '16')), 1)
+        self.conf_threshold = 0.25
+        self.iou_threshold = 0.45
+        self.direct_input = os.getenv('DIRECT_TENSOR_INPUT', 'true').lower() == 'true'
+        self._input_buffers = threading.local()
 
     def _resolve_model_path(self, model_path):
         if model_path is None:
@@ -34,6 +53,8 @@ class YOLOService:
             self._patch_torch_load(weights_only=False)
 
     def _patch_torch_load(self, weights_only=False):
+        import torch
+
         if getattr(torch.load, '__aloevera_patched__', False):
             return
 
@@ -47,12 +68,13 @@ class YOLOService:
         load_wrapper.__aloevera_patched__ = True
         torch.load = load_wrapper
 
-    def _infer_class_names(self):
+    def _infer_class_names(self, names=None):
         override = os.getenv('MODEL_CLASSES')
         if override:
             return [item.strip() for item in override.split(',') if item.strip()]
 
-        names = getattr(self.model, 'names', None)
+        if names is None:
+            names = getattr(self.model, 'names', None)
         if isinstance(names, dict):
             return [names[i] for i in sorted(names.keys())]
         if isinstance(names, (list, tuple)):
@@ -70,44 +92,145 @@ class YOLOService:
             'spider_mite'
         ]
 
+    def model_identity(self):
+        # Identity of the weights actually loaded, so a file replaced on disk
+        # only invalidates cached predictions once the new model is serving.
+        return (
+            self.model_path,
+            self.backend,
+            self.model_hash,
+            self.conf_threshold,
+            self.iou_threshold
+        )
+
     def predict(self, image):
-        results = self.model(image, conf=0.25, iou=0.45)
-        predictions = []
-
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = int(box.cls[0].cpu().numpy())
-
-                if class_id < len(self.class_names):
-                    class_name = self.class_names[class_id]
-                else:
-                    class_name = 'unknown'
-
-                predictions.append({
-                    'class': class_name,
-                    'confidence': confidence,
-                    'bounding_box': {
-                        'x': float(x1),
-                        'y': float(y1),
-                        'width': float(x2 - x1),
-                        'height': float(y2 - y1)
-                    }
-                })
-
-        if not predictions:
-            predictions.append({
-                'class': 'healthy',
-                'confidence': 0.5,
-                'bounding_box': {
-                    'x': 0.0,
-                    'y': 0.0,
-                    'width': 0.0,
-                    'height': 0.0
-                }
-            })
-
-        predictions.sort(key=lambda item: item['confidence'], reverse=True)
-        return predictions
+        columns = self._merge_columns([self._format_result(detections) for detections in self._detect([image])])
+        return self._to_records(self._finalize_columns(columns))
+
+    def predict_batch(self, images, batch_size=None, columnar=False):
+        if batch_size is None:
+            batch_size = self.batch_max
+
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            for detections in self._detect(images[start:start + batch_size]):
+                columns = self._finalize_columns(self._format_result(detections))
+                outputs.append(columns if columnar else self._to_records(columns))
+        return outputs
+
+    def _detect(self, images):
+        # Returns one (n, 6) array of x1, y1, x2, y2, confidence, class per image.
+        if not self._accepts_direct_input(images):
+            with telemetry.stage_timer('forward'):
+                results = self.model(images, conf=self.conf_threshold, iou=self.iou_threshold)
+            return [result.boxes.data.cpu().numpy() for result in results]
+
+        import torch
+        from ultralytics.utils import ops
+
+        # The frames are already letterboxed to the model input size, so skip Ultralytics' second
+        # letterbox, layout conversion and Results bookkeeping and call its backend directly.
+        backend = self._backend()
+        batch = torch.from_numpy(self._input_tensor(images)).to(backend.device)
+        if backend.fp16:
+            batch = batch.half()
+
+        with telemetry.stage_timer('forward'), torch.inference_mode():
+            predictions = backend(batch)
+            detections = ops.non_max_suppression(predictions, self.conf_threshold, self.iou_threshold)
+
+        # Boxes are already in frame coordinates; clip them to the frame as Ultralytics does.
+        height, width = images[0].shape[:2]
+        outputs = []
+        for detection in detections:
+            detection = detection.float().cpu().numpy()
+            np.clip(detection[:, 0:4:2], 0, width, out=detection[:, 0:4:2])
+            np.clip(detection[:, 1:4:2], 0, height, out=detection[:, 1:4:2])
+            outputs.append(detection)
+        return outputs
+
+    def _accepts_direct_input(self, images):
+        if not self.direct_input or not images or not isinstance(images[0], np.ndarray):
+            return False
+
+        shape = images[0].shape
+        return (
+            len(shape) == 3 and shape[2] == 3 and shape[0] % 32 == 0 and shape[1] % 32 == 0
+            and all(isinstance(image, np.ndarray) and image.shape == shape for image in images)
+        )
+
+    def _backend(self):
+        predictor = self.model.predictor
+        if predictor is None or predictor.model is None:
+            # The first call through Ultralytics builds (and fuses) its AutoBackend; later calls reuse it.
+            self.model(np.zeros((640, 640, 3), dtype=np.uint8), conf=self.conf_threshold, iou=self.iou_threshold)
+            predictor = self.model.predictor
+        return predictor.model
+
+    def _input_tensor(self, images):
+        # Reused per thread: concurrent requests each fill their own buffer.
+        shape = (len(images), 3) + images[0].shape[:2]
+        buffer = getattr(self._input_buffers, 'array', None)
+        if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+            buffer = np.empty(shape, dtype=np.float32)
+            self._input_buffers.array = buffer
+        return write_model_input(images, buffer[:shape[0]])
+
+    def _format_result(self, detections):
+        # One device->host transfer per image instead of three per box.
+        xyxy = detections[:, :4]
+        confidence = detections[:, 4]
+        class_ids = detections[:, 5].astype(np.int64)
+
+        order = np.argsort(-confidence, kind='stable')
+        xyxy = xyxy[order]
+        confidence = confidence[order]
+        class_ids = np.where(class_ids[order] < len(self.class_names), class_ids[order], len(self.class_names))
+        class_names = self._class_lookup[class_ids].tolist()
+        telemetry.record_detections(class_names)
+
+        return {
+            'class': class_names,
+            'confidence': confidence.tolist(),
+            'x': xyxy[:, 0].tolist(),
+            'y': xyxy[:, 1].tolist(),
+            'width': (xyxy[:, 2] - xyxy[:, 0]).tolist(),
+            'height': (xyxy[:, 3] - xyxy[:, 1]).tolist()
+        }
+
+    def _merge_columns(self, column_sets):
+        if len(column_sets) == 1:
+            return column_sets[0]
+
+        merged = {key: [] for key in PREDICTION_COLUMNS}
+        for columns in column_sets:
+            for key in PREDICTION_COLUMNS:
+                merged[key].extend(columns[key])
+
+        order = sorted(range(len(merged['confidence'])), key=lambda i: merged['confidence'][i], reverse=True)
+        return {key: [values[i] for i in order] for key, values in merged.items()}
+
+    def _finalize_columns(self, columns):
+        if not columns['confidence']:
+            telemetry.record_fallback('no_detections')
+            return {
+                'class': ['healthy'],
+                'confidence': [0.5],
+                'x': [0.0],
+                'y': [0.0],
+                'width': [0.0],
+                'height': [0.0]
+            }
+        return columns
+
+    def _to_records(self, columns):
+        return [
+            {
+                'class': class_name,
+                'confidence': confidence,
+                'bounding_box': {'x': x, 'y': y, 'width': width, 'height': height}
+            }
+            for class_name, confidence, x, y, width, height in zip(
+                *(columns[key] for key in PREDICTION_COLUMNS)
+            )
+        ]
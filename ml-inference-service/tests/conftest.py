@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service imports its packages (services, utils, benchmarks) from its own root.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.feature_extraction import fixture_images
+from benchmarks.images import aloe_image
+from services.preprocessing import ImagePreprocessor
+
+
+def legacy_features(preprocessor, image):
+    # extract_features before the fused pass: each feature computed separately on the full padded frame.
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return (
+        preprocessor._calculate_color_index(hsv),
+        preprocessor._calculate_pattern_score(gray),
+        preprocessor._estimate_structure(image)
+    )
+
+
+def cases():
+    preprocessor = ImagePreprocessor()
+    images = fixture_images()
+    for width, height in ((640, 640), (4032, 3024), (3024, 4032), (1200, 300)):
+        images.append((f'aloe-{width}x{height}', preprocessor._resize_with_aspect_ratio(aloe_image(width, height))))
+    images.append(('black', np.zeros((640, 640, 3), dtype=np.uint8)))
+    return images
+
+
+@pytest.mark.parametrize('name,image', cases(), ids=lambda value: value if isinstance(value, str) else '')
+def test_fused_matches_legacy(name, image):
+    preprocessor = ImagePreprocessor()
+    color_index, pattern_score, structure = legacy_features(preprocessor, image)
+    fused_color_index, fused_pattern_score, fused_structure = preprocessor._extract_fused(image)
+
+    assert fused_color_index == pytest.approx(color_index, abs=1e-9)
+    assert fused_pattern_score == pytest.approx(pattern_score, abs=1e-6)
+    assert fused_structure == structure
+
+
+def test_extract_features_uses_fused_result():
+    preprocessor = ImagePreprocessor()
+    image = preprocessor._resize_with_aspect_ratio(aloe_image(1280, 720))
+    color_index, pattern_score, structure = preprocessor._extract_fused(image)
+
+    assert preprocessor.extract_features(image) == {
+        'leaf_color_index': float(color_index),
+        'surface_pattern_score': float(pattern_score),
+        'structural_features': structure
+    }
@@ -1,24 +1,37 @@
 from PIL import Image
 from io import BytesIO
 
+MAX_FILE_SIZE = 10 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+SUPPORTED_FORMATS = ('JPEG', 'PNG', 'JPG', 'WEBP')
+
+
+def read_upload(image_file, max_bytes=MAX_FILE_SIZE):
+    buffer = bytearray()
+    while True:
+        chunk = image_file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return bytes(buffer)
+
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            return None
+
 
 def validate_image(image_file):
     try:
         if not image_file:
             return {'valid': False, 'error': 'No file provided'}
 
-        image_file.seek(0, 2)
-        file_size = image_file.tell()
-        image_file.seek(0)
-
-        if file_size > 10 * 1024 * 1024:
+        image_bytes = read_upload(image_file)
+        if image_bytes is None:
             return {'valid': False, 'error': 'File size exceeds 10MB limit'}
 
         try:
-            image = Image.open(BytesIO(image_file.read()))
-            image_file.seek(0)
+            # Image.open only parses the header; pixels are decoded once, later, by the preprocessor.
+            image = Image.open(BytesIO(image_bytes))
 
-            if image.format not in ['JPEG', 'PNG', 'JPG', 'WEBP']:
+            if image.format not in SUPPORTED_FORMATS:
                 return {'valid': False, 'error': f'Unsupported image format: {image.format}'}
 
             width, height = image.size
@@ -28,7 +41,7 @@ def validate_image(image_file):
             if width > 5000 or height > 5000:
                 return {'valid': False, 'error': 'Image dimensions too large (maximum 5000x5000)'}
 
-            return {'valid': True}
+            return {'valid': True, 'image': image, 'image_bytes': image_bytes}
         except Exception as exc:
             return {'valid': False, 'error': f'Invalid image file: {exc}'}
     except Exception as exc:
@@ -1,10 +1,12 @@
 
 def calculate_confidence_score(yolo_predictions, visual_features):
     try:
-        if yolo_predictions:
-            max_confidence = max([pred.get('confidence', 0) for pred in yolo_predictions])
+        if isinstance(yolo_predictions, dict):
+            confidences = yolo_predictions.get('confidence', [])
         else:
-            max_confidence = 0.5
+            confidences = [pred.get('confidence', 0) for pred in yolo_predictions or []]
+
+        max_confidence = max(confidences) if confidences else 0.5
 
         color_index = visual_features.get('leaf_color_index', 0.5)
         pattern_score = visual_features.get('surface_pattern_score', 0.5)
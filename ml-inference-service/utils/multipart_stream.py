@@ -0,0 +1,56 @@
+from io import BytesIO
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+from utils.image_utils import MAX_FILE_SIZE, READ_CHUNK_SIZE
+
+
+class StreamedUpload:
+    # Enough of werkzeug's FileStorage for validate_image.
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._buffer = BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+def iter_uploads(stream, content_type, field_name, max_bytes=MAX_FILE_SIZE):
+    # Iterates over the files of `field_name`, each as soon as its part has been received, holding
+    # one file in memory at a time. Files over max_bytes are truncated just past the limit so
+    # validation still rejects them.
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected a multipart/form-data request')
+
+    return _read_parts(stream, MultipartDecoder(boundary.encode('latin-1')), field_name, max_bytes)
+
+
+def _read_parts(stream, decoder, field_name, max_bytes):
+    current = None
+
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        decoder.receive_data(chunk or None)
+
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                current = (event.filename, bytearray()) if event.name == field_name else None
+            elif isinstance(event, Data):
+                if current is not None:
+                    filename, buffer = current
+                    if len(buffer) <= max_bytes:
+                        buffer.extend(event.data)
+                    if not event.more_data:
+                        yield StreamedUpload(filename, bytes(buffer))
+                        current = None
+            else:
+                # Non-file form fields are ignored.
+                current = None
+            event = decoder.next_event()
+
+        if isinstance(event, Epilogue) or not chunk:
+            return
@@ -0,0 +1,56 @@
+import os
+import sys
+
+
+def _read_kb_fields(path, fields):
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in fields:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def memory_usage(pid='self'):
+    # smaps_rollup separates pages shared with the preforked parent from private ones.
+    fields = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+    values = _read_kb_fields(f'/proc/{pid}/smaps_rollup', fields)
+    if not values:
+        values = {'Rss': _read_kb_fields(f'/proc/{pid}/status', ('VmRSS',)).get('VmRSS', 0)}
+
+    shared = values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0)
+    private = values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    return {
+        'pid': os.getpid() if pid == 'self' else int(pid),
+        'rss_mb': values.get('Rss', 0) / 1024,
+        'pss_mb': values.get('Pss', 0) / 1024,
+        'shared_mb': shared / 1024,
+        'private_mb': private / 1024
+    }
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(item) for item in f.read().split()]
+    except OSError:
+        return []
+
+
+if __name__ == '__main__':
+    master_pid = int(sys.argv[1])
+    workers = [memory_usage(pid) for pid in child_pids(master_pid)]
+
+    for usage in workers:
+        print(
+            f"worker {usage['pid']:>7}  rss {usage['rss_mb']:8.1f} MB  pss {usage['pss_mb']:8.1f} MB  "
+            f"shared {usage['shared_mb']:8.1f} MB  private {usage['private_mb']:8.1f} MB"
+        )
+
+    total_rss = sum(usage['rss_mb'] for usage in workers)
+    total_pss = sum(usage['pss_mb'] for usage in workers)
+    print(f"{len(workers)} workers: sum RSS {total_rss:.1f} MB (independent loads) vs sum PSS {total_pss:.1f} MB (actual)")
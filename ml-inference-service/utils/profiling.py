@@ -0,0 +1,154 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+
+INLINE_STATS_LIMIT = 40
+# Inline summaries list this service's own functions; the .prof files keep everything.
+SERVICE_ROOT = re.escape(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_REQUEST_ID_PATTERN = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class ProfileSession:
+    # cProfile only sees the thread that enabled it, so work handed to other threads goes through run().
+    def __init__(self, request_id, endpoint, inline):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.inline = inline
+        self.started = time.time()
+        self.stopped = False
+        self._profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._profile.enable()
+        return self
+
+    def run(self, func, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the main profiler and allows only one at a time.
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    def stop(self):
+        if not self.stopped:
+            self._profile.disable()
+            self.stopped = True
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        with self._lock:
+            if self._thread_profiles:
+                stats.add(*self._thread_profiles)
+        return stats
+
+    def summary(self, stats, limit=INLINE_STATS_LIMIT):
+        stats.stream = io.StringIO()
+        stats.sort_stats('cumulative').print_stats(SERVICE_ROOT, limit)
+        return {
+            'request_id': self.request_id,
+            'endpoint': self.endpoint,
+            'total_ms': stats.total_tt * 1000,
+            'stats': stats.stream.getvalue()
+        }
+
+
+class RequestProfiler:
+    # Opt-in cProfile capture of single requests:
+    #   - X-Profile: 1 (saved to PROFILE_DIR) or X-Profile: inline (added to the JSON response), with
+    #     X-Admin-Token matching ADMIN_TOKEN;
+    #   - PROFILE_SAMPLE_RATE, the fraction of model requests profiled to PROFILE_DIR.
+    # Both are capped at PROFILE_MAX_PER_MINUTE and one profile at a time per process.
+    def __init__(self, sample_rate=None, max_per_minute=None, output_dir=None, admin_token=None):
+        if sample_rate is None:
+            sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        if max_per_minute is None:
+            max_per_minute = int(os.getenv('PROFILE_MAX_PER_MINUTE', '6'))
+        if output_dir is None:
+            output_dir = os.getenv('PROFILE_DIR', 'profiles')
+        if admin_token is None:
+            admin_token = os.getenv('ADMIN_TOKEN')
+
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.max_per_minute = max_per_minute
+        self.output_dir = output_dir
+        self.admin_token = admin_token
+
+        self.captured = 0
+        self.rate_limited = 0
+        self._recent = []
+        self._active = False
+        self._lock = threading.Lock()
+
+    def start(self, request):
+        # The disabled path is a header lookup and a comparison.
+        mode = request.headers.get('X-Profile')
+        if mode is None:
+            if not self.sample_rate or random.random() >= self.sample_rate:
+                return None
+        elif not self.admin_token or request.headers.get('X-Admin-Token') != self.admin_token:
+            return None
+
+        if not self._claim():
+            return None
+        request_id = _REQUEST_ID_PATTERN.sub('', request.headers.get('X-Request-Id', ''))[:64] or uuid.uuid4().hex
+        return ProfileSession(request_id, request.endpoint, inline=mode == 'inline').start()
+
+    def finish(self, session):
+        # Stops the session, writes <PROFILE_DIR>/<time>-<endpoint>-<request id>.prof and returns its path.
+        try:
+            stats = session.stop()
+            os.makedirs(self.output_dir, exist_ok=True)
+            timestamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(session.started))
+            path = os.path.join(self.output_dir, f'{timestamp}-{session.endpoint}-{session.request_id}.prof')
+            stats.dump_stats(path)
+            return path
+        finally:
+            self.release()
+
+    def summarize(self, session):
+        try:
+            return session.summary(session.stop())
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            self._active = False
+
+    def _claim(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._active:
+                return False
+            self._recent = [at for at in self._recent if now - at < 60]
+            if len(self._recent) >= self.max_per_minute:
+                self.rate_limited += 1
+                return False
+            self._recent.append(now)
+            self._active = True
+            self.captured += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'max_per_minute': self.max_per_minute,
+                'output_dir': self.output_dir,
+                'captured': self.captured,
+                'rate_limited': self.rate_limited,
+                'active': self._active
+            }
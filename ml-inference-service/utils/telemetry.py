@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+STAGES = ('validation', 'decode', 'letterbox', 'forward', 'feature_extraction', 'age_estimation', 'serialization')
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+stage_seconds = Histogram(
+    'ml_stage_duration_seconds', 'Time spent in each inference pipeline stage', ['stage'], buckets=STAGE_BUCKETS
+)
+request_seconds = Histogram(
+    'ml_request_duration_seconds', 'Request latency by endpoint', ['endpoint'], buckets=REQUEST_BUCKETS
+)
+requests_total = Counter('ml_requests_total', 'Requests by endpoint and outcome', ['endpoint', 'outcome'])
+detections_total = Counter('ml_detections_total', 'Detections returned by the model, by class', ['class_name'])
+fallbacks_total = Counter(
+    'ml_fallback_predictions_total', 'Predictions replaced by the default healthy prediction', ['reason']
+)
+queue_depth = Gauge('ml_admission_queue_depth', 'Requests waiting for an inference slot', multiprocess_mode='livesum')
+in_flight = Gauge('ml_admission_in_flight', 'Requests holding an inference slot', multiprocess_mode='livesum')
+queue_wait_seconds = Histogram(
+    'ml_admission_queue_wait_seconds', 'Time admitted requests waited for an inference slot', buckets=STAGE_BUCKETS
+)
+rejections_total = Counter('ml_admission_rejections_total', 'Requests shed by admission control', ['reason'])
+coalesced_total = Counter('ml_coalesced_requests_total', 'Requests answered by an identical request already in flight')
+
+# Label lookups are resolved once; observing a bound child is a lock and two additions.
+_stage_children = {stage: stage_seconds.labels(stage) for stage in STAGES}
+
+# Per-thread switch for inferences that are not traffic, such as model warmup.
+_local = threading.local()
+
+
+@contextmanager
+def suppressed():
+    # Pipeline metrics recorded by this thread inside the block are skipped; other threads keep recording.
+    previous = getattr(_local, 'suppressed', False)
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = previous
+
+
+def _recording():
+    return not getattr(_local, 'suppressed', False)
+
+
+def observe_stage(stage, seconds):
+    if _recording():
+        _stage_children[stage].observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _recording():
+            _stage_children[stage].observe(time.perf_counter() - start)
+
+
+def record_detections(class_names):
+    if not _recording():
+        return
+    for class_name, count in Tally(class_names).items():
+        detections_total.labels(class_name).inc(count)
+
+
+def record_fallback(reason, count=1):
+    if _recording():
+        fallbacks_total.labels(reason).inc(count)
+
+
+def request_outcome(status_code):
+    if status_code == 429:
+        return 'rejected'
+    if status_code == 503:
+        return 'unavailable'
+    if status_code >= 500:
+        return 'error'
+    if status_code >= 400:
+        return 'client_error'
+    return 'success'
+
+
+def render():
+    # Under gunicorn every worker writes to PROMETHEUS_MULTIPROC_DIR and any worker can serve the merged view.
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
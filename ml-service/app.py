@@ -1,12 +1,26 @@
-from flask import Flask, request, jsonify
+import time
+
+# Start of the app import phase reported in the startup timings
+IMPORT_STARTED = time.perf_counter()
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+import json
 import os
-import time
-from services.yolo_inference import YOLOInference
+from services.yolo_inference import YOLOInference, import_runtime
 from services.age_estimation import AgeEstimator
 from services.preprocessing import ImagePreprocessor
+from services.prediction_cache import PredictionCache
+from services.admission import AdmissionController, AdmissionRejected
+from services.coalescer import SingleFlight
+from services.model_reloader import ModelReloader
 from utils.helpers import validate_image, calculate_confidence_score
+from utils.multipart_stream import iter_uploads
+from utils.process_stats import memory_usage
+from utils.profiling import RequestProfiler
+from utils import telemetry
 
 load_dotenv()
 
@@ -14,22 +28,250 @@ app = Flask(__name__)
 CORS(app)
 
 # Initialize services
-yolo_inference = YOLOInference()
+# The reloader owns the active model and swaps in new ones without downtime.
+# With MODEL_BACKGROUND_LOAD=true it loads and warms up the model in a thread
+# while /health already answers.
+model_reloader = ModelReloader(
+    YOLOInference,
+    prepare=import_runtime,
+    startup_timings={'app_import_ms': (time.perf_counter() - IMPORT_STARTED) * 1000}
+)
 age_estimator = AgeEstimator()
 image_preprocessor = ImagePreprocessor()
+prediction_cache = PredictionCache()
+
+# Identical uploads arriving while one is being processed share its pipeline run
+coalescer = SingleFlight()
+
+# Bounded in-flight limit and queue in front of inference (sheds load with 429/503)
+admission = AdmissionController()
+
+# Opt-in cProfile capture of single requests (X-Profile header or PROFILE_SAMPLE_RATE)
+profiler = RequestProfiler()
+
+# Bounded pool for running feature extraction alongside YOLO detection
+# (both torch and OpenCV release the GIL)
+pipeline_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PIPELINE_THREADS', 4)),
+    thread_name_prefix='pipeline'
+)
+
+# Streaming response type for /predict/batch
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Images per forward pass when streaming, kept small so results are emitted progressively
+STREAM_BATCH_MAX = max(int(os.getenv('STREAM_BATCH_MAX', 4)), 1)
+
+def timed(func, *args, stage=None):
+    """
+    Call func and return its result with the elapsed time in milliseconds
+    
+    Args:
+        stage: Optional pipeline stage whose /metrics histogram records the time
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    if stage is not None:
+        telemetry.observe_stage(stage, elapsed)
+    return result, elapsed * 1000
+
+def submit(func, *args, **kwargs):
+    """
+    Run func on the pipeline pool, profiling it too when the request is profiled
+    
+    Returns:
+        concurrent.futures.Future
+    """
+    session = g.get('profile')
+    if session is not None:
+        return pipeline_pool.submit(session.run, func, *args, **kwargs)
+    return pipeline_pool.submit(func, *args, **kwargs)
+
+def serialize(payload):
+    """
+    jsonify a response payload, timed as the serialization stage
+    """
+    with telemetry.stage_timer('serialization'):
+        return jsonify(payload)
+
+def prediction_key(image_bytes, yolo_inference, output_format='records'):
+    """
+    Key an upload by its content and the serving model and thresholds, for the
+    prediction cache and request coalescing
+    
+    Returns:
+        Key string, or None when both are disabled
+    """
+    if not prediction_cache.enabled and not coalescer.enabled:
+        return None
+
+    model_identity = yolo_inference.model_identity()
+    prediction_cache.sync_model(model_identity)
+    return prediction_cache.make_key(image_bytes, model_identity + (output_format,))
+
+# Endpoints that need a loaded model
+MODEL_ENDPOINTS = ('predict', 'predict_batch')
+
+@app.before_request
+def start_model_services():
+    g.request_started = time.perf_counter()
+    model_reloader.ensure_started()
+    model_reloader.ensure_watching()
+    if request.endpoint not in MODEL_ENDPOINTS:
+        return None
+    if not model_reloader.ready:
+        return jsonify({
+            'success': False,
+            'error': 'Model is not ready'
+        }), 503
+
+    # Wait for an inference slot, or fail fast when overloaded
+    try:
+        g.admission_kind = admission_kind()
+        g.admission_started = admission.acquire(request_deadline(), g.admission_kind)
+    except AdmissionRejected as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e),
+            'reason': e.reason
+        })
+        if e.retry_after is not None:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+
+    g.profile = profiler.start(request)
+
+@app.teardown_request
+def save_profile(exc):
+    """
+    Save the request's profile to PROFILE_DIR unless it was returned inline
+    """
+    session = g.pop('profile', None)
+    if session is not None:
+        try:
+            print(f"Saved request profile to {profiler.finish(session)}")
+        except Exception as e:
+            print(f"Could not save request profile: {e}")
+
+@app.teardown_request
+def release_admission(exc):
+    """
+    Give back the request's inference slot
+    
+    Streamed responses keep the request context, so the slot is held until
+    the last line has been sent.
+    """
+    started = g.pop('admission_started', None)
+    if started is not None:
+        admission.release(started, g.pop('admission_kind'))
+
+    # Recorded here rather than in after_request so streamed responses
+    # include the time spent sending every line
+    request_started = g.pop('request_started', None)
+    if request_started is not None and request.endpoint in MODEL_ENDPOINTS:
+        telemetry.request_seconds.labels(request.endpoint).observe(time.perf_counter() - request_started)
+
+@app.after_request
+def count_request(response):
+    """
+    Count model requests by endpoint and outcome for /metrics
+    """
+    if request.endpoint in MODEL_ENDPOINTS:
+        telemetry.requests_total.labels(request.endpoint, telemetry.request_outcome(response.status_code)).inc()
+    return response
+
+@app.after_request
+def attach_profile(response):
+    """
+    Tag profiled responses with X-Profile-Id and add inline profiles to the JSON body
+    
+    Streamed responses are still running here, so their profile is saved at
+    teardown instead.
+    """
+    session = g.get('profile')
+    if session is None:
+        return response
+
+    if session.inline and response.is_json and not response.is_streamed:
+        g.pop('profile')
+        payload = response.get_json()
+        payload['profile'] = profiler.summarize(session)
+        response.set_data(json.dumps(payload))
+    response.headers['X-Profile-Id'] = session.request_id
+    return response
+
+def wants_ndjson():
+    """
+    Whether the client asked for an NDJSON stream
+    """
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def admission_kind():
+    """
+    Kind of model request, each with its own admission service-time estimate
+    
+    A batch or a stream holds its slot far longer than a single image, so
+    sharing one estimate would reject /predict calls on deadline and inflate
+    their Retry-After.
+    """
+    if request.endpoint == 'predict_batch' and wants_ndjson():
+        return 'predict_batch_stream'
+    return request.endpoint
+
+def request_deadline():
+    """
+    Deadline from the X-Request-Timeout-Ms header (the client's remaining
+    time budget for this request)
+    
+    Returns:
+        time.monotonic() deadline, or None if the header is missing or invalid
+    """
+    try:
+        timeout_ms = float(request.headers['X-Request-Timeout-Ms'])
+    except (KeyError, ValueError):
+        return None
+    return time.monotonic() + timeout_ms / 1000
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'ML Inference Service',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'model': model_reloader.status(),
+        'prediction_cache': prediction_cache.stats(),
+        'coalescing': coalescer.stats(),
+        'admission': admission.stats(),
+        'profiling': profiler.stats(),
+        'worker_memory': memory_usage()
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, requests by outcome,
+    detections by class, fallback predictions and admission control
+    """
+    payload, content_type = telemetry.render()
+    return Response(payload, content_type=content_type)
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: unlike /health, only succeeds once the model is loaded
+    and warmed up
+    """
+    readiness = model_reloader.readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
 @app.route('/predict', methods=['POST'])
 def predict():
     start_time = time.time()
     
+    # In-flight requests keep using this model even if a reload swaps it out
+    yolo_inference = model_reloader.service
+    
     try:
         # Check if image is present
         if 'image' not in request.files:
@@ -41,50 +283,266 @@ def predict():
         image_file = request.files['image']
         
         # Validate image
-        validation_result = validate_image(image_file)
+        validation_result, _ = timed(validate_image, image_file, stage='validation')
         if not validation_result['valid']:
             return jsonify({
                 'success': False,
                 'error': validation_result['error']
             }), 400
 
-        # Preprocess image
-        processed_image = image_preprocessor.preprocess(image_file)
-        
-        # Run YOLO inference for disease detection
-        yolo_predictions = yolo_inference.predict(processed_image)
-        
-        # Extract visual features
-        visual_features = image_preprocessor.extract_features(processed_image)
-        
-        # Estimate age based on visual features
-        age_estimation = age_estimator.estimate(visual_features)
-        
-        # Calculate overall confidence
-        confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+        # Serve repeated uploads from the prediction cache
+        image_bytes = validation_result['image_bytes']
+        cache_key = prediction_key(image_bytes, yolo_inference)
+        cached = prediction_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return jsonify({
+                'success': True,
+                'data': dict(cached, processing_time_ms=(time.time() - start_time) * 1000)
+            }), 200
+
+        # Join an identical upload already being processed (client retries)
+        # instead of running the pipeline again
+        (result, stage_timings), _ = coalescer.run(
+            cache_key, lambda: run_pipeline(validation_result['image'], yolo_inference, cache_key)
+        )
         
         processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
 
-        return jsonify({
+        return serialize({
             'success': True,
-            'data': {
+            'data': dict(
+                result,
+                processing_time_ms=processing_time,
+                stage_timings_ms=stage_timings
+            )
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def run_pipeline(image, yolo_inference, cache_key):
+    """
+    Run preprocessing, detection, feature extraction and age estimation for one image
+    
+    Args:
+        image: Validated PIL image
+        yolo_inference: Model serving the request
+        cache_key: Prediction cache key, or None
+        
+    Returns:
+        (result, stage_timings) where stage_timings are in milliseconds
+    """
+    stage_timings = {}
+
+    # Preprocess image
+    processed_image, stage_timings['preprocess_ms'] = timed(image_preprocessor.preprocess, image)
+    
+    # Extract visual features in the pipeline pool while YOLO runs here
+    features_future = submit(
+        timed, image_preprocessor.extract_features, processed_image, stage='feature_extraction'
+    )
+    
+    # Run YOLO inference for disease detection
+    yolo_predictions, stage_timings['detection_ms'] = timed(
+        yolo_inference.predict, processed_image
+    )
+    
+    # Join feature extraction before age estimation
+    visual_features, stage_timings['feature_extraction_ms'] = features_future.result()
+    
+    # Estimate age based on visual features
+    age_estimation, stage_timings['age_estimation_ms'] = timed(
+        age_estimator.estimate, visual_features, stage='age_estimation'
+    )
+    
+    # Calculate overall confidence
+    confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+    
+    result = {
+        'yolo_predictions': yolo_predictions,
+        'visual_features': visual_features,
+        'age_estimation': age_estimation,
+        'confidence_score': confidence_score
+    }
+
+    # Never cache the default prediction returned after an inference error
+    if cache_key and not yolo_inference.is_fallback(yolo_predictions):
+        prediction_cache.put(cache_key, result)
+    return result, stage_timings
+
+def prepare_batch_item(index, image_file, yolo_inference, output_format):
+    """
+    Validate, check the cache for and preprocess one file of a batch
+    
+    Returns:
+        (entry, None) when the file is answered without inference (invalid
+        or cached), otherwise (None, pending item) to run through the model
+    """
+    try:
+        validation_result, _ = timed(validate_image, image_file, stage='validation')
+        if not validation_result['valid']:
+            return {
+                'filename': image_file.filename,
+                'success': False,
+                'error': validation_result['error']
+            }, None
+
+        image_bytes = validation_result['image_bytes']
+        cache_key = prediction_key(image_bytes, yolo_inference, output_format)
+        cached = prediction_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return {
+                'filename': image_file.filename,
+                'success': True,
+                'data': cached
+            }, None
+
+        processed_image = image_preprocessor.preprocess(validation_result['image'])
+        return None, (index, image_file.filename, processed_image, cache_key)
+    except Exception as e:
+        return {
+            'filename': image_file.filename,
+            'success': False,
+            'error': str(e)
+        }, None
+
+def run_batch_items(pending, yolo_inference, output_format):
+    """
+    Run detection, feature extraction and age estimation for pending items
+    
+    Yields:
+        (index, entry) for each item, in order
+    """
+    # Extract features in the pipeline pool while detection runs
+    feature_futures = [
+        submit(
+            timed, image_preprocessor.extract_features, processed_image, stage='feature_extraction'
+        )
+        for _, _, processed_image, _ in pending
+    ]
+
+    # Run detection in chunks of BATCH_MAX images per forward pass
+    batch_predictions = yolo_inference.predict_batch(
+        [processed_image for _, _, processed_image, _ in pending],
+        columnar=output_format == 'columnar'
+    )
+
+    for (index, filename, processed_image, cache_key), yolo_predictions, features_future in zip(
+        pending, batch_predictions, feature_futures
+    ):
+        try:
+            visual_features, _ = features_future.result()
+            age_estimation, _ = timed(age_estimator.estimate, visual_features, stage='age_estimation')
+            confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
+
+            result = {
                 'yolo_predictions': yolo_predictions,
                 'visual_features': visual_features,
                 'age_estimation': age_estimation,
-                'confidence_score': confidence_score,
-                'processing_time_ms': processing_time
+                'confidence_score': confidence_score
             }
-        }), 200
+            if cache_key and not yolo_inference.is_fallback(yolo_predictions):
+                prediction_cache.put(cache_key, result)
 
-    except Exception as e:
+            yield index, {
+                'filename': filename,
+                'success': True,
+                'data': result
+            }
+        except Exception as e:
+            yield index, {
+                'filename': filename,
+                'success': False,
+                'error': str(e)
+            }
+
+def stream_batch(yolo_inference, output_format):
+    """
+    Stream batch results as NDJSON
+    
+    Files are read one at a time from the multipart body. Each one produces a
+    JSON line (with its upload 'index') as soon as it is answered, followed by
+    a final line with "summary": true. Images needing inference are run in
+    groups of STREAM_BATCH_MAX so results are emitted progressively.
+    """
+    try:
+        uploads = iter_uploads(request.stream, request.headers.get('Content-Type', ''), 'images')
+    except ValueError as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), 400
+
+    chunk_size = min(STREAM_BATCH_MAX, yolo_inference.batch_max)
+
+    def line(payload):
+        with telemetry.stage_timer('serialization'):
+            return json.dumps(payload) + '\n'
+
+    def generate():
+        start_time = time.time()
+        counts = {'count': 0, 'succeeded': 0}
+        pending = []
+
+        def emit(index, entry):
+            counts['succeeded'] += entry['success']
+            return line(dict(entry, index=index))
+
+        try:
+            for index, upload in enumerate(uploads):
+                counts['count'] += 1
+                entry, item = prepare_batch_item(index, upload, yolo_inference, output_format)
+                if item is None:
+                    yield emit(index, entry)
+                    continue
+
+                pending.append(item)
+                if len(pending) == chunk_size:
+                    for done_index, done_entry in run_batch_items(pending, yolo_inference, output_format):
+                        yield emit(done_index, done_entry)
+                    pending = []
+
+            for done_index, done_entry in run_batch_items(pending, yolo_inference, output_format):
+                yield emit(done_index, done_entry)
+
+            yield line({
+                'summary': True,
+                'success': True,
+                'count': counts['count'],
+                'succeeded': counts['succeeded'],
+                'failed': counts['count'] - counts['succeeded'],
+                'processing_time_ms': (time.time() - start_time) * 1000
+            })
+        except Exception as e:
+            yield line({
+                'summary': True,
+                'success': False,
+                'count': counts['count'],
+                'error': str(e)
+            })
+
+    # X-Accel-Buffering stops nginx from holding lines back
+    return Response(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE,
+        headers={'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/predict/batch', methods=['POST'])
 def predict_batch():
+    yolo_inference = model_reloader.service
+
     try:
+        # ?format=columnar returns predictions as parallel arrays per image
+        output_format = 'columnar' if request.args.get('format') == 'columnar' else 'records'
+
+        # Accept: application/x-ndjson streams one line per file instead
+        if wants_ndjson():
+            return stream_batch(yolo_inference, output_format)
+
         if 'images' not in request.files:
             return jsonify({
                 'success': False,
@@ -92,43 +550,21 @@ def predict_batch():
             }), 400
 
         images = request.files.getlist('images')
-        results = []
-
-        for image_file in images:
-            try:
-                validation_result = validate_image(image_file)
-                if not validation_result['valid']:
-                    results.append({
-                        'filename': image_file.filename,
-                        'success': False,
-                        'error': validation_result['error']
-                    })
-                    continue
+        results = [None] * len(images)
+        pending = []
 
-                processed_image = image_preprocessor.preprocess(image_file)
-                yolo_predictions = yolo_inference.predict(processed_image)
-                visual_features = image_preprocessor.extract_features(processed_image)
-                age_estimation = age_estimator.estimate(visual_features)
-                confidence_score = calculate_confidence_score(yolo_predictions, visual_features)
-
-                results.append({
-                    'filename': image_file.filename,
-                    'success': True,
-                    'data': {
-                        'yolo_predictions': yolo_predictions,
-                        'visual_features': visual_features,
-                        'age_estimation': age_estimation,
-                        'confidence_score': confidence_score
-                    }
-                })
-            except Exception as e:
-                results.append({
-                    'filename': image_file.filename,
-                    'success': False,
-                    'error': str(e)
-                })
+        # Validate and preprocess every file first so valid images can be batched
+        for index, image_file in enumerate(images):
+            entry, item = prepare_batch_item(index, image_file, yolo_inference, output_format)
+            if item is None:
+                results[index] = entry
+            else:
+                pending.append(item)
 
-        return jsonify({
+        for index, entry in run_batch_items(pending, yolo_inference, output_format):
+            results[index] = entry
+
+        return serialize({
             'success': True,
             'count': len(results),
             'data': {
@@ -142,6 +578,37 @@ def predict_batch():
             'error': str(e)
         }), 500
 
+@app.route('/admin/reload', methods=['POST'])
+def reload_model():
+    """
+    Load and warm up the model file in the background, then swap it in
+    (requires the X-Admin-Token header to match ADMIN_TOKEN)
+    
+    The worker serving the request reloads directly; other gunicorn workers
+    reload through their file watchers, which see the model file touched.
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({
+            'success': False,
+            'error': 'Forbidden'
+        }), 403
+    if not model_reloader.ready:
+        return jsonify({
+            'success': False,
+            'error': 'Model is not ready'
+        }), 503
+
+    started, notified = model_reloader.request_reload()
+    return jsonify({
+        'success': True,
+        'worker_pid': os.getpid(),
+        'already_in_progress': not started,
+        'scope': 'all_workers' if notified else 'this_worker',
+        'other_workers_within_seconds': model_reloader.watch_interval if notified else None,
+        'model': model_reloader.status()
+    }), 202
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_DEBUG', 'False') == 'True')
@@ -0,0 +1,185 @@
+import math
+import os
+import threading
+import time
+
+from utils import telemetry
+
+# Weight of the newest request in the smoothed service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of being admitted
+    
+    Attributes:
+        status: HTTP status to return (429 queue full, 503 otherwise)
+        reason: 'queue_full', 'queue_timeout' or 'deadline'
+        retry_after: Seconds for the Retry-After header, or None
+    """
+    def __init__(self, status, reason, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=None, max_queue=None, queue_timeout_ms=None):
+        """
+        Bounded in-flight limit and wait queue in front of the inference pipeline
+        
+        Args:
+            max_in_flight: Requests allowed to run inference at once
+                (MAX_IN_FLIGHT, 0 disables admission control)
+            max_queue: Requests allowed to wait for a slot (MAX_QUEUE)
+            queue_timeout_ms: Longest a request waits for a slot (QUEUE_TIMEOUT_MS)
+        """
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv('MAX_IN_FLIGHT', '4'))
+        if max_queue is None:
+            max_queue = int(os.getenv('MAX_QUEUE', '16'))
+        if queue_timeout_ms is None:
+            queue_timeout_ms = float(os.getenv('QUEUE_TIMEOUT_MS', '10000'))
+
+        self.max_in_flight = max_in_flight
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout_ms / 1000
+
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejections = {'queue_full': 0, 'queue_timeout': 0, 'deadline': 0}
+        self.queue_wait_ms_total = 0.0
+        self.queue_wait_ms_max = 0.0
+        # Smoothed time an admitted request holds its slot (seconds), kept
+        # per kind of request (single image, batch, stream) since they differ
+        # by orders of magnitude; used for deadline checks and Retry-After
+        self.service_times = {}
+
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        """
+        Whether admission control is active
+        """
+        return self.max_in_flight > 0
+
+    def acquire(self, deadline=None, kind='predict'):
+        """
+        Wait for an inference slot
+        
+        Args:
+            deadline: time.monotonic() value after which the client no longer
+                needs the result, or None
+            kind: Kind of request whose service time estimate applies
+                (see admission_kind in app.py)
+        
+        Returns:
+            The time the slot was granted, to pass to release()
+        
+        Raises:
+            AdmissionRejected: If the queue is full, the wait times out or the
+                deadline cannot be met
+        """
+        if not self.enabled:
+            return time.monotonic()
+
+        arrived = time.monotonic()
+        with self._condition:
+            if self.in_flight >= self.max_in_flight and self.queued >= self.max_queue:
+                raise self._reject(429, 'queue_full', 'Inference queue is full', kind)
+            service_time = self.service_times.get(kind)
+            self._check_deadline(deadline, arrived, service_time, kind)
+
+            timeout_at = arrived + self.queue_timeout
+            if deadline is not None:
+                timeout_at = min(timeout_at, deadline - (service_time or 0.0))
+
+            self.queued += 1
+            telemetry.queue_depth.inc()
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = timeout_at - time.monotonic()
+                    if remaining <= 0:
+                        if deadline is not None and timeout_at < arrived + self.queue_timeout:
+                            raise self._reject(503, 'deadline', 'Request deadline cannot be met', kind, retry=False)
+                        raise self._reject(503, 'queue_timeout', 'Timed out waiting for an inference slot', kind)
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+                telemetry.queue_depth.dec()
+
+            self.in_flight += 1
+            telemetry.in_flight.inc()
+            self.admitted += 1
+            started = time.monotonic()
+            waited_ms = (started - arrived) * 1000
+            self.queue_wait_ms_total += waited_ms
+            self.queue_wait_ms_max = max(self.queue_wait_ms_max, waited_ms)
+            telemetry.queue_wait_seconds.observe(waited_ms / 1000)
+            return started
+
+    def release(self, started, kind='predict'):
+        """
+        Give back a slot and let the next queued request in
+        """
+        if not self.enabled:
+            return
+
+        elapsed = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            telemetry.in_flight.dec()
+            service_time = self.service_times.get(kind)
+            if service_time is None:
+                self.service_times[kind] = elapsed
+            else:
+                self.service_times[kind] = service_time + SERVICE_TIME_SMOOTHING * (elapsed - service_time)
+            self._condition.notify()
+
+    def _check_deadline(self, deadline, now, service_time, kind):
+        """
+        Drop requests that would finish after the client has given up,
+        before they cost any inference
+        """
+        if deadline is not None and deadline - now < (service_time or 0.0):
+            raise self._reject(503, 'deadline', 'Request deadline cannot be met', kind, retry=False)
+
+    def _reject(self, status, reason, message, kind, retry=True):
+        """
+        Count a rejection and build the exception for it
+        """
+        self.rejections[reason] += 1
+        telemetry.rejections_total.labels(reason).inc()
+        return AdmissionRejected(status, reason, message, self.retry_after(kind) if retry else None)
+
+    def retry_after(self, kind='predict'):
+        """
+        Seconds until the current queue should have drained, at this kind of
+        request's service time
+        """
+        service_time = self.service_times.get(kind)
+        if not service_time:
+            return 1
+        return max(1, math.ceil((self.queued + 1) * service_time / max(self.max_in_flight, 1)))
+
+    def stats(self):
+        """
+        Queue depth, rejections and queue wait time reported on /health
+        """
+        with self._condition:
+            return {
+                'enabled': self.enabled,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'admitted': self.admitted,
+                'rejections': dict(self.rejections),
+                'queue_wait_ms_total': self.queue_wait_ms_total,
+                'queue_wait_ms_max': self.queue_wait_ms_max,
+                'service_time_ms': {kind: seconds * 1000 for kind, seconds in self.service_times.items()}
+            }
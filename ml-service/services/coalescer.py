@@ -0,0 +1,89 @@
+import os
+import threading
+
+from utils import telemetry
+
+
+class _Call:
+    """
+    Outcome of one shared execution, published to every waiting caller
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, enabled=None):
+        """
+        Single-flight deduplication of concurrent identical work
+        
+        The first call for a key runs the work; calls with the same key that
+        arrive while it is in progress wait for and share its outcome instead
+        of running it again. Nothing is kept once the execution finishes (that
+        is the prediction cache's job).
+        
+        Args:
+            enabled: Coalesce calls (COALESCE_REQUESTS, default true)
+        """
+        if enabled is None:
+            enabled = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'
+
+        self.enabled = enabled
+        self.executions = 0
+        self.coalesced = 0
+
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func):
+        """
+        Run func, or join an identical execution already in progress
+        
+        Args:
+            key: Identity of the work (None runs func unshared)
+            func: Callable taking no arguments
+            
+        Returns:
+            (result, shared) where shared is True if another call ran func;
+            an exception raised by the execution is raised in every caller
+        """
+        if key is None or not self.enabled:
+            return func(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            telemetry.coalesced_total.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_progress': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
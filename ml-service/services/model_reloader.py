@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.helpers import file_signature
+from utils import telemetry
+
+
+class ModelReloader:
+    def __init__(self, factory, watch_interval=None, warmup_runs=None, background=None, prepare=None,
+                 startup_timings=None):
+        """
+        Hold the active YOLO model and swap in a new one without downtime
+        
+        Args:
+            factory: Callable that loads a new model service (e.g. YOLOInference)
+            watch_interval: Seconds between checks of the model file for changes
+                (MODEL_WATCH_INTERVAL, 0 disables watching)
+            warmup_runs: Synthetic inferences run before a model serves traffic
+                (WARMUP_RUNS)
+            background: Load the first model in a background thread instead of
+                blocking startup (MODEL_BACKGROUND_LOAD)
+            prepare: Optional callable run before the first load, timed as
+                runtime_import_ms
+            startup_timings: Phase timings measured before the reloader was created
+        """
+        if watch_interval is None:
+            watch_interval = float(os.getenv('MODEL_WATCH_INTERVAL', '10'))
+        if warmup_runs is None:
+            warmup_runs = int(os.getenv('WARMUP_RUNS', '3'))
+        if background is None:
+            background = os.getenv('MODEL_BACKGROUND_LOAD', 'false').lower() == 'true'
+
+        self.factory = factory
+        self.watch_interval = watch_interval
+        self.warmup_runs = max(warmup_runs, 1)
+        self.prepare = prepare
+        self.service = None
+        self.loaded_at = None
+        self.reload_count = 0
+        self.last_error = None
+        self.startup_timings = dict(startup_timings or {})
+        self.startup_error = None
+
+        self._file_signature = None
+        self._reload_lock = threading.Lock()
+        # Guards starting the loader, watcher and reload threads
+        self._lock = threading.Lock()
+        self._startup_pid = None
+        self._watch_pid = None
+        self._reload_pending = False
+
+        if background:
+            self.ensure_started()
+        else:
+            self._start()
+
+    @property
+    def ready(self):
+        """
+        Whether a loaded and warmed-up model is serving
+        """
+        return self.service is not None
+
+    @property
+    def reloading(self):
+        """
+        Whether a reload is running or has been started in the background
+        """
+        return self._reload_pending or self._reload_lock.locked()
+    
+    def _warm_up(self, service):
+        """
+        Run synthetic 640x640 inferences so real requests do not pay for warmup
+        
+        Goes through _detect rather than predict, which replaces inference
+        errors with a fallback prediction, so a model that loads but cannot
+        run inference is rejected here. Metrics are suppressed so warmup
+        does not show up as traffic (stage timings, fallbacks, detections).
+        """
+        frame = np.zeros((640, 640, 3), dtype=np.uint8)
+        with telemetry.suppressed():
+            for _ in range(self.warmup_runs):
+                service._detect([frame])
+
+    def _start(self):
+        """
+        Load and warm up the first model, recording each startup phase
+        """
+        timings = self.startup_timings
+        started = time.perf_counter()
+        try:
+            if self.prepare is not None:
+                phase_start = time.perf_counter()
+                self.prepare()
+                timings['runtime_import_ms'] = (time.perf_counter() - phase_start) * 1000
+
+            phase_start = time.perf_counter()
+            service = self.factory()
+            timings['model_load_ms'] = (time.perf_counter() - phase_start) * 1000
+
+            phase_start = time.perf_counter()
+            self._warm_up(service)
+            timings['warmup_ms'] = (time.perf_counter() - phase_start) * 1000
+        except Exception as exc:
+            self.startup_error = str(exc)
+            raise
+
+        timings['startup_ms'] = (time.perf_counter() - started) * 1000
+        # Taken by the service before it read the weights, so a deploy that
+        # landed during startup is picked up by the first check
+        self._file_signature = service.model_signature
+        self.loaded_at = time.time()
+        # Assigned last: this is what flips /ready.
+        self.service = service
+
+        phases = ' '.join(f"{name}={value:.0f}" for name, value in timings.items())
+        print(f"Model ready in pid {os.getpid()} ({self.warmup_runs} warmup runs): {phases}")
+
+    def ensure_started(self):
+        """
+        Start loading the first model in a background thread if it is not loaded
+        
+        Loader threads do not survive fork, so a worker forked mid-load starts its own.
+        """
+        with self._lock:
+            if self.service is not None or self._startup_pid == os.getpid():
+                return
+            self._startup_pid = os.getpid()
+
+        def run():
+            try:
+                self._start()
+            except Exception as exc:
+                print(f"Model startup failed: {exc}")
+
+        threading.Thread(target=run, name='model-startup', daemon=True).start()
+
+    def reload(self):
+        """
+        Load and warm up a new model, then atomically make it the active one
+        
+        Returns:
+            The newly loaded model service
+        """
+        with self._reload_lock:
+            signature = file_signature(self.service.model_path)
+            try:
+                candidate = self.factory()
+                self._warm_up(candidate)
+            except Exception as exc:
+                self.last_error = str(exc)
+                # Remember the broken file so the watcher waits for the next deploy instead of retrying it.
+                self._file_signature = signature
+                raise
+
+            # In-flight requests keep their reference to the old service until they finish.
+            self.service = candidate
+            self.loaded_at = time.time()
+            self.reload_count += 1
+            self.last_error = None
+            # The file as the new service found it before reading the
+            # weights, so a deploy that landed while the model was loading
+            # is picked up by the next check
+            self._file_signature = candidate.model_signature
+            return candidate
+
+    def reload_async(self):
+        """
+        Reload in a background thread
+        
+        Returns:
+            False if no model is loaded yet or a reload is already in progress
+        """
+        with self._lock:
+            if not self.ready or self.reloading:
+                return False
+            # Set until the thread finishes, so a second caller cannot start
+            # another reload before this one takes the reload lock
+            self._reload_pending = True
+
+        def run():
+            try:
+                self.reload()
+            except Exception as exc:
+                print(f"Model reload failed: {exc}")
+            finally:
+                self._reload_pending = False
+
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+        return True
+
+    def request_reload(self):
+        """
+        Reload the model in every worker
+        
+        This worker reloads in the background. The model file's modification
+        time is bumped so the file watcher of every other worker sees a
+        change and reloads within MODEL_WATCH_INTERVAL seconds; with watching
+        disabled only this worker reloads.
+        
+        Returns:
+            Tuple of (reload started in this worker, other workers notified)
+        """
+        notified = False
+        if self.watch_interval > 0:
+            try:
+                os.utime(self.service.model_path)
+                notified = True
+            except OSError as e:
+                print(f"Could not touch {self.service.model_path} to notify other workers: {str(e)}")
+        return self.reload_async(), notified
+    
+    def ensure_watching(self):
+        """
+        Start the model file watcher in this process if it is not running
+        
+        Watcher threads do not survive fork, so each preforked worker starts its own.
+        """
+        with self._lock:
+            if self.watch_interval <= 0 or self._watch_pid == os.getpid():
+                return
+            self._watch_pid = os.getpid()
+
+        threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+
+    def _watch(self):
+        """
+        Poll the model file and reload when it changes
+        """
+        while True:
+            time.sleep(self.watch_interval)
+            if not self.ready:
+                continue
+
+            signature = file_signature(self.service.model_path)
+            if signature is None or signature == self._file_signature or self.reloading:
+                continue
+
+            try:
+                self.reload()
+                print(f"Reloaded model {self.service.model_path} ({self.service.model_hash[:12]})")
+            except Exception as exc:
+                print(f"Model reload failed: {exc}")
+
+    def status(self):
+        """
+        Active model hash and load time reported on /health
+        """
+        return {
+            'ready': self.ready,
+            'model_hash': self.service.model_hash if self.ready else None,
+            'loaded_at': datetime.fromtimestamp(self.loaded_at, tz=timezone.utc).isoformat() if self.ready else None,
+            'reload_count': self.reload_count,
+            'reloading': self.reloading,
+            'last_reload_error': self.last_error
+        }
+
+    def readiness(self):
+        """
+        Readiness and startup phase timings reported on /ready
+        """
+        return {
+            'ready': self.ready,
+            'model_hash': self.service.model_hash if self.ready else None,
+            'warmup_runs': self.warmup_runs,
+            'startup_timings_ms': self.startup_timings,
+            'startup_error': self.startup_error
+        }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, max_bytes=None, ttl_seconds=None):
+        """
+        In-process cache of prediction results keyed by upload content
+        
+        Args:
+            max_bytes: Byte budget before least recently used entries are evicted
+            ttl_seconds: Lifetime of a cached entry (0 disables expiry)
+        """
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('PREDICTION_CACHE_MAX_MB', '64')) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('PREDICTION_CACHE_TTL_SECONDS', '3600'))
+
+        self.max_bytes = max(max_bytes, 0)
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._model_identity = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def make_key(self, image_bytes, model_identity):
+        """
+        Hash the raw upload bytes together with the model identity and thresholds
+        """
+        digest = hashlib.sha256(image_bytes)
+        digest.update(repr(model_identity).encode('utf-8'))
+        return digest.hexdigest()
+
+    def sync_model(self, model_identity):
+        """
+        Drop every entry when the model file or thresholds have changed
+        """
+        with self._lock:
+            if model_identity != self._model_identity:
+                self._entries.clear()
+                self.current_bytes = 0
+                self._model_identity = model_identity
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+
+            self._entries[key] = (expires_at, size, value)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Cache counters reported on /health
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -2,51 +2,118 @@ from PIL import Image
 import cv2
 import numpy as np
 from io import BytesIO
+import os
+from utils import telemetry
+
+# HSV range counted as healthy leaf green (hue 40-80)
+GREEN_LOWER = np.array([40, 50, 50])
+GREEN_UPPER = np.array([80, 255, 255])
+
+# Scale from uint8 pixels to the [0, 1] model input range
+INPUT_SCALE = np.float32(1 / 255)
+
+def write_model_input(images, out):
+    """
+    Write letterboxed frames into a float32 NCHW model input buffer
+    
+    Each uint8 HWC frame is converted, transposed and scaled to [0, 1] in a
+    single pass straight into `out`, without intermediate copies.
+    
+    Args:
+        images: Letterboxed frames from ImagePreprocessor.preprocess, all the same size
+        out: Preallocated float32 array of shape (len(images), 3, H, W)
+    
+    Returns:
+        The filled buffer
+    """
+    for image, target in zip(images, out):
+        # Ultralytics treats numpy frames as BGR and reverses the channels;
+        # the same reversal here gives the model exactly the tensor it
+        # received when frames went through Ultralytics.
+        np.multiply(image[:, :, ::-1].transpose(2, 0, 1), INPUT_SCALE, out=target, dtype=np.float32)
+    return out
 
 class ImagePreprocessor:
     def __init__(self):
         self.target_size = (640, 640)  # Standard YOLO input size
+        
+        # Decode large JPEGs at a reduced DCT scale before the final resize
+        self.reduced_decode = os.getenv('REDUCED_JPEG_DECODE', 'true').lower() == 'true'
     
     def preprocess(self, image_file):
         """
         Preprocess image for inference
         
         Args:
-            image_file: File object or image data
+            image_file: PIL image already opened by validate_image, file object or image data
         
         Returns:
             Preprocessed image (numpy array)
         """
         try:
-            # Read image
-            if hasattr(image_file, 'read'):
-                image = Image.open(BytesIO(image_file.read()))
-            else:
-                image = Image.open(image_file)
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Convert to numpy array
-            image_array = np.array(image)
+            # Read image (an opened PIL image is decoded here exactly once)
+            with telemetry.stage_timer('decode'):
+                if isinstance(image_file, Image.Image):
+                    image = image_file
+                elif hasattr(image_file, 'read'):
+                    image = Image.open(BytesIO(image_file.read()))
+                else:
+                    image = Image.open(image_file)
+                
+                # Letterbox geometry is always computed from the original size
+                source_size = image.size
+                
+                # Let libjpeg decode at the smallest 1/2, 1/4 or 1/8 scale that
+                # still covers the target size instead of the full resolution
+                if self.reduced_decode and image.format == 'JPEG':
+                    image.draft('RGB', self._scaled_size(source_size))
+                
+                # Convert to RGB if necessary
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                
+                # Convert to numpy array without an extra copy
+                image_array = np.asarray(image)
             
             # Resize while maintaining aspect ratio
-            image_array = self._resize_with_aspect_ratio(image_array)
+            with telemetry.stage_timer('letterbox'):
+                image_array = self._resize_with_aspect_ratio(image_array, source_size=source_size)
             
             return image_array
             
         except Exception as e:
             raise ValueError(f"Error preprocessing image: {str(e)}")
     
-    def _resize_with_aspect_ratio(self, image, target_size=None):
+    def _scaled_size(self, source_size, target_size=None):
+        """
+        Size of the image after aspect-preserving scaling to the target size
+        """
+        if target_size is None:
+            target_size = self.target_size
+        
+        w, h = source_size
+        target_w, target_h = target_size
+        scale = min(target_w / w, target_h / h)
+        
+        return (int(w * scale), int(h * scale))
+    
+    def _resize_with_aspect_ratio(self, image, target_size=None, source_size=None):
         """
         Resize image while maintaining aspect ratio
+        
+        Args:
+            image: Image array
+            target_size: Output (width, height), defaults to self.target_size
+            source_size: Original (width, height) when the image was decoded
+                at reduced resolution, so padding matches a full decode
         """
         if target_size is None:
             target_size = self.target_size
         
-        h, w = image.shape[:2]
+        if source_size is None:
+            h, w = image.shape[:2]
+        else:
+            w, h = source_size
         target_w, target_h = target_size
         
         # Calculate scaling factor
@@ -82,22 +149,18 @@ class ImagePreprocessor:
             Dictionary of visual features
         """
         try:
-            # Convert to appropriate color space
-            if len(image.shape) == 3:
-                hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-                gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            if len(image.shape) == 3 and image.shape[2] == 3:
+                # Single shared pass over the non-padded region
+                leaf_color_index, surface_pattern_score, structural_features = self._extract_fused(image)
             else:
-                hsv = image
-                gray = image
-            
-            # Calculate color indices
-            leaf_color_index = self._calculate_color_index(hsv)
-            
-            # Calculate surface pattern score
-            surface_pattern_score = self._calculate_pattern_score(gray)
-            
-            # Estimate structural features
-            structural_features = self._estimate_structure(image)
+                # Calculate color indices
+                leaf_color_index = self._calculate_color_index(image)
+                
+                # Calculate surface pattern score
+                surface_pattern_score = self._calculate_pattern_score(image)
+                
+                # Estimate structural features
+                structural_features = self._estimate_structure(image)
             
             return {
                 'leaf_color_index': float(leaf_color_index),
@@ -116,16 +179,82 @@ class ImagePreprocessor:
                 }
             }
     
+    def _content_box(self, image, margin=2):
+        """
+        Bounding box of the non-zero (non-letterbox) region of an RGB image
+        
+        Args:
+            image: Letterboxed image (numpy array, HxWx3)
+            margin: Black border kept around the content so edge detection
+                sees the same content/padding boundary as on the full frame
+        
+        Returns:
+            (top, bottom, left, right) slice bounds, or None for an all-black image
+        """
+        h, w = image.shape[:2]
+        rows = np.flatnonzero(image.reshape(h, -1).any(axis=1))
+        if rows.size == 0:
+            return None
+        
+        band = image[rows[0]:rows[-1] + 1].reshape(-1, w * image.shape[2])
+        cols = np.flatnonzero(band.any(axis=0).reshape(w, -1).any(axis=1))
+        
+        return (
+            max(rows[0] - margin, 0),
+            min(rows[-1] + 1 + margin, h),
+            max(cols[0] - margin, 0),
+            min(cols[-1] + 1 + margin, w)
+        )
+    
+    def _extract_fused(self, image):
+        """
+        Compute color index, pattern score and structure in one pass over the
+        non-padded region of interest
+        
+        Results match the separate _calculate_color_index, _calculate_pattern_score
+        and _estimate_structure calls on the full padded frame: padding pixels are
+        zero, so counts are still divided by the full frame size and the full-frame
+        variance is derived from the ROI mean and standard deviation.
+        
+        Returns:
+            Tuple of (leaf_color_index, surface_pattern_score, structural_features)
+        """
+        frame_pixels = image.shape[0] * image.shape[1]
+        box = self._content_box(image)
+        if box is None:
+            return 0.0, 0.0, self._structure_summary(0.0, 0)
+        
+        top, bottom, left, right = box
+        roi = image[top:bottom, left:right]
+        gray = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+        hsv = cv2.cvtColor(roi, cv2.COLOR_RGB2HSV)
+        
+        # Color index (green pixels over the whole frame)
+        green_pixels = cv2.countNonZero(cv2.inRange(hsv, GREEN_LOWER, GREEN_UPPER))
+        color_index = min(max(green_pixels / frame_pixels, 0), 1)
+        
+        # Pattern score (full-frame gray variance from the ROI moments)
+        mean, stddev = cv2.meanStdDev(gray)
+        roi_mean = float(mean[0, 0])
+        roi_share = gray.size / frame_pixels
+        frame_mean = roi_mean * roi_share
+        variance = (float(stddev[0, 0]) ** 2 + roi_mean ** 2) * roi_share - frame_mean ** 2
+        pattern_score = min(max(variance, 0.0) / 1000, 1.0)
+        
+        # Structure (edge density over the whole frame and contour count)
+        edges = cv2.Canny(gray, 50, 150)
+        edge_density = cv2.countNonZero(edges) / frame_pixels
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        return color_index, pattern_score, self._structure_summary(edge_density, len(contours))
+    
     def _calculate_color_index(self, hsv_image):
         """
         Calculate leaf color index (greenness/health indicator)
         """
         try:
             # Extract green channel (hue range for green: 40-80)
-            lower_green = np.array([40, 50, 50])
-            upper_green = np.array([80, 255, 255])
-            
-            mask = cv2.inRange(hsv_image, lower_green, upper_green)
+            mask = cv2.inRange(hsv_image, GREEN_LOWER, GREEN_UPPER)
             green_pixels = np.sum(mask > 0)
             total_pixels = hsv_image.shape[0] * hsv_image.shape[1]
             
@@ -172,21 +301,10 @@ class ImagePreprocessor:
             # Estimate thickness based on edge density
             edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
             
-            if edge_density < 0.1:
-                thickness = 'thin'
-            elif edge_density < 0.3:
-                thickness = 'medium'
-            else:
-                thickness = 'thick'
-            
             # Simple leaf count estimation (contour-based)
             contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            leaf_count = min(len(contours), 20)  # Cap at reasonable number
             
-            return {
-                'thickness_estimate': thickness,
-                'leaf_count_visible': int(leaf_count)
-            }
+            return self._structure_summary(edge_density, len(contours))
             
         except Exception as e:
             print(f"Error estimating structure: {str(e)}")
@@ -194,4 +312,19 @@ class ImagePreprocessor:
                 'thickness_estimate': 'medium',
                 'leaf_count_visible': 0
             }
-
+    
+    def _structure_summary(self, edge_density, contour_count):
+        """
+        Map edge density and contour count to structural features
+        """
+        if edge_density < 0.1:
+            thickness = 'thin'
+        elif edge_density < 0.3:
+            thickness = 'medium'
+        else:
+            thickness = 'thick'
+        
+        return {
+            'thickness_estimate': thickness,
+            'leaf_count_visible': int(min(contour_count, 20))  # Cap at reasonable number
+        }
@@ -1,18 +1,36 @@
-from ultralytics import YOLO
-import torch
-import ultralytics.nn.tasks as ul_tasks
-import ultralytics.nn.modules.conv as ul_conv
-import torch.nn as nn
-import cv2
 import numpy as np
 from pathlib import Path
 import os
+import threading
+from utils.helpers import file_sha256, file_signature
+from services.preprocessing import write_model_input
+from utils import telemetry
+
+# Keys of the columnar prediction format
+PREDICTION_COLUMNS = ('class', 'confidence', 'x', 'y', 'width', 'height')
+
+def import_runtime():
+    """
+    Import torch and Ultralytics
+    
+    They are otherwise imported on first use when the model loads; calling
+    this first lets startup report the import time as its own phase.
+    """
+    import torch  # noqa: F401
+    import ultralytics  # noqa: F401
 
 class YOLOInference:
     def __init__(self, model_path=None):
         """
         Initialize YOLO model for disease detection
         """
+        # torch and Ultralytics are imported here rather than at module level
+        # so importing the app stays fast
+        import torch
+        import torch.nn as nn
+        import ultralytics.nn.tasks as ul_tasks
+        import ultralytics.nn.modules.conv as ul_conv
+
         # PyTorch 2.6+ defaults to weights_only=True; allowlist classes used by Ultralytics checkpoints.
         try:
             torch.serialization.add_safe_globals([
@@ -53,10 +71,78 @@ class YOLOInference:
                     f"and fallback {fallback}."
                 )
 
-        self.model = YOLO(str(selected_path))
+        self.model_path = str(selected_path)
+        # Taken before the weights are read, so the reloader notices a
+        # file replaced while the model was loading
+        self.model_signature = file_signature(self.model_path)
+        self.model_hash = file_sha256(self.model_path)
+        self.model = self._load_model()
 
         # Disease classes (matching the enum in scan model)
         self.disease_classes = self._infer_class_names()
+        self._class_lookup = np.array(self.disease_classes + ['healthy'], dtype=object)
+
+        # Maximum images per forward pass for batch prediction
+        self.batch_max = max(int(os.getenv('BATCH_MAX', 16)), 1)
+
+        # Detection thresholds (part of the prediction cache key)
+        self.conf_threshold = 0.25
+        self.iou_threshold = 0.45
+        
+        # Feed letterboxed frames to the model as a tensor, skipping
+        # Ultralytics' own letterbox and input conversion
+        self.direct_input = os.getenv('DIRECT_TENSOR_INPUT', 'true').lower() == 'true'
+        # Reusable input buffers, one per thread
+        self._input_buffers = threading.local()
+
+    def _load_model(self):
+        """
+        Load the YOLO model, reusing a cached pre-fused checkpoint when possible
+        
+        Fusing Conv+BatchNorm layers otherwise happens on the first prediction.
+        The fused checkpoint is saved next to the original under
+        models/.exported/<name>-<hash>/ and is tied to the checkpoint's hash.
+        """
+        from ultralytics import YOLO
+
+        if Path(self.model_path).suffix == '.onnx':
+            # Exported graphs such as the INT8 model from ml-training/quantize.py
+            return YOLO(self.model_path, task='detect')
+
+        if os.getenv('FUSED_MODEL_CACHE', 'true').lower() != 'true':
+            return YOLO(self.model_path)
+
+        checkpoint = Path(self.model_path)
+        fused_path = (
+            checkpoint.parent / '.exported' / f'{checkpoint.stem}-{self.model_hash[:16]}'
+            / f'{checkpoint.stem}_fused.pt'
+        )
+
+        if fused_path.exists():
+            try:
+                return YOLO(str(fused_path))
+            except Exception as e:
+                print(f"Could not load fused model {fused_path}, using {self.model_path}: {e}")
+                return YOLO(self.model_path)
+
+        import torch
+
+        model = YOLO(self.model_path)
+        model.fuse()
+
+        # Same checkpoint layout Ultralytics reads; an already-fused model
+        # skips fusion when loaded. Written to a temp file and renamed so
+        # concurrent workers never read a partial file.
+        temp_path = fused_path.with_name(f'.{fused_path.name}.tmp-{os.getpid()}')
+        try:
+            fused_path.parent.mkdir(parents=True, exist_ok=True)
+            torch.save({'model': model.model, 'train_args': dict(model.model.args)}, temp_path)
+            os.replace(temp_path, fused_path)
+        except Exception as e:
+            temp_path.unlink(missing_ok=True)
+            print(f"Could not cache fused model at {fused_path}: {e}")
+
+        return model
 
     def _resolve_model_path(self, model_path, service_root):
         path = Path(model_path)
@@ -82,6 +168,30 @@ class YOLOInference:
             'mealybug', 'spider_mite'
         ]
     
+    def model_identity(self):
+        """
+        Identify the loaded checkpoint and thresholds for cache keys
+        
+        Returns:
+            Tuple that changes whenever a different model file is loaded
+        """
+        # Based on the loaded weights, so a file replaced on disk only
+        # invalidates cached predictions once the new model is serving
+        return (
+            self.model_path,
+            self.model_hash,
+            self.conf_threshold,
+            self.iou_threshold
+        )
+
+    def is_fallback(self, predictions):
+        """
+        Check whether predictions are the default returned after an inference error
+        """
+        if isinstance(predictions, dict):
+            return predictions == self._error_columns()
+        return predictions == self._error_prediction()
+
     def predict(self, image):
         """
         Run YOLO inference on image
@@ -94,68 +204,229 @@ class YOLOInference:
         """
         try:
             # Run inference
-            results = self.model(image, conf=0.25, iou=0.45)
+            detections = self._detect([image])
             
-            predictions = []
-            
-            for result in results:
-                boxes = result.boxes
-                
-                for i in range(len(boxes)):
-                    box = boxes[i]
-                    
-                    # Get bounding box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    # Get confidence and class
-                    confidence = float(box.conf[0].cpu().numpy())
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    # Map class ID to disease name
-                    # Note: This assumes the model was trained with these classes
-                    # In production, ensure model classes match self.disease_classes
-                    if class_id < len(self.disease_classes):
-                        class_name = self.disease_classes[class_id]
-                    else:
-                        class_name = 'healthy'  # Default fallback
-                    
-                    predictions.append({
-                        'class': class_name,
-                        'confidence': confidence,
-                        'bounding_box': {
-                            'x': float(x1),
-                            'y': float(y1),
-                            'width': float(x2 - x1),
-                            'height': float(y2 - y1)
-                        }
-                    })
-            
-            # If no predictions, assume healthy
-            if not predictions:
-                predictions.append({
-                    'class': 'healthy',
-                    'confidence': 0.5,
-                    'bounding_box': {
-                        'x': 0,
-                        'y': 0,
-                        'width': 0,
-                        'height': 0
-                    }
-                })
-            
-            return predictions
+            columns = self._merge_columns([self._format_result(boxes) for boxes in detections])
+            return self._to_records(self._finalize_columns(columns))
             
         except Exception as e:
             print(f"Error in YOLO inference: {str(e)}")
-            # Return default healthy prediction on error
-            return [{
-                'class': 'healthy',
-                'confidence': 0.3,
+            telemetry.record_fallback('error')
+            return self._error_prediction()
+
+    def predict_batch(self, images, batch_size=None, columnar=False):
+        """
+        Run YOLO inference on several images in batched forward passes
+        
+        Args:
+            images: List of preprocessed images (numpy arrays)
+            batch_size: Maximum images per forward pass (defaults to BATCH_MAX)
+            columnar: Return each image's predictions as parallel arrays
+                ('class', 'confidence', 'x', 'y', 'width', 'height') instead
+                of a list of dictionaries
+        
+        Returns:
+            List of predictions, one entry per input image and in input order
+        """
+        if batch_size is None:
+            batch_size = self.batch_max
+        
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            try:
+                for boxes in self._detect(chunk):
+                    columns = self._finalize_columns(self._format_result(boxes))
+                    outputs.append(columns if columnar else self._to_records(columns))
+            except Exception as e:
+                print(f"Error in batched YOLO inference: {str(e)}")
+                telemetry.record_fallback('error', len(chunk))
+                fallback = self._error_columns if columnar else self._error_prediction
+                outputs.extend(fallback() for _ in chunk)
+        
+        return outputs
+
+    def _detect(self, images):
+        """
+        Run the model and return raw detections
+        
+        Letterboxed numpy frames are written into a reusable float32 tensor
+        and passed straight to the Ultralytics backend, skipping its second
+        letterbox, layout conversion and Results bookkeeping. Other inputs
+        (e.g. PIL images) go through Ultralytics as before.
+        
+        Args:
+            images: List of preprocessed images
+        
+        Returns:
+            One (n, 6) array of x1, y1, x2, y2, confidence, class per image,
+            in the coordinates of the letterboxed frame
+        """
+        if not self._accepts_direct_input(images):
+            with telemetry.stage_timer('forward'):
+                results = self.model(images, conf=self.conf_threshold, iou=self.iou_threshold)
+            return [result.boxes.data.cpu().numpy() for result in results]
+        
+        import torch
+        from ultralytics.utils import ops
+        
+        backend = self._backend()
+        batch = torch.from_numpy(self._input_tensor(images)).to(backend.device)
+        if backend.fp16:
+            batch = batch.half()
+        
+        with telemetry.stage_timer('forward'), torch.inference_mode():
+            predictions = backend(batch)
+            detections = ops.non_max_suppression(predictions, self.conf_threshold, self.iou_threshold)
+        
+        # The frame is the model input, so no rescaling is needed; clip boxes
+        # to the frame the same way Ultralytics does
+        height, width = images[0].shape[:2]
+        outputs = []
+        for detection in detections:
+            detection = detection.float().cpu().numpy()
+            np.clip(detection[:, 0:4:2], 0, width, out=detection[:, 0:4:2])
+            np.clip(detection[:, 1:4:2], 0, height, out=detection[:, 1:4:2])
+            outputs.append(detection)
+        return outputs
+
+    def _accepts_direct_input(self, images):
+        """
+        Check whether images can be fed to the model as one tensor
+        (same-sized RGB numpy frames with sides divisible by the model stride)
+        """
+        if not self.direct_input or not images or not isinstance(images[0], np.ndarray):
+            return False
+        
+        shape = images[0].shape
+        return (
+            len(shape) == 3 and shape[2] == 3 and shape[0] % 32 == 0 and shape[1] % 32 == 0
+            and all(isinstance(image, np.ndarray) and image.shape == shape for image in images)
+        )
+
+    def _backend(self):
+        """
+        Ultralytics AutoBackend wrapping the loaded model
+        """
+        predictor = self.model.predictor
+        if predictor is None or predictor.model is None:
+            # The first call through Ultralytics builds (and fuses) the backend
+            self.model(np.zeros((640, 640, 3), dtype=np.uint8), conf=self.conf_threshold, iou=self.iou_threshold)
+            predictor = self.model.predictor
+        return predictor.model
+
+    def _input_tensor(self, images):
+        """
+        Fill this thread's reusable input buffer with the given frames
+        """
+        shape = (len(images), 3) + images[0].shape[:2]
+        buffer = getattr(self._input_buffers, 'array', None)
+        if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+            buffer = np.empty(shape, dtype=np.float32)
+            self._input_buffers.array = buffer
+        return write_model_input(images, buffer[:shape[0]])
+
+    def _format_result(self, detections):
+        """
+        Convert one image's detections into prediction columns
+        
+        Detections arrive as a single (n, 6) NumPy array, so class mapping,
+        box conversion and confidence sorting are done on arrays.
+        """
+        xyxy = detections[:, :4]
+        confidence = detections[:, 4]
+        class_ids = detections[:, 5].astype(np.int64)
+        
+        # Highest confidence first
+        order = np.argsort(-confidence, kind='stable')
+        xyxy = xyxy[order]
+        confidence = confidence[order]
+        
+        # Map class IDs to disease names (unknown IDs fall back to 'healthy')
+        # Note: This assumes the model was trained with these classes
+        # In production, ensure model classes match self.disease_classes
+        class_ids = class_ids[order]
+        class_ids = np.where(class_ids < len(self.disease_classes), class_ids, len(self.disease_classes))
+        class_names = self._class_lookup[class_ids].tolist()
+        telemetry.record_detections(class_names)
+        
+        return {
+            'class': class_names,
+            'confidence': confidence.tolist(),
+            'x': xyxy[:, 0].tolist(),
+            'y': xyxy[:, 1].tolist(),
+            'width': (xyxy[:, 2] - xyxy[:, 0]).tolist(),
+            'height': (xyxy[:, 3] - xyxy[:, 1]).tolist()
+        }
+
+    def _merge_columns(self, column_sets):
+        """
+        Combine prediction columns from several results, keeping confidence order
+        """
+        if len(column_sets) == 1:
+            return column_sets[0]
+        
+        merged = {key: [] for key in PREDICTION_COLUMNS}
+        for columns in column_sets:
+            for key in PREDICTION_COLUMNS:
+                merged[key].extend(columns[key])
+        
+        order = sorted(range(len(merged['confidence'])), key=lambda i: merged['confidence'][i], reverse=True)
+        return {key: [values[i] for i in order] for key, values in merged.items()}
+
+    def _finalize_columns(self, columns):
+        """
+        Fall back to a healthy prediction when nothing was detected
+        """
+        # If no predictions, assume healthy
+        if not columns['confidence']:
+            telemetry.record_fallback('no_detections')
+            return {
+                'class': ['healthy'],
+                'confidence': [0.5],
+                'x': [0],
+                'y': [0],
+                'width': [0],
+                'height': [0]
+            }
+        
+        return columns
+
+    def _to_records(self, columns):
+        """
+        Convert prediction columns to the list-of-dictionaries response format
+        """
+        return [
+            {
+                'class': class_name,
+                'confidence': confidence,
                 'bounding_box': {
-                    'x': 0,
-                    'y': 0,
-                    'width': 0,
-                    'height': 0
+                    'x': x,
+                    'y': y,
+                    'width': width,
+                    'height': height
                 }
-            }]
+            }
+            for class_name, confidence, x, y, width, height in zip(
+                *(columns[key] for key in PREDICTION_COLUMNS)
+            )
+        ]
 
+    def _error_prediction(self):
+        """
+        Default healthy prediction returned when inference fails
+        """
+        return self._to_records(self._error_columns())
+
+    def _error_columns(self):
+        """
+        Default healthy prediction columns returned when inference fails
+        """
+        return {
+            'class': ['healthy'],
+            'confidence': [0.3],
+            'x': [0],
+            'y': [0],
+            'width': [0],
+            'height': [0]
+        }
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.preprocessing import ImagePreprocessor
+
+# Source (width, height) before letterboxing, covering square, landscape, portrait and extreme aspect ratios
+FIXTURE_SIZES = [(640, 640), (4032, 3024), (3024, 4032), (1280, 720), (720, 1280), (300, 1200)]
+# (label, value range of the coarse colour grid, per-pixel noise amplitude)
+FIXTURE_STYLES = [('flat', 40, 2), ('leafy', 140, 6), ('textured', 255, 20)]
+
+
+def fixture_images(seed=0):
+    """
+    Letterboxed synthetic photos, plus an all-black frame
+    """
+    rng = np.random.default_rng(seed)
+    preprocessor = ImagePreprocessor()
+    fixtures = []
+    for width, height in FIXTURE_SIZES:
+        for style, spread, noise_level in FIXTURE_STYLES:
+            grid = (max(height // 80, 2), max(width // 80, 2), 3)
+            small = rng.integers(100 - spread // 2, 100 + spread // 2, size=grid).clip(0, 255).astype(np.uint8)
+            small[:, :, 1] = np.maximum(small[:, :, 1], 90)
+            image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+            noise = rng.integers(-noise_level, noise_level + 1, size=image.shape, dtype=np.int16)
+            image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+            fixtures.append((f'{style}-{width}x{height}', preprocessor._resize_with_aspect_ratio(image)))
+    fixtures.append(('black', np.zeros((640, 640, 3), dtype=np.uint8)))
+    return fixtures
+
+
+def legacy_features(preprocessor, image):
+    """
+    extract_features before the fused pass: each feature computed separately
+    on the full padded frame
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return (
+        preprocessor._calculate_color_index(hsv),
+        preprocessor._calculate_pattern_score(gray),
+        preprocessor._estimate_structure(image)
+    )
+
+
+@pytest.mark.parametrize('name,image', fixture_images(), ids=lambda value: value if isinstance(value, str) else '')
+def test_fused_matches_legacy(name, image):
+    preprocessor = ImagePreprocessor()
+    color_index, pattern_score, structure = legacy_features(preprocessor, image)
+    fused_color_index, fused_pattern_score, fused_structure = preprocessor._extract_fused(image)
+
+    assert fused_color_index == pytest.approx(color_index, abs=1e-9)
+    assert fused_pattern_score == pytest.approx(pattern_score, abs=1e-6)
+    assert fused_structure == structure
+
+
+def test_extract_features_uses_fused_result():
+    preprocessor = ImagePreprocessor()
+    image = fixture_images()[1][1]
+    color_index, pattern_score, structure = preprocessor._extract_fused(image)
+
+    assert preprocessor.extract_features(image) == {
+        'leaf_color_index': float(color_index),
+        'surface_pattern_score': float(pattern_score),
+        'structural_features': structure
+    }
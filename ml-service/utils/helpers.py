@@ -1,37 +1,65 @@
 from PIL import Image
 from io import BytesIO
+import hashlib
+import os
 import numpy as np
 
+# Upload limits
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+READ_CHUNK_SIZE = 64 * 1024
+SUPPORTED_FORMATS = ('JPEG', 'PNG', 'JPG', 'WEBP')
+
+def read_upload(image_file, max_bytes=MAX_FILE_SIZE):
+    """
+    Read an uploaded file in chunks, stopping as soon as the size limit is exceeded
+    
+    Args:
+        image_file: File object
+        max_bytes: Maximum accepted size in bytes
+    
+    Returns:
+        File contents as bytes, or None if the file is larger than max_bytes
+    """
+    buffer = bytearray()
+    while True:
+        chunk = image_file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return bytes(buffer)
+        
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            return None
+
 def validate_image(image_file):
     """
     Validate uploaded image
     
+    The upload is read once and only the image header is parsed here. The
+    returned PIL image is decoded later by ImagePreprocessor.preprocess.
+    
     Args:
         image_file: File object
     
     Returns:
-        Dictionary with validation result
+        Dictionary with validation result, plus the parsed image and raw bytes
+        when the upload is valid
     """
     try:
         # Check if file exists
         if not image_file:
             return {'valid': False, 'error': 'No file provided'}
         
-        # Check file size (max 10MB)
-        image_file.seek(0, 2)  # Seek to end
-        file_size = image_file.tell()
-        image_file.seek(0)  # Reset to beginning
-        
-        if file_size > 10 * 1024 * 1024:  # 10MB
+        # Check file size (max 10MB) while reading
+        image_bytes = read_upload(image_file)
+        if image_bytes is None:
             return {'valid': False, 'error': 'File size exceeds 10MB limit'}
         
-        # Try to open as image
+        # Try to open as image (header only, no pixel decode)
         try:
-            image = Image.open(BytesIO(image_file.read()))
-            image_file.seek(0)  # Reset for actual processing
+            image = Image.open(BytesIO(image_bytes))
             
             # Check format
-            if image.format not in ['JPEG', 'PNG', 'JPG', 'WEBP']:
+            if image.format not in SUPPORTED_FORMATS:
                 return {'valid': False, 'error': f'Unsupported image format: {image.format}'}
             
             # Check dimensions
@@ -42,7 +70,7 @@ def validate_image(image_file):
             if width > 5000 or height > 5000:
                 return {'valid': False, 'error': 'Image dimensions too large (maximum 5000x5000)'}
             
-            return {'valid': True}
+            return {'valid': True, 'image': image, 'image_bytes': image_bytes}
             
         except Exception as e:
             return {'valid': False, 'error': f'Invalid image file: {str(e)}'}
@@ -55,18 +83,20 @@ def calculate_confidence_score(yolo_predictions, visual_features):
     Calculate overall confidence score for the analysis
     
     Args:
-        yolo_predictions: List of YOLO predictions
+        yolo_predictions: List of YOLO predictions, or columnar predictions
         visual_features: Dictionary of visual features
     
     Returns:
         Confidence score (0-1)
     """
     try:
-        # Base confidence from YOLO predictions
-        if yolo_predictions:
-            max_confidence = max([pred.get('confidence', 0) for pred in yolo_predictions])
+        # Base confidence from YOLO predictions (list of dicts or columnar dict)
+        if isinstance(yolo_predictions, dict):
+            confidences = yolo_predictions.get('confidence', [])
         else:
-            max_confidence = 0.5
+            confidences = [pred.get('confidence', 0) for pred in yolo_predictions or []]
+        
+        max_confidence = max(confidences) if confidences else 0.5
         
         # Adjust based on visual features quality
         color_index = visual_features.get('leaf_color_index', 0.5)
@@ -84,3 +114,34 @@ def calculate_confidence_score(yolo_predictions, visual_features):
         print(f"Error calculating confidence: {str(e)}")
         return 0.5
 
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file, read in chunks
+    
+    Args:
+        path: File path
+    
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_signature(path):
+    """
+    Modification time and size of a file, used to notice it being replaced
+    
+    Args:
+        path: File path
+    
+    Returns:
+        (st_mtime_ns, st_size) tuple, or None if the file is missing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
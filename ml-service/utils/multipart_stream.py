@@ -0,0 +1,80 @@
+from io import BytesIO
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+from utils.helpers import MAX_FILE_SIZE, READ_CHUNK_SIZE
+
+
+class StreamedUpload:
+    """
+    Uploaded file received from a streamed multipart body
+    
+    Provides the parts of werkzeug's FileStorage used by validate_image.
+    """
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._buffer = BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+def iter_uploads(stream, content_type, field_name, max_bytes=MAX_FILE_SIZE):
+    """
+    Parse a multipart/form-data body incrementally
+    
+    Unlike request.files, which parses the whole body first, each file is
+    returned as soon as its part has been received and only one file is held
+    in memory at a time.
+    
+    Args:
+        stream: Request body stream (request.stream)
+        content_type: Content-Type header including the multipart boundary
+        field_name: Form field whose files are returned
+        max_bytes: Files larger than this are truncated just past the limit,
+            so validate_image still rejects them without buffering them whole
+    
+    Returns:
+        Iterator of StreamedUpload objects in upload order
+    
+    Raises:
+        ValueError: If the request is not multipart/form-data
+    """
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected a multipart/form-data request')
+
+    return _read_parts(stream, MultipartDecoder(boundary.encode('latin-1')), field_name, max_bytes)
+
+
+def _read_parts(stream, decoder, field_name, max_bytes):
+    """
+    Feed the body to the decoder in chunks and yield each completed file
+    """
+    current = None
+
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        decoder.receive_data(chunk or None)
+
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                current = (event.filename, bytearray()) if event.name == field_name else None
+            elif isinstance(event, Data):
+                if current is not None:
+                    filename, buffer = current
+                    if len(buffer) <= max_bytes:
+                        buffer.extend(event.data)
+                    if not event.more_data:
+                        yield StreamedUpload(filename, bytes(buffer))
+                        current = None
+            else:
+                # Non-file form fields are ignored
+                current = None
+            event = decoder.next_event()
+
+        if isinstance(event, Epilogue) or not chunk:
+            return
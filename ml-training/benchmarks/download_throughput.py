@@ -0,0 +1,58 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fixture_server import FixtureServer
+from downloader import ImageDownloader
+
+
+def sequential(dataset):
+    """
+    The previous behaviour: one bare requests.get per image, no session reuse
+    """
+    start = time.time()
+    downloaded = 0
+    for item in dataset:
+        try:
+            response = requests.get(item['image_url'], timeout=10)
+            downloaded += response.status_code == 200
+        except Exception:
+            pass
+    elapsed = time.time() - start
+    return {'downloaded': downloaded, 'seconds': elapsed, 'images_per_sec': downloaded / elapsed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare sequential and pooled concurrent image downloads')
+    parser.add_argument('--images', type=int, default=300)
+    parser.add_argument('--latency-ms', type=float, default=50, help='Simulated per-request latency')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='Fraction of images failing once with 503')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--per-host', type=int, default=8)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    with FixtureServer(args.images, args.latency_ms) as server:
+        baseline = sequential(server.dataset())
+
+    with FixtureServer(args.images, args.latency_ms, args.failure_rate) as server:
+        downloader = ImageDownloader(max_workers=args.workers, per_host=args.per_host, backoff=0.05)
+        results, stats = downloader.download_all(server.dataset())
+        mismatched = sum(
+            1 for item, content, _ in results
+            if content != server.image_bytes(int(item['_id'][len('fixture'):]))
+        )
+
+    print(f"sequential: {baseline['images_per_sec']:.1f} images/sec (no retries)")
+    print(f"concurrent: {stats['images_per_sec']:.1f} images/sec, {stats['retries']} retries, {mismatched} mismatched")
+    print(f"speedup: x{stats['images_per_sec'] / baseline['images_per_sec']:.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'sequential': baseline, 'concurrent': stats, 'mismatched': mismatched}, f, indent=2)
@@ -0,0 +1,110 @@
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+LABELS = ['healthy', 'leaf_spot', 'root_rot', 'sunburn', 'aloe_rust']
+
+
+def fixture_image(index, size=640):
+    """
+    Deterministic JPEG fixture: a green blob on a brown background
+    """
+    rng = np.random.default_rng(index)
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    image[:] = (110 + rng.integers(0, 30), 85, 60)
+    yy, xx = np.ogrid[:size, :size]
+    center = size // 2 + rng.integers(-size // 8, size // 8, size=2)
+    mask = (yy - center[0]) ** 2 + (xx - center[1]) ** 2 < (size // 3) ** 2
+    image[mask] = (60, 150 + rng.integers(0, 40), 80)
+    noise = rng.integers(-10, 11, size=image.shape, dtype=np.int16)
+    image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    buffer = BytesIO()
+    Image.fromarray(image).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class FixtureServer:
+    def __init__(self, count, latency_ms=0, failure_rate=0.0, image_size=640, distinct=32):
+        """
+        Local HTTP stand-in for the image host, serving /images/<n>.jpg
+
+        Args:
+            count: Number of images served (n in 0..count-1)
+            latency_ms: Delay before each response, like a remote round trip
+            failure_rate: Fraction of paths answering 503 on their first request
+            image_size: Fixture width/height in pixels
+            distinct: Distinct fixture images, reused cyclically to keep start-up fast
+        """
+        self.count = count
+        self.latency = latency_ms / 1000
+        self.failing = {n for n in range(count) if (n * 7919) % 1000 < failure_rate * 1000}
+        self.images = [fixture_image(n, image_size) for n in range(min(distinct, count))]
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def image_bytes(self, n):
+        return self.images[n % len(self.images)]
+
+    def url(self, n):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/images/{n}.jpg"
+
+    def dataset(self):
+        """
+        Training documents shaped like MongoDB trainingdatasets entries
+        """
+        return [
+            {'_id': f'fixture{n:06d}', 'label': LABELS[n % len(LABELS)], 'image_url': self.url(n)}
+            for n in range(self.count)
+        ]
+
+    def __enter__(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with fixture._lock:
+                    fixture.requests += 1
+                time.sleep(fixture.latency)
+                try:
+                    n = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+                except ValueError:
+                    n = -1
+                if not 0 <= n < fixture.count:
+                    self._reply(404, b'not found', 'text/plain')
+                elif n in fixture.failing:
+                    with fixture._lock:
+                        fixture.failing.discard(n)
+                    self._reply(503, b'try again', 'text/plain')
+                else:
+                    self._reply(200, fixture.image_bytes(n), 'image/jpeg')
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,53 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def run_once(images, image_size):
+    """
+    Download and prepare a fixture dataset in this process and report its peak RSS
+    """
+    from benchmarks.fixture_server import FixtureServer
+    from data_preprocessing import DataPreprocessor, peak_rss_mb
+
+    with tempfile.TemporaryDirectory() as output_dir, FixtureServer(images, image_size=image_size) as server:
+        preprocessor = DataPreprocessor(output_dir=output_dir)
+        organized_data = preprocessor.download_images(server.dataset())
+        preprocessor.prepare_yolo_dataset(organized_data, augment=True)
+        dataset_mb = sum(len(server.image_bytes(n)) for n in range(images)) / 1e6
+
+    return {'images': images, 'dataset_mb': dataset_mb, 'peak_rss_mb': peak_rss_mb()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Peak RSS of download + prepare_yolo_dataset as the dataset grows')
+    parser.add_argument('--sizes', type=str, default='100,400,1600', help='Dataset sizes to run')
+    parser.add_argument('--image-size', type=int, default=1280, help='Fixture width/height in pixels')
+    parser.add_argument('--single', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_once(args.single, args.image_size)))
+        sys.exit(0)
+
+    # Each size runs in a fresh process so peak RSS is not carried over
+    report = []
+    for size in [int(item) for item in args.sizes.split(',')]:
+        output = subprocess.run(
+            [sys.executable, __file__, '--single', str(size), '--image-size', str(args.image_size)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        report.append(json.loads(output.strip().splitlines()[-1]))
+
+    for row in report:
+        print(f"{row['images']:>6} images  {row['dataset_mb']:8.1f} MB of images  peak RSS {row['peak_rss_mb']:7.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
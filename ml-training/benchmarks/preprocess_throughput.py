@@ -0,0 +1,72 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fixture_server import FixtureServer
+from data_preprocessing import DataPreprocessor
+
+
+def tree_digest(output_dir):
+    """
+    Digest of the names and contents of every split image and label file
+    """
+    digest = hashlib.sha256()
+    for split_name in ('train', 'val', 'test'):
+        for subdir in ('images', 'labels'):
+            for path in sorted((Path(output_dir) / split_name / subdir).iterdir()):
+                digest.update(f'{split_name}/{subdir}/{path.name}'.encode())
+                digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def run_once(server, workers, chunk_size, seed):
+    """
+    Download and prepare the fixture dataset with a given number of workers
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        preprocessor = DataPreprocessor(output_dir=output_dir, workers=workers, chunk_size=chunk_size)
+        organized_data = preprocessor.download_images(server.dataset())
+        split_stats = preprocessor.prepare_yolo_dataset(organized_data, augment=True, seed=seed)
+        return {
+            'workers': workers,
+            'splits': {stats['split']: stats for stats in split_stats},
+            'digest': tree_digest(output_dir)
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split processing throughput by worker count')
+    parser.add_argument('--images', type=int, default=400, help='Fixture dataset size')
+    parser.add_argument('--image-size', type=int, default=1280, help='Fixture width/height in pixels')
+    parser.add_argument('--workers', type=str, default=f'1,{os.cpu_count() or 1}', help='Worker counts to run')
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON output path')
+    args = parser.parse_args()
+
+    with FixtureServer(args.images, image_size=args.image_size) as server:
+        report = [
+            run_once(server, int(workers), args.chunk_size, args.seed)
+            for workers in args.workers.split(',')
+        ]
+
+    for row in report:
+        rates = '  '.join(
+            f"{name} {stats['images_per_sec']:7.1f} images/sec" for name, stats in row['splits'].items()
+        )
+        print(f"{row['workers']:>3} workers  {rates}  output {row['digest'][:12]}")
+
+    identical = len({row['digest'] for row in report}) == 1
+    print('Output identical across worker counts' if identical else 'Output differs between worker counts')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(0 if identical else 1)
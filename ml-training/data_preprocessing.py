@@ -1,19 +1,155 @@
 import os
+import random
+import resource
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from pathlib import Path
+from urllib.parse import urlsplit
 import cv2
-import numpy as np
 from PIL import Image
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import json
 from tqdm import tqdm
+from downloader import ImageDownloader, print_stats
 
 load_dotenv()
 
+# Image file extensions kept for staged downloads
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+# Fields of trainingdatasets documents used by the pipeline (updatedAt is
+# checked by the image cache)
+TRAINING_PROJECTION = {'_id': 1, 'label': 1, 'image_url': 1, 'updatedAt': 1}
+
+# Images written per source image when augmenting (original + augment_image variants)
+AUGMENTATIONS = 4
+
+
+def _write_image(path, image):
+    """
+    Encode an RGB image as JPEG, replacing path atomically
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'.{path.stem}.tmp-{os.getpid()}.jpg')
+    cv2.imwrite(str(temp_path), cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    os.replace(temp_path, path)
+
+
+def _link_or_copy(source, target):
+    """
+    Hard-link a cached file into the dataset, copying across filesystems
+    """
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _init_worker():
+    """
+    Keep OpenCV single-threaded in pool workers, the pool supplies the parallelism
+    """
+    cv2.setNumThreads(1)
+
+
+def _process_chunk(split_dir, augment, items):
+    """
+    Decode, augment and write one chunk of a split with its label files
+    
+    Runs in a pool worker (or inline with a single worker). Output names are
+    fixed by the parent before the chunk is submitted, so the files written
+    do not depend on which worker handles which chunk.
+    
+    Args:
+        split_dir: Split directory holding images/ and labels/
+        augment: Also write the augment_image variants
+        items: Work items with 'stem', 'class_id' and 'path', plus 'cached'
+            (processed files to link) or 'cache_paths' (where to write the
+            processed files before linking them) for images in the cache
+    
+    Returns:
+        Number of images written per item, None for unreadable images
+    """
+    count = AUGMENTATIONS if augment else 1
+    written = []
+    
+    for item in items:
+        image_paths = [
+            split_dir / 'images' / f"{item['stem']}_{aug_idx}.jpg"
+            for aug_idx in range(count)
+        ]
+        
+        cached_paths = item.get('cached')
+        if cached_paths is None:
+            # Decode image
+            image = cv2.imread(str(item['path']), cv2.IMREAD_COLOR)
+            if image is None:
+                written.append(None)
+                continue
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            
+            # Apply augmentation if needed
+            if augment:
+                images = DataPreprocessor.augment_image(image)
+            else:
+                images = [image]
+            
+            cached_paths = item.get('cache_paths')
+            for img, path in zip(images, cached_paths or image_paths):
+                _write_image(path, img)
+        
+        if cached_paths is not None:
+            for cached_path, image_path in zip(cached_paths, image_paths):
+                _link_or_copy(cached_path, image_path)
+        
+        for image_path in image_paths:
+            # Create YOLO format label file (for now, we'll use classification)
+            # In full implementation, bounding boxes would be extracted from scan data
+            label_path = split_dir / 'labels' / f"{image_path.stem}.txt"
+            
+            # For classification, we'll create a placeholder
+            # In production, this should contain bounding box annotations
+            with open(label_path, 'w') as f:
+                # Format: class_id center_x center_y width height (normalized)
+                # For now, we'll use the full image as a bounding box
+                f.write(f"{item['class_id']} 0.5 0.5 1.0 1.0")
+        
+        written.append(len(image_paths))
+    
+    return written
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB
+    """
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
 class DataPreprocessor:
-    def __init__(self, output_dir='dataset'):
+    def __init__(self, output_dir='dataset', cache=None, workers=None, chunk_size=None, db=None):
+        """
+        Args:
+            output_dir: Directory the YOLO dataset is written to
+            cache: Optional ImageCache; cached originals are not downloaded
+                again and cached processed images are not re-encoded
+            workers: Processes decoding, augmenting and writing the splits
+                (PREPROCESS_WORKERS, default the CPU count)
+            chunk_size: Source images per work unit (PREPROCESS_CHUNK_SIZE, default 16)
+            db: Optional MongoDB database to fetch from; a client for
+                MONGO_URI/MONGO_DB is created on first use otherwise
+        """
         self.output_dir = Path(output_dir)
+        self.cache = cache
+        self.db = db
+        self.workers = workers or int(os.getenv('PREPROCESS_WORKERS', os.cpu_count() or 1))
+        self.chunk_size = chunk_size or int(os.getenv('PREPROCESS_CHUNK_SIZE', 16))
         self.output_dir.mkdir(exist_ok=True)
         
         # Create directory structure
@@ -23,57 +159,151 @@ class DataPreprocessor:
         (self.output_dir / 'val' / 'labels').mkdir(parents=True, exist_ok=True)
         (self.output_dir / 'test' / 'images').mkdir(parents=True, exist_ok=True)
         (self.output_dir / 'test' / 'labels').mkdir(parents=True, exist_ok=True)
+        
+        # Downloads are streamed here before being written into the splits
+        self.staging_dir = self.output_dir / '.staging'
     
-    def fetch_from_mongodb(self, limit=None):
+    def fetch_from_mongodb(self, limit=None, include_trained=False, batch_size=None):
         """
         Fetch validated training data from MongoDB
+        
+        Only the TRAINING_PROJECTION fields are fetched, through a cursor
+        that reads batch_size documents per round trip as download_images
+        consumes it, so the result set is never loaded at once.
+        
+        Args:
+            limit: Optional maximum number of documents
+            include_trained: Also fetch documents used by earlier training runs
+            batch_size: Documents per cursor batch (MONGO_BATCH_SIZE, default 500)
+        
+        Returns:
+            Cursor over the matching trainingdatasets documents
         """
-        client = MongoClient(os.getenv('MONGO_URI'))
-        db = client[os.getenv('MONGO_DB', 'aloe-vera')]
-        collection = db.trainingdatasets
+        if self.db is None:
+            self.db = MongoClient(os.getenv('MONGO_URI'))[os.getenv('MONGO_DB', 'aloe-vera')]
+        collection = self.db.trainingdatasets
         
-        query = {
-            'validation_status': 'validated',
-            'added_to_training': False
-        }
+        query = {'validation_status': 'validated'}
+        if not include_trained:
+            query['added_to_training'] = False
         
+        batch_size = batch_size or int(os.getenv('MONGO_BATCH_SIZE', 500))
+        cursor = collection.find(query, TRAINING_PROJECTION).batch_size(batch_size)
         if limit:
-            dataset = list(collection.find(query).limit(limit))
-        else:
-            dataset = list(collection.find(query))
+            cursor = cursor.limit(limit)
         
-        print(f"Fetched {len(dataset)} validated images from MongoDB")
-        return dataset
+        return cursor
     
-    def download_images(self, dataset):
+    def download_images(self, dataset, downloader=None, chunk_size=None):
         """
         Download images from URLs and organize by label
+        
+        The dataset is read chunk_size documents at a time. Each chunk is
+        checked against the image cache, its misses are fetched concurrently
+        over one pooled session, with retries and a per-host limit (see
+        ImageDownloader), and streamed straight to files in the staging
+        directory before the next chunk is read. Only lightweight records
+        outlive their chunk, so memory use does not grow with the documents
+        held by the dataset.
+        
+        Args:
+            dataset: Training documents with image_url and label (a list or
+                the fetch_from_mongodb cursor, read once)
+            downloader: Optional ImageDownloader (defaults from the environment)
+            chunk_size: Documents read and downloaded per chunk
+                (DOWNLOAD_CHUNK_SIZE, default 500)
+            
+        Returns:
+            Dict of label -> list of {'source_id', 'document_id', 'label',
+            'path', 'sha256'} records
         """
-        import requests
+        downloader = downloader or ImageDownloader()
+        chunk_size = chunk_size or int(os.getenv('DOWNLOAD_CHUNK_SIZE', 500))
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
         
         organized_data = {}
         
-        for item in tqdm(dataset, desc="Downloading images"):
+        def add_record(item, image_path, sha256):
             label = item['label']
-            image_url = item['image_url']
             
             if label not in organized_data:
                 organized_data[label] = []
             
-            try:
-                response = requests.get(image_url, timeout=10)
-                if response.status_code == 200:
-                    organized_data[label].append({
-                        'image_data': response.content,
-                        'source_id': str(item['_id']),
-                        'label': label
-                    })
-            except Exception as e:
-                print(f"Error downloading image {image_url}: {str(e)}")
+            organized_data[label].append({
+                'source_id': str(item['_id']),
+                'document_id': item['_id'],
+                'label': label,
+                'path': image_path,
+                'sha256': sha256
+            })
+        
+        fetched = 0
+        cached_count = 0
+        totals = {'images': 0, 'downloaded': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+        start_time = time.time()
+        documents = iter(dataset)
+        
+        with tqdm(desc="Downloading images", unit='img') as progress:
+            while True:
+                chunk = list(islice(documents, chunk_size))
+                if not chunk:
+                    break
+                fetched += len(chunk)
+                
+                # Only documents that are new or changed since they were cached are downloaded
+                to_download = []
+                for item in chunk:
+                    cached = self.cache.lookup(item) if self.cache else None
+                    if cached is not None:
+                        add_record(item, cached['path'], cached['sha256'])
+                        cached_count += 1
+                        progress.update(1)
+                    else:
+                        to_download.append(item)
+                
+                if not to_download:
+                    continue
+                
+                results, stats = downloader.download_all(
+                    to_download, path_for=self._staging_path, progress=progress
+                )
+                for key in totals:
+                    totals[key] += stats[key]
+                
+                for item, image_path, error in results:
+                    if error is not None:
+                        print(f"Error downloading image {error}")
+                        continue
+                    
+                    if self.cache:
+                        cached = self.cache.add_original(item, image_path)
+                        add_record(item, cached['path'], cached['sha256'])
+                    else:
+                        add_record(item, image_path, None)
+        
+        print(f"Fetched {fetched} validated images")
+        if self.cache:
+            print(f"Image cache: {cached_count} cached, {totals['images']} not cached")
+        
+        elapsed = time.time() - start_time
+        totals['seconds'] = elapsed
+        totals['images_per_sec'] = totals['downloaded'] / elapsed if elapsed > 0 else 0.0
+        totals['mb_per_sec'] = totals['bytes'] / elapsed / 1e6 if elapsed > 0 else 0.0
+        print_stats(totals)
         
         return organized_data
     
-    def augment_image(self, image):
+    def _staging_path(self, item):
+        """
+        Staging file for a training document's image
+        """
+        suffix = Path(urlsplit(item['image_url']).path).suffix.lower()
+        if suffix not in IMAGE_SUFFIXES:
+            suffix = '.jpg'
+        return self.staging_dir / f"{item['_id']}{suffix}"
+    
+    @staticmethod
+    def augment_image(image):
         """
         Apply data augmentation to image
         """
@@ -97,9 +327,19 @@ class DataPreprocessor:
         
         return augmented_images
     
-    def prepare_yolo_dataset(self, organized_data, train_split=0.7, val_split=0.2, augment=True):
+    def prepare_yolo_dataset(self, organized_data, train_split=0.7, val_split=0.2, augment=True, seed=None):
         """
         Prepare dataset in YOLO format
+        
+        Args:
+            organized_data: Dict of label -> records from download_images
+            train_split: Fraction of images for training
+            val_split: Fraction of images for validation
+            augment: Write augmented variants of the training images
+            seed: Optional shuffle seed; the same seed and dataset give the same splits
+        
+        Returns:
+            Processing stats per split (see _process_split)
         """
         class_names = [
             'healthy', 'leaf_spot', 'root_rot', 'sunburn', 'aloe_rust',
@@ -113,20 +353,35 @@ class DataPreprocessor:
         with open(self.output_dir / 'classes.txt', 'w') as f:
             f.write('\n'.join(class_names))
         
+        # Drop everything an earlier run left (files, links or directories)
+        # so the splits hold exactly this dataset; cached images are hard
+        # links, so removing them here leaves the cache intact
+        for split_name in ('train', 'val', 'test'):
+            for subdir in ('images', 'labels'):
+                split_subdir = self.output_dir / split_name / subdir
+                if split_subdir.is_symlink() or split_subdir.is_file():
+                    split_subdir.unlink()
+                elif split_subdir.exists():
+                    shutil.rmtree(split_subdir)
+                split_subdir.mkdir(parents=True)
+        
         all_data = []
         
-        # Flatten and organize data
+        # Flatten and organize data (records point at staged files, images
+        # are only read one at a time while processing)
         for label, items in organized_data.items():
             for item in items:
                 all_data.append({
-                    'image_data': item['image_data'],
+                    'source_id': item['source_id'],
+                    'path': item['path'],
+                    'sha256': item.get('sha256'),
                     'label': label,
                     'class_id': class_to_id.get(label, 0)
                 })
         
-        # Shuffle
-        import random
-        random.shuffle(all_data)
+        # Shuffle (from a fixed order, so a seed reproduces the splits)
+        all_data.sort(key=lambda item: item['source_id'])
+        random.Random(seed).shuffle(all_data)
         
         # Split dataset
         total = len(all_data)
@@ -137,49 +392,107 @@ class DataPreprocessor:
         val_data = all_data[train_end:val_end]
         test_data = all_data[val_end:]
         
-        # Process splits
-        self._process_split(train_data, 'train', augment)
-        self._process_split(val_data, 'val', False)
-        self._process_split(test_data, 'test', False)
+        # Process splits, sharing one pool of worker processes
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        try:
+            split_stats = [
+                self._process_split(train_data, 'train', augment, pool),
+                self._process_split(val_data, 'val', False, pool),
+                self._process_split(test_data, 'test', False, pool)
+            ]
+        finally:
+            if pool is not None:
+                pool.shutdown()
         
         print(f"\nDataset prepared:")
         print(f"  Train: {len(train_data)} images")
         print(f"  Val: {len(val_data)} images")
         print(f"  Test: {len(test_data)} images")
+        print(f"  Peak RSS: {peak_rss_mb():.1f} MB")
+        
+        # Staged downloads have been written into the splits (or the cache)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        
+        if self.cache:
+            self.cache.evict()
+            self.cache.save()
+            stats = self.cache.stats()
+            print(
+                f"  Image cache: {stats['hits']} originals and {stats['processed_hits']} processed images reused, "
+                f"{stats['images']} images ({stats['total_bytes'] / 1e6:.1f} MB) cached"
+            )
+        
+        return split_stats
     
-    def _process_split(self, data, split_name, augment):
+    def _process_split(self, data, split_name, augment, pool=None):
         """
         Process a data split
+        
+        Items are processed in chunks of chunk_size by _process_chunk, in
+        the pool's worker processes when one is given. Every item is named
+        after its position in the split before any work is submitted, so the
+        images and labels written are the same for any number of workers.
+        Cache lookups and manifest updates stay in this process.
+        
+        Args:
+            data: Records of the split
+            split_name: 'train', 'val' or 'test'
+            augment: Also write the augment_image variants
+            pool: Optional ProcessPoolExecutor; chunks run inline without one
+        
+        Returns:
+            Dict with images, files, skipped, seconds and images_per_sec
         """
-        for idx, item in enumerate(tqdm(data, desc=f"Processing {split_name}")):
-            # Decode image
-            image = np.frombuffer(item['image_data'], np.uint8)
-            image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Apply augmentation if needed
-            if augment:
-                images = self.augment_image(image)
-            else:
-                images = [image]
+        count = AUGMENTATIONS if augment else 1
+        work = []
+        
+        for idx, item in enumerate(data):
+            unit = {'stem': f"{split_name}_{idx}", 'class_id': item['class_id'], 'path': str(item['path'])}
             
-            for aug_idx, img in enumerate(images):
-                # Save image
-                image_filename = f"{split_name}_{idx}_{aug_idx}.jpg"
-                image_path = self.output_dir / split_name / 'images' / image_filename
-                cv2.imwrite(str(image_path), cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-                
-                # Create YOLO format label file (for now, we'll use classification)
-                # In full implementation, bounding boxes would be extracted from scan data
-                label_filename = image_filename.replace('.jpg', '.txt')
-                label_path = self.output_dir / split_name / 'labels' / label_filename
-                
-                # For classification, we'll create a placeholder
-                # In production, this should contain bounding box annotations
-                with open(label_path, 'w') as f:
-                    # Format: class_id center_x center_y width height (normalized)
-                    # For now, we'll use the full image as a bounding box
-                    f.write(f"{item['class_id']} 0.5 0.5 1.0 1.0")
+            # Processed images are taken from the cache when it has them,
+            # and written to it otherwise
+            sha256 = item.get('sha256') if self.cache else None
+            if sha256:
+                unit['cached'] = self.cache.cached_processed(sha256, count)
+                if unit['cached'] is None:
+                    unit['cache_paths'] = self.cache.processed_paths(sha256, count)
+            work.append(unit)
+        
+        chunks = [work[start:start + self.chunk_size] for start in range(0, len(work), self.chunk_size)]
+        process = partial(_process_chunk, self.output_dir / split_name, augment)
+        
+        start_time = time.time()
+        written = []
+        with tqdm(total=len(work), desc=f"Processing {split_name}", unit='img') as progress:
+            for chunk_written in (pool.map(process, chunks) if pool else map(process, chunks)):
+                written.extend(chunk_written)
+                progress.update(len(chunk_written))
+        elapsed = time.time() - start_time
+        
+        skipped = 0
+        for item, unit, files in zip(data, work, written):
+            if files is None:
+                print(f"Skipping unreadable image {item['path']}")
+                skipped += 1
+            elif 'cache_paths' in unit:
+                self.cache.record_processed(item['sha256'], unit['cache_paths'])
+        
+        images = len(data) - skipped
+        stats = {
+            'split': split_name,
+            'images': images,
+            'files': sum(files for files in written if files),
+            'skipped': skipped,
+            'seconds': elapsed,
+            'images_per_sec': images / elapsed if elapsed > 0 else 0.0
+        }
+        print(
+            f"Processed {split_name}: {images} images ({stats['files']} files) in {elapsed:.1f}s, "
+            f"{stats['images_per_sec']:.1f} images/sec with {self.workers if pool else 1} workers"
+        )
+        return stats
     
     def create_dataset_config(self):
         """
@@ -209,15 +522,12 @@ class DataPreprocessor:
 if __name__ == '__main__':
     preprocessor = DataPreprocessor()
     
-    # Fetch data from MongoDB
-    dataset = preprocessor.fetch_from_mongodb(limit=1000)
+    # Fetch data from MongoDB, download and organize
+    organized_data = preprocessor.download_images(preprocessor.fetch_from_mongodb(limit=1000))
     
-    if len(dataset) == 0:
+    if not organized_data:
         print("No validated data found in MongoDB")
     else:
-        # Download and organize
-        organized_data = preprocessor.download_images(dataset)
-        
         # Prepare YOLO dataset
         preprocessor.prepare_yolo_dataset(organized_data)
         
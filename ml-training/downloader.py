@@ -0,0 +1,245 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+load_dotenv()
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest Retry-After we are willing to honour, in seconds
+MAX_RETRY_AFTER = 30
+# Bytes read from the socket and written to disk at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """
+    Raised when an image could not be downloaded after all retries
+    """
+
+
+class ImageDownloader:
+    def __init__(self, max_workers=None, per_host=None, retries=None, backoff=None, timeout=None):
+        """
+        Concurrent image downloader sharing one pooled HTTP session
+
+        Args:
+            max_workers: Downloads in flight at once (DOWNLOAD_WORKERS, default 16)
+            per_host: Downloads in flight per host (DOWNLOAD_PER_HOST, default 8)
+            retries: Retries after a failed attempt (DOWNLOAD_RETRIES, default 3)
+            backoff: Base delay in seconds, doubled for every retry (DOWNLOAD_BACKOFF, default 0.5)
+            timeout: Connect/read timeout in seconds (DOWNLOAD_TIMEOUT, default 10)
+        """
+        self.max_workers = max_workers or int(os.getenv('DOWNLOAD_WORKERS', 16))
+        self.per_host = per_host or int(os.getenv('DOWNLOAD_PER_HOST', 8))
+        self.retries = retries if retries is not None else int(os.getenv('DOWNLOAD_RETRIES', 3))
+        self.backoff = backoff if backoff is not None else float(os.getenv('DOWNLOAD_BACKOFF', 0.5))
+        self.timeout = timeout or float(os.getenv('DOWNLOAD_TIMEOUT', 10))
+
+        # Keep-alive connections are reused across downloads; the pool is
+        # sized so no worker waits for a connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+
+    def _host_slot(self, url):
+        """
+        Semaphore limiting concurrent downloads from the URL's host
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _retry_delay(self, attempt, response=None):
+        """
+        Exponential backoff with jitter, or the server's Retry-After if it sent one
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(int(retry_after), MAX_RETRY_AFTER)
+        delay = self.backoff * (2 ** attempt)
+        return delay + random.uniform(0, delay)
+
+    def fetch(self, url):
+        """
+        Download one URL into memory, retrying transient failures
+
+        Args:
+            url: Image URL
+
+        Returns:
+            Response body as bytes
+
+        Raises:
+            DownloadError: If the download failed after all retries
+        """
+        return self._with_retries(url, lambda response: response.content)
+
+    def fetch_to_file(self, url, path):
+        """
+        Stream one URL to a file, retrying transient failures
+
+        The body is written in CHUNK_SIZE pieces to a temporary file that is
+        renamed to path once complete, so memory use does not depend on the
+        image size and path never holds a partial download.
+
+        Args:
+            url: Image URL
+            path: Destination file
+
+        Returns:
+            Number of bytes written
+
+        Raises:
+            DownloadError: If the download failed after all retries
+        """
+        path = Path(path)
+        temp_path = path.with_name(f'.{path.name}.part-{threading.get_ident()}')
+
+        def write(response):
+            size = 0
+            try:
+                with open(temp_path, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(temp_path, path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+            return size
+
+        return self._with_retries(url, write, stream=True)
+
+    def _with_retries(self, url, read, stream=False):
+        """
+        GET url and pass a 200 response to read(), retrying transient failures
+        """
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                # The host slot covers reading the body, which is when the
+                # connection is busy
+                with self._host_slot(url):
+                    response = self.session.get(url, timeout=self.timeout, stream=stream)
+                    with response:
+                        if response.status_code == 200:
+                            return read(response)
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = str(e)
+
+            if attempt < self.retries:
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self._retry_delay(attempt, response))
+
+        raise DownloadError(f"{url}: {error}")
+
+    def _download_item(self, url, path):
+        """
+        Returns:
+            (image bytes or path, size in bytes)
+        """
+        if path is None:
+            content = self.fetch(url)
+            return content, len(content)
+        return path, self.fetch_to_file(url, path)
+
+    def download_all(self, items, url_key='image_url', path_for=None, progress=None):
+        """
+        Download the image of every item concurrently
+
+        Args:
+            items: Documents with an image URL under url_key; they are all
+                held until the call returns, so pass large datasets one chunk
+                per call
+            path_for: Optional function mapping an item to a file path; each
+                image is then streamed to that file instead of held in memory
+            progress: Optional tqdm bar shared across calls; the throughput
+                summary is then left to the caller
+
+        Returns:
+            (results, stats) where results lists (item, image bytes or file
+            path or None, error or None) in the order of items
+        """
+        items = list(items)
+        results = [None] * len(items)
+        total_bytes = 0
+        failed = 0
+        self.retried = 0
+        start_time = time.time()
+
+        own_progress = progress is None
+        if own_progress:
+            progress = tqdm(total=len(items), desc="Downloading images", unit='img')
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='download') as pool:
+                futures = {
+                    pool.submit(self._download_item, item[url_key], path_for(item) if path_for else None): index
+                    for index, item in enumerate(items)
+                }
+
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        payload, size = future.result()
+                        results[index] = (items[index], payload, None)
+                        total_bytes += size
+                    except Exception as e:
+                        results[index] = (items[index], None, str(e))
+                        failed += 1
+
+                    progress.update(1)
+                    elapsed = max(time.time() - start_time, 1e-9)
+                    progress.set_postfix(MBps=f"{total_bytes / elapsed / 1e6:.1f}", failed=failed)
+        finally:
+            if own_progress:
+                progress.close()
+
+        elapsed = time.time() - start_time
+        stats = {
+            'images': len(items),
+            'downloaded': len(items) - failed,
+            'failed': failed,
+            'retries': self.retried,
+            'bytes': total_bytes,
+            'seconds': elapsed,
+            'images_per_sec': (len(items) - failed) / elapsed if elapsed > 0 else 0.0,
+            'mb_per_sec': total_bytes / elapsed / 1e6 if elapsed > 0 else 0.0
+        }
+        if own_progress:
+            print_stats(stats)
+        return results, stats
+
+
+def print_stats(stats):
+    """
+    Print the throughput summary of download_all stats
+    """
+    print(
+        f"Downloaded {stats['downloaded']}/{stats['images']} images ({stats['bytes'] / 1e6:.1f} MB) "
+        f"in {stats['seconds']:.1f}s: {stats['images_per_sec']:.1f} images/sec, {stats['mb_per_sec']:.1f} MB/s, "
+        f"{stats['failed']} failed, {stats['retries']} retries"
+    )
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANIFEST_VERSION = 1
+# Bump when augment_image or the JPEG encoding changes so stale processed outputs are not reused
+PROCESSING_VERSION = 'aug-v1'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """
+    SHA-256 of a file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Persistent content-addressed cache of training images
+
+        Originals are stored once per content hash under
+        originals/<sha[:2]>/<sha><ext>, and their processed (augmented)
+        JPEGs under processed/<PROCESSING_VERSION>/<sha[:2]>/<sha>_<n>.jpg.
+        manifest.json maps each trainingdatasets _id to the image_url and
+        updatedAt it was downloaded for and to its content hash, so a
+        document is only downloaded again when its image may have changed,
+        and only re-processed when its content actually did.
+
+        Args:
+            cache_dir: Cache root (IMAGE_CACHE_DIR, default 'cache')
+            max_bytes: Size bound enforced by evict() (IMAGE_CACHE_MAX_MB, default 20480)
+        """
+        self.cache_dir = Path(cache_dir or os.getenv('IMAGE_CACHE_DIR', 'cache'))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('IMAGE_CACHE_MAX_MB', 20480)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.manifest_path = self.cache_dir / 'manifest.json'
+
+        self.hits = 0
+        self.misses = 0
+        self.processed_hits = 0
+        self._used = set()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        """
+        Read manifest.json, starting empty if it is missing, unreadable or from another version
+        """
+        empty = {'version': MANIFEST_VERSION, 'documents': {}, 'entries': {}}
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        if manifest.get('version') != MANIFEST_VERSION:
+            return empty
+        return manifest
+
+    @staticmethod
+    def _document_version(document):
+        updated_at = document.get('updatedAt')
+        return {
+            'image_url': document['image_url'],
+            'updated_at': updated_at.isoformat() if hasattr(updated_at, 'isoformat') else updated_at
+        }
+
+    def _touch(self, sha256):
+        self.manifest['entries'][sha256]['last_used'] = time.time()
+        self._used.add(sha256)
+
+    def lookup(self, document):
+        """
+        Cached original for a training document
+
+        Returns:
+            {'sha256', 'path'} if the document's image_url and updatedAt are
+            unchanged since it was cached, otherwise None
+        """
+        known = self.manifest['documents'].get(str(document['_id']))
+        entry = self.manifest['entries'].get(known['sha256']) if known else None
+        if entry is None or {k: known[k] for k in ('image_url', 'updated_at')} != self._document_version(document):
+            self.misses += 1
+            return None
+
+        path = self.cache_dir / entry['original']
+        if not path.exists():
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(known['sha256'])
+        return {'sha256': known['sha256'], 'path': path}
+
+    def add_original(self, document, staged_path):
+        """
+        Move a freshly downloaded image into the cache
+
+        Args:
+            document: Training document the image was downloaded for
+            staged_path: Downloaded file (moved, or deleted if the content is already cached)
+
+        Returns:
+            {'sha256', 'path'} of the cached original
+        """
+        staged_path = Path(staged_path)
+        sha256 = file_sha256(staged_path)
+        relative = Path('originals') / sha256[:2] / f'{sha256}{staged_path.suffix}'
+        path = self.cache_dir / relative
+
+        entry = self.manifest['entries'].get(sha256)
+        if entry is not None and (self.cache_dir / entry['original']).exists():
+            # Same content under another _id or a new URL: keep the existing copy
+            staged_path.unlink()
+            path = self.cache_dir / entry['original']
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged_path, path)
+            entry = self.manifest['entries'][sha256] = {
+                'original': str(relative),
+                'size': path.stat().st_size,
+                'processed': {},
+                'last_used': time.time()
+            }
+
+        self.manifest['documents'][str(document['_id'])] = {
+            'sha256': sha256,
+            'label': document.get('label'),
+            **self._document_version(document)
+        }
+        self._touch(sha256)
+        return {'sha256': sha256, 'path': path}
+
+    def processed_paths(self, sha256, count):
+        """
+        Paths for the processed outputs of an image (index 0 is the
+        un-augmented image, then the augmentations in augment_image order)
+        """
+        directory = self.cache_dir / 'processed' / PROCESSING_VERSION / sha256[:2]
+        return [directory / f'{sha256}_{index}.jpg' for index in range(count)]
+
+    def cached_processed(self, sha256, count):
+        """
+        Processed outputs of an image if all count of them are cached, otherwise None
+        """
+        entry = self.manifest['entries'].get(sha256)
+        recorded = entry['processed'].get(PROCESSING_VERSION) if entry else None
+        if not recorded or recorded['count'] < count:
+            return None
+        paths = self.processed_paths(sha256, count)
+        if not all(path.exists() for path in paths):
+            return None
+        self.processed_hits += 1
+        return paths
+
+    def record_processed(self, sha256, paths):
+        """
+        Register processed outputs written to processed_paths(sha256, len(paths))
+        """
+        entry = self.manifest['entries'].get(sha256)
+        if entry is None:
+            return
+        entry['processed'][PROCESSING_VERSION] = {
+            'count': len(paths),
+            'size': sum(Path(path).stat().st_size for path in paths)
+        }
+
+    def _entry_size(self, entry):
+        return entry['size'] + sum(processed['size'] for processed in entry['processed'].values())
+
+    def total_bytes(self):
+        return sum(self._entry_size(entry) for entry in self.manifest['entries'].values())
+
+    def _remove_entry(self, sha256):
+        entry = self.manifest['entries'].pop(sha256)
+        (self.cache_dir / entry['original']).unlink(missing_ok=True)
+        for version, processed in entry['processed'].items():
+            directory = self.cache_dir / 'processed' / version / sha256[:2]
+            for index in range(processed['count']):
+                (directory / f'{sha256}_{index}.jpg').unlink(missing_ok=True)
+        return self._entry_size(entry)
+
+    def evict(self):
+        """
+        Remove least recently used images until the cache fits in max_bytes
+
+        Images used by the current run are kept even if that leaves the cache
+        over its bound. Processed outputs of older PROCESSING_VERSIONs are
+        always dropped.
+
+        Returns:
+            Bytes freed
+        """
+        freed = 0
+        for version_dir in (self.cache_dir / 'processed').glob('*'):
+            if version_dir.name != PROCESSING_VERSION:
+                shutil.rmtree(version_dir, ignore_errors=True)
+        for entry in self.manifest['entries'].values():
+            for version in [version for version in entry['processed'] if version != PROCESSING_VERSION]:
+                freed += entry['processed'].pop(version)['size']
+
+        total = self.total_bytes()
+        candidates = sorted(
+            (sha256 for sha256 in self.manifest['entries'] if sha256 not in self._used),
+            key=lambda sha256: self.manifest['entries'][sha256]['last_used']
+        )
+        evicted = set()
+        for sha256 in candidates:
+            if total <= self.max_bytes:
+                break
+            size = self._remove_entry(sha256)
+            evicted.add(sha256)
+            total -= size
+            freed += size
+
+        if evicted:
+            self.manifest['documents'] = {
+                document_id: known for document_id, known in self.manifest['documents'].items()
+                if known['sha256'] not in evicted
+            }
+            print(f"Evicted {len(evicted)} images ({freed / 1e6:.1f} MB) from the image cache")
+
+        if total > self.max_bytes:
+            print(f"Image cache holds {total / 1e6:.1f} MB for this run, over its {self.max_bytes / 1e6:.1f} MB bound")
+        return freed
+
+    def save(self):
+        """
+        Write manifest.json atomically
+        """
+        self.manifest['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.manifest['processing_version'] = PROCESSING_VERSION
+        self.manifest['total_bytes'] = self.total_bytes()
+        self.manifest['max_bytes'] = self.max_bytes
+
+        temp_path = self.manifest_path.with_name(f'.{self.manifest_path.name}.tmp-{os.getpid()}')
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def stats(self):
+        return {
+            'documents': len(self.manifest['documents']),
+            'images': len(self.manifest['entries']),
+            'total_bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'processed_hits': self.processed_hits
+        }
@@ -0,0 +1,292 @@
+from ultralytics import YOLO
+from pathlib import Path
+import json
+import os
+import random
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from evaluate import ModelEvaluator
+
+load_dotenv()
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# Split the INT8 calibration sample is drawn from; the accuracy gate must use another one
+CALIBRATION_SPLIT = 'val'
+
+def letterbox(image, imgsz=640, pad_value=114):
+    """
+    Resize and pad an image the same way Ultralytics does before inference
+    """
+    h, w = image.shape[:2]
+    scale = min(imgsz / w, imgsz / h)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_w = (imgsz - new_w) / 2
+    pad_h = (imgsz - new_h) / 2
+
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+
+    return cv2.copyMakeBorder(
+        resized, top, bottom, left, right,
+        cv2.BORDER_CONSTANT, value=(pad_value, pad_value, pad_value)
+    )
+
+class ValCalibrationReader:
+    """
+    Feeds letterboxed validation images to ONNX Runtime static quantization
+    (implements the CalibrationDataReader get_next/rewind protocol)
+    """
+    def __init__(self, image_paths, input_name, imgsz=640):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._iterator = iter(self.image_paths)
+
+    def get_next(self):
+        for image_path in self._iterator:
+            image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+
+            # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+            image = letterbox(image, self.imgsz)[:, :, ::-1]
+            tensor = np.ascontiguousarray(image.transpose(2, 0, 1), dtype=np.float32) / 255.0
+            return {self.input_name: tensor[None]}
+        return None
+
+    def rewind(self):
+        self._iterator = iter(self.image_paths)
+
+class ModelQuantizer:
+    def __init__(self, model_path, dataset_config='dataset/dataset.yaml', imgsz=640):
+        """
+        Initialize INT8 post-training quantizer
+
+        Args:
+            model_path: Path to the FP32 checkpoint (.pt)
+            dataset_config: Path to dataset config YAML
+            imgsz: Model input size
+        """
+        self.model_path = Path(model_path)
+        self.dataset_config = dataset_config
+        self.imgsz = imgsz
+
+        if not self.model_path.exists():
+            raise FileNotFoundError(f"Model not found at {self.model_path}")
+
+        with open(dataset_config, 'r') as f:
+            import yaml
+            self.config = yaml.safe_load(f)
+
+    def split_dir(self, split):
+        """
+        Image directory of a dataset split, or None if the config has no such split
+        """
+        if not self.config.get(split):
+            return None
+        return (Path(self.config.get('path', '.')) / self.config[split]).resolve()
+
+    def split_images(self, split):
+        """
+        Sorted image files of a dataset split (empty if it does not exist)
+        """
+        split_dir = self.split_dir(split)
+        if split_dir is None or not split_dir.is_dir():
+            return []
+        return sorted(p for p in split_dir.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+
+    def calibration_images(self, sample_size=200, seed=0):
+        """
+        Pick a reproducible sample of images from the val split
+        """
+        images = self.split_images(CALIBRATION_SPLIT)
+
+        if not images:
+            raise ValueError(f"No calibration images found in {self.split_dir(CALIBRATION_SPLIT)}")
+
+        if len(images) > sample_size:
+            images = random.Random(seed).sample(images, sample_size)
+
+        return images
+
+    def export_fp32(self, output_dir):
+        """
+        Export the FP32 checkpoint to ONNX with a dynamic batch axis
+        """
+        exported = YOLO(str(self.model_path)).export(
+            format='onnx', imgsz=self.imgsz, dynamic=True, half=False
+        )
+        target = Path(output_dir) / f'{self.model_path.stem}_fp32.onnx'
+        shutil.move(str(exported), str(target))
+        return target
+
+    def quantize(self, fp32_path, int8_path, calibration_images):
+        """
+        Run static INT8 quantization calibrated on the given images
+        """
+        import onnx
+        import onnxruntime as ort
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+        session = ort.InferenceSession(str(fp32_path), providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        del session
+
+        reader = ValCalibrationReader(calibration_images, input_name, self.imgsz)
+
+        quantize_static(
+            str(fp32_path),
+            str(int8_path),
+            reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+
+        # Keep the Ultralytics metadata (class names, stride, imgsz) on the INT8 graph
+        fp32_model = onnx.load(str(fp32_path))
+        int8_model = onnx.load(str(int8_path))
+        del int8_model.metadata_props[:]
+        int8_model.metadata_props.extend(fp32_model.metadata_props)
+        onnx.save(int8_model, str(int8_path))
+
+        return int8_path
+
+    def check_gate_split(self, split):
+        """
+        Make sure the accuracy gate runs on held-out images
+
+        Raises:
+            ValueError: If the split is the calibration split (or the same
+                directory) or has no images
+        """
+        split_dir = self.split_dir(split)
+        if split == CALIBRATION_SPLIT or (split_dir is not None and split_dir == self.split_dir(CALIBRATION_SPLIT)):
+            raise ValueError(
+                f"The accuracy gate cannot use the '{split}' split: INT8 calibration images are drawn from it"
+            )
+        if not self.split_images(split):
+            raise ValueError(
+                f"No held-out images for the accuracy gate in the '{split}' split ({split_dir}); "
+                f"add a {split} split to {self.dataset_config}"
+            )
+
+    def run(self, output_path=None, max_map50_drop=0.01, sample_size=200, split='test'):
+        """
+        Quantize the model and keep the INT8 artifact only if accuracy holds
+
+        Args:
+            output_path: Where to write the INT8 model (defaults next to the checkpoint)
+            max_map50_drop: Largest accepted mAP50 drop from FP32 to INT8
+            sample_size: Number of val images used for calibration
+            split: Dataset split used for the accuracy comparison; must be
+                held out from calibration, so not the val split
+
+        Returns:
+            Report dictionary; 'accepted' tells whether the artifact was written
+
+        Raises:
+            ValueError: If the split is not held out or has no images
+        """
+        self.check_gate_split(split)
+
+        if output_path is None:
+            output_path = self.model_path.with_name(f'{self.model_path.stem}_int8.onnx')
+        output_path = Path(output_path)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            print("\n1. Exporting FP32 model to ONNX...")
+            fp32_path = self.export_fp32(work_dir)
+
+            print("\n2. Calibrating and quantizing to INT8...")
+            calibration = self.calibration_images(sample_size)
+            print(f"Calibration images: {len(calibration)}")
+            int8_path = self.quantize(fp32_path, Path(work_dir) / output_path.name, calibration)
+
+            print("\n3. Evaluating FP32 model...")
+            fp32_report, _ = ModelEvaluator(str(self.model_path), self.dataset_config).evaluate(split=split)
+
+            print("\n4. Evaluating INT8 model...")
+            int8_report, _ = ModelEvaluator(str(int8_path), self.dataset_config).evaluate(split=split)
+
+            map50_drop = fp32_report['mAP50'] - int8_report['mAP50']
+            accepted = map50_drop <= max_map50_drop
+
+            report = {
+                'model': str(self.model_path),
+                'split': split,
+                'calibration_images': len(calibration),
+                'max_map50_drop': max_map50_drop,
+                'map50_drop': map50_drop,
+                'accepted': accepted,
+                'fp32': fp32_report,
+                'int8': int8_report
+            }
+
+            print("\n" + "="*50)
+            print("QUANTIZATION RESULTS")
+            print("="*50)
+            print(f"FP32 mAP@0.5: {fp32_report['mAP50']:.4f}")
+            print(f"INT8 mAP@0.5: {int8_report['mAP50']:.4f}")
+            print(f"mAP@0.5 drop: {map50_drop:.4f} (max {max_map50_drop:.4f})")
+
+            if accepted:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(int8_path), str(output_path))
+                report['output_path'] = str(output_path)
+                print(f"INT8 model saved to {output_path}")
+            else:
+                print("INT8 model rejected: accuracy drop exceeds the allowed delta")
+            print("="*50)
+
+        report_path = output_path.with_suffix('.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {report_path}")
+
+        return report
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Quantize YOLO model to INT8 with an accuracy gate')
+    parser.add_argument('--model', type=str, required=True,
+                       help='Path to FP32 checkpoint (.pt)')
+    parser.add_argument('--dataset', type=str, default='dataset/dataset.yaml',
+                       help='Path to dataset config')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Path for the INT8 ONNX model')
+    parser.add_argument('--max-map50-drop', type=float,
+                       default=float(os.getenv('INT8_MAX_MAP50_DROP', 0.01)),
+                       help='Maximum allowed mAP50 drop from FP32 to INT8')
+    parser.add_argument('--calibration-images', type=int, default=200,
+                       help='Number of val images used for calibration')
+    parser.add_argument('--split', type=str, default='test',
+                       choices=['test', 'train'],
+                       help='Held-out dataset split used for the accuracy comparison')
+    parser.add_argument('--imgsz', type=int, default=640,
+                       help='Image size')
+
+    args = parser.parse_args()
+
+    quantizer = ModelQuantizer(args.model, args.dataset, imgsz=args.imgsz)
+    try:
+        report = quantizer.run(
+            output_path=args.output,
+            max_map50_drop=args.max_map50_drop,
+            sample_size=args.calibration_images,
+            split=args.split
+        )
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(2)
+
+    sys.exit(0 if report['accepted'] else 1)
@@ -1,29 +1,54 @@
 import os
 import sys
+import time
 from pathlib import Path
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
 from data_preprocessing import DataPreprocessor
+from image_cache import ImageCache
 from train import YOLOTrainer
 from evaluate import ModelEvaluator
 import json
 
 load_dotenv()
 
+# Updates sent per bulk_write when marking trained images
+MARK_BATCH_SIZE = 1000
+
 class RetrainingPipeline:
-    def __init__(self):
+    def __init__(self, client=None, db=None):
+        """
+        Args:
+            client: Optional MongoClient shared by every step (one pooled
+                client for MONGO_URI is created otherwise)
+            db: Optional database, e.g. a mongomock one (defaults to
+                MONGO_DB on the client)
+        """
         self.min_new_images = int(os.getenv('MIN_NEW_IMAGES', 100))
         self.accuracy_threshold = float(os.getenv('ACCURACY_THRESHOLD', 0.8))
         self.model_output_dir = Path('models')
         self.model_output_dir.mkdir(exist_ok=True)
+        
+        if db is None:
+            # The client connects lazily and pools connections for all steps
+            self.client = client if client is not None else MongoClient(os.getenv('MONGO_URI'))
+            db = self.client[os.getenv('MONGO_DB', 'aloe-vera')]
+        else:
+            self.client = client
+        self.db = db
+    
+    def close(self):
+        """
+        Close the MongoDB client
+        """
+        if self.client is not None:
+            self.client.close()
     
     def check_retraining_conditions(self):
         """
         Check if retraining conditions are met
         """
-        client = MongoClient(os.getenv('MONGO_URI'))
-        db = client[os.getenv('MONGO_DB', 'aloe-vera')]
-        training_collection = db.trainingdatasets
+        training_collection = self.db.trainingdatasets
         
         # Count new validated images
         new_images_count = training_collection.count_documents({
@@ -69,14 +94,20 @@ class RetrainingPipeline:
         
         # Step 2: Prepare dataset
         print("\n2. Preparing dataset...")
-        preprocessor = DataPreprocessor(output_dir='dataset')
-        dataset = preprocessor.fetch_from_mongodb()
+        batch_id = time.strftime('batch_%Y%m%dT%H%M%SZ', time.gmtime())
         
-        if len(dataset) == 0:
+        # The full validated set is trained on; images cached by earlier runs
+        # are neither downloaded nor re-processed again
+        preprocessor = DataPreprocessor(output_dir='dataset', cache=ImageCache(), db=self.db)
+        dataset = preprocessor.fetch_from_mongodb(include_trained=True)
+        organized_data = preprocessor.download_images(dataset)
+        
+        if not organized_data:
             print("No validated data found. Exiting.")
             return False
         
-        organized_data = preprocessor.download_images(dataset)
+        # Only documents whose images made it into the dataset are marked later
+        trained_ids = [record['document_id'] for records in organized_data.values() for record in records]
         preprocessor.prepare_yolo_dataset(organized_data, augment=True)
         dataset_config = preprocessor.create_dataset_config()
         
@@ -120,7 +151,7 @@ class RetrainingPipeline:
         
         # Step 6: Mark images as added to training
         print("\n6. Updating database...")
-        self.mark_images_as_trained()
+        self.mark_images_as_trained(trained_ids, batch_id)
         
         print("\n" + "="*50)
         print("RETRAINING COMPLETE")
@@ -131,41 +162,102 @@ class RetrainingPipeline:
     def deploy_model(self, new_model_path, target_path):
         """
         Deploy new model
-        """
-        import shutil
         
+        Each copy is written to a temporary file next to the target and then
+        renamed over it, so a serving process watching the target never
+        reads a partially written model.
+        """
         # Copy new model to target location
-        shutil.copy(new_model_path, target_path)
+        self._atomic_copy(new_model_path, target_path)
         print(f"Model deployed to {target_path}")
         
-        # Also copy to ML service models directory
-        ml_service_model_path = Path('../ml-service/models/yolov8_aloe_vera.pt')
+        # Also copy to the file the ML service loads, where its watcher
+        # picks it up
+        ml_service_model_path = self._ml_service_model_path()
+        if ml_service_model_path.suffix != Path(new_model_path).suffix:
+            print(
+                f"ML service loads {ml_service_model_path}, not a {Path(new_model_path).suffix} checkpoint; "
+                f"export the new model to that format to deploy it there"
+            )
+            return
         ml_service_model_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy(new_model_path, ml_service_model_path)
+        self._atomic_copy(new_model_path, ml_service_model_path)
         print(f"Model also copied to ML service: {ml_service_model_path}")
     
-    def mark_images_as_trained(self):
-        """
-        Mark validated images as added to training
-        """
-        client = MongoClient(os.getenv('MONGO_URI'))
-        db = client[os.getenv('MONGO_DB', 'aloe-vera')]
-        training_collection = db.trainingdatasets
-        
-        result = training_collection.update_many(
-            {
-                'validation_status': 'validated',
-                'added_to_training': False
-            },
-            {
-                '$set': {
-                    'added_to_training': True,
-                    'training_batch': f'batch_{Path().cwd().name}'
-                }
-            }
-        )
+    def _ml_service_model_path(self):
+        """
+        Model file the ML service is configured to load
         
-        print(f"Marked {result.modified_count} images as added to training")
+        YOLO_MODEL_PATH (default AV1.pt) as ml-service reads it, with relative
+        paths resolved against ML_SERVICE_DIR (default ../ml-service) the same
+        way YOLOInference resolves them against the service root.
+        """
+        model_path = Path(os.getenv('YOLO_MODEL_PATH', 'AV1.pt'))
+        if model_path.is_absolute():
+            return model_path
+        return Path(os.getenv('ML_SERVICE_DIR', '../ml-service')) / model_path
+    
+    def _atomic_copy(self, source_path, target_path):
+        """
+        Copy a file so that the target is replaced in a single rename
+        """
+        import shutil
+        
+        target_path = Path(target_path)
+        # Same directory as the target so os.replace stays on one filesystem
+        temp_path = target_path.with_name(f'.{target_path.name}.tmp-{os.getpid()}')
+        
+        try:
+            shutil.copyfile(source_path, temp_path)
+            with open(temp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(temp_path, target_path)
+        except Exception:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+    
+    def mark_images_as_trained(self, document_ids, batch_id):
+        """
+        Mark the images a training run used as added to training
+        
+        Only the given documents are updated, with ordered bulk writes of
+        MARK_BATCH_SIZE UpdateOne operations, so images validated after the
+        dataset was fetched stay unmarked for the next run. Documents marked
+        by an earlier run keep their training_batch.
+        
+        Args:
+            document_ids: _ids of the trainingdatasets documents trained on
+            batch_id: Training batch recorded in training_batch
+        
+        Returns:
+            Number of documents marked
+        """
+        training_collection = self.db.trainingdatasets
+        
+        modified = 0
+        for start in range(0, len(document_ids), MARK_BATCH_SIZE):
+            operations = [
+                UpdateOne(
+                    {
+                        '_id': document_id,
+                        'validation_status': 'validated',
+                        'added_to_training': False
+                    },
+                    {
+                        '$set': {
+                            'added_to_training': True,
+                            'training_batch': batch_id
+                        }
+                    }
+                )
+                for document_id in document_ids[start:start + MARK_BATCH_SIZE]
+            ]
+            result = training_collection.bulk_write(operations, ordered=True)
+            modified += result.modified_count
+        
+        print(f"Marked {modified} images as added to training in {batch_id}")
+        return modified
 
 if __name__ == '__main__':
     import argparse
@@ -183,11 +275,14 @@ if __name__ == '__main__':
     
     pipeline = RetrainingPipeline()
     
-    if args.force:
-        pipeline.retrain(model_size=args.model_size, epochs=args.epochs)
-    else:
-        if pipeline.check_retraining_conditions():
+    try:
+        if args.force:
             pipeline.retrain(model_size=args.model_size, epochs=args.epochs)
         else:
-            print("Retraining conditions not met. Use --force to override.")
+            if pipeline.check_retraining_conditions():
+                pipeline.retrain(model_size=args.model_size, epochs=args.epochs)
+            else:
+                print("Retraining conditions not met. Use --force to override.")
+    finally:
+        pipeline.close()
 
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The pipeline modules (downloader, data_preprocessing, ...) import from the ml-training root.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
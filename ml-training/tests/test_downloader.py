@@ -0,0 +1,85 @@
+import pytest
+import requests
+
+from benchmarks.fixture_server import FixtureServer
+from downloader import DownloadError, ImageDownloader
+
+
+class TruncatedResponse:
+    """
+    200 response whose connection drops after the first chunk
+    """
+    status_code = 200
+    headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_content(self, chunk_size):
+        yield b'x' * chunk_size
+        raise requests.exceptions.ChunkedEncodingError('Connection broken: IncompleteRead')
+
+
+def test_server_error_is_retried_until_it_succeeds(tmp_path):
+    # Every path answers 503 on its first request and 200 afterwards
+    with FixtureServer(count=1, failure_rate=1.0, image_size=64) as server:
+        downloader = ImageDownloader(max_workers=1, retries=2, backoff=0)
+        path = tmp_path / 'image.jpg'
+
+        size = downloader.fetch_to_file(server.url(0), path)
+
+        assert server.requests == 2
+        assert downloader.retried == 1
+        assert path.read_bytes() == server.image_bytes(0)
+        assert size == len(server.image_bytes(0))
+
+
+def test_client_error_is_not_retried(tmp_path):
+    with FixtureServer(count=1, image_size=64) as server:
+        downloader = ImageDownloader(max_workers=1, retries=3, backoff=0)
+        path = tmp_path / 'image.jpg'
+
+        with pytest.raises(DownloadError, match='HTTP 404'):
+            downloader.fetch_to_file(server.url(5), path)
+
+        assert server.requests == 1
+        assert downloader.retried == 0
+        assert not path.exists()
+
+
+def test_failed_transfer_leaves_no_partial_file(tmp_path, monkeypatch):
+    downloader = ImageDownloader(max_workers=1, retries=1, backoff=0)
+    attempts = []
+
+    def get(url, **kwargs):
+        attempts.append(url)
+        return TruncatedResponse()
+
+    monkeypatch.setattr(downloader.session, 'get', get)
+    path = tmp_path / 'image.jpg'
+
+    with pytest.raises(DownloadError, match='IncompleteRead'):
+        downloader.fetch_to_file('http://images.example/0.jpg', path)
+
+    assert len(attempts) == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_all_reports_failures_in_order(tmp_path):
+    with FixtureServer(count=4, failure_rate=0.5, image_size=64) as server:
+        items = server.dataset() + [{'_id': 'missing', 'image_url': server.url(99)}]
+        downloader = ImageDownloader(max_workers=4, retries=1, backoff=0)
+        transient = len(server.failing)
+
+        results, stats = downloader.download_all(items, path_for=lambda item: tmp_path / f"{item['_id']}.jpg")
+
+    assert [item['_id'] for item, _, _ in results] == [item['_id'] for item in items]
+    for n, (item, path, error) in enumerate(results[:4]):
+        assert error is None
+        assert path.read_bytes() == server.image_bytes(n)
+    assert results[4][1] is None and 'HTTP 404' in results[4][2]
+    assert stats['downloaded'] == 4 and stats['failed'] == 1
+    assert transient > 0 and stats['retries'] == transient
@@ -0,0 +1,141 @@
+import importlib
+import sys
+import types
+
+import pytest
+from pymongo import UpdateOne
+from pymongo.results import BulkWriteResult
+
+from data_preprocessing import TRAINING_PROJECTION, DataPreprocessor
+
+
+class FakeCursor:
+    """
+    Cursor over a document generator, recording the options set on it
+    """
+    def __init__(self, documents):
+        self.documents = documents
+        self.batch_sizes = []
+        self.limits = []
+
+    def batch_size(self, size):
+        self.batch_sizes.append(size)
+        return self
+
+    def limit(self, limit):
+        self.limits.append(limit)
+        return self
+
+    def __iter__(self):
+        return self.documents
+
+
+class FakeCollection:
+    """
+    trainingdatasets stand-in recording find and bulk_write calls
+    """
+    def __init__(self, documents=()):
+        self.documents = documents
+        self.finds = []
+        self.bulk_writes = []
+
+    def find(self, query, projection):
+        self.finds.append((query, projection))
+        self.cursor = FakeCursor(iter(self.documents))
+        return self.cursor
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append((operations, ordered))
+        return BulkWriteResult({'nModified': len(operations)}, acknowledged=True)
+
+
+class FakeDownloader:
+    """
+    Records the size of every download_all call and how many documents the
+    dataset had yielded when it was made
+    """
+    def __init__(self, pulled):
+        self.pulled = pulled
+        self.calls = []
+
+    def download_all(self, items, path_for=None, progress=None):
+        self.calls.append((len(items), self.pulled[0]))
+        results = []
+        for item in items:
+            path = path_for(item)
+            path.write_bytes(b'image')
+            results.append((item, path, None))
+            progress.update(1)
+        return results, {'images': len(items), 'downloaded': len(items), 'failed': 0, 'retries': 0, 'bytes': 0}
+
+
+@pytest.fixture
+def retrain(monkeypatch):
+    # train and evaluate import Ultralytics at module level; marking images needs neither
+    monkeypatch.setitem(sys.modules, 'train', types.SimpleNamespace(YOLOTrainer=None))
+    monkeypatch.setitem(sys.modules, 'evaluate', types.SimpleNamespace(ModelEvaluator=None))
+    monkeypatch.delitem(sys.modules, 'retrain', raising=False)
+    return importlib.import_module('retrain')
+
+
+def test_fetch_projects_fields_and_batches_cursor(tmp_path, monkeypatch):
+    monkeypatch.delenv('MONGO_BATCH_SIZE', raising=False)
+    collection = FakeCollection()
+    preprocessor = DataPreprocessor(output_dir=tmp_path, db=types.SimpleNamespace(trainingdatasets=collection))
+
+    cursor = preprocessor.fetch_from_mongodb(limit=50)
+
+    assert collection.finds == [
+        ({'validation_status': 'validated', 'added_to_training': False}, TRAINING_PROJECTION)
+    ]
+    assert cursor.batch_sizes == [500]
+    assert cursor.limits == [50]
+
+    cursor = preprocessor.fetch_from_mongodb(include_trained=True, batch_size=64)
+
+    assert collection.finds[-1] == ({'validation_status': 'validated'}, TRAINING_PROJECTION)
+    assert cursor.batch_sizes == [64]
+    assert cursor.limits == []
+
+
+def test_download_images_reads_cursor_in_chunks(tmp_path):
+    pulled = [0]
+
+    def documents():
+        for n in range(25):
+            pulled[0] += 1
+            yield {'_id': f'doc{n:03d}', 'label': 'healthy', 'image_url': f'http://images.example/{n}.jpg'}
+
+    collection = FakeCollection(documents())
+    preprocessor = DataPreprocessor(output_dir=tmp_path, db=types.SimpleNamespace(trainingdatasets=collection))
+    downloader = FakeDownloader(pulled)
+
+    organized_data = preprocessor.download_images(
+        preprocessor.fetch_from_mongodb(), downloader=downloader, chunk_size=10
+    )
+
+    # Each chunk is downloaded before the next one is read from the cursor
+    assert downloader.calls == [(10, 10), (10, 20), (5, 25)]
+    assert [record['document_id'] for record in organized_data['healthy']] == [f'doc{n:03d}' for n in range(25)]
+
+
+def test_mark_images_as_trained_sends_bulk_batches(tmp_path, monkeypatch, retrain):
+    monkeypatch.chdir(tmp_path)
+    collection = FakeCollection()
+    pipeline = retrain.RetrainingPipeline(db=types.SimpleNamespace(trainingdatasets=collection))
+    document_ids = [f'doc{n:04d}' for n in range(2500)]
+
+    modified = pipeline.mark_images_as_trained(document_ids, 'batch_test')
+
+    assert modified == 2500
+    assert [len(operations) for operations, _ in collection.bulk_writes] == [1000, 1000, 500]
+    assert all(ordered for _, ordered in collection.bulk_writes)
+
+    operations = [operation for batch, _ in collection.bulk_writes for operation in batch]
+    assert operations == [
+        UpdateOne(
+            {'_id': document_id, 'validation_status': 'validated', 'added_to_training': False},
+            {'$set': {'added_to_training': True, 'training_batch': 'batch_test'}}
+        )
+        for document_id in document_ids
+    ]
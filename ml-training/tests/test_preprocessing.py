@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+from data_preprocessing import DataPreprocessor
+
+
+def source_records(directory, count):
+    records = []
+    for n in range(count):
+        path = directory / f'source{n}.jpg'
+        image = np.full((64, 64, 3), 40 + n * 10, dtype=np.uint8)
+        cv2.imwrite(str(path), image)
+        records.append({
+            'source_id': f'doc{n}',
+            'document_id': f'doc{n}',
+            'label': 'healthy',
+            'path': path,
+            'sha256': None
+        })
+    return {'healthy': records}
+
+
+def test_prepare_clears_leftovers_of_any_kind(tmp_path):
+    preprocessor = DataPreprocessor(output_dir=tmp_path / 'dataset', workers=1)
+    images_dir = tmp_path / 'dataset' / 'train' / 'images'
+
+    # Left by an earlier run or by hand: a stale image, a nested cache directory and a symlink
+    (images_dir / 'stale_0.jpg').write_bytes(b'old')
+    (images_dir / '.cache' / 'nested').mkdir(parents=True)
+    (images_dir / '.cache' / 'nested' / 'entry').write_bytes(b'old')
+    (images_dir / 'link.jpg').symlink_to(tmp_path / 'missing.jpg')
+
+    sources = tmp_path / 'sources'
+    sources.mkdir()
+    preprocessor.prepare_yolo_dataset(source_records(sources, 10), augment=False, seed=0)
+
+    written = {
+        split: sorted(path.name for path in (tmp_path / 'dataset' / split / 'images').iterdir())
+        for split in ('train', 'val', 'test')
+    }
+    assert sum(len(names) for names in written.values()) == 10
+    assert all(name.endswith('_0.jpg') and not name.startswith('stale') for name in written['train'])
+    assert not (images_dir / '.cache').exists()
+    assert not (images_dir / 'link.jpg').is_symlink()
+    # Source images outside the dataset are untouched
+    assert len(list(sources.iterdir())) == 10